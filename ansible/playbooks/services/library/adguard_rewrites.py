@@ -0,0 +1,282 @@
+#!/usr/bin/python3
+"""
+AdGuard Home DNS rewrite reconciliation module.
+Fetches the rewrite list once, diffs it against the desired state and
+applies all changes over a single keep-alive connection.
+"""
+import base64
+import http.client
+import json
+import ssl
+from urllib.parse import urlsplit
+
+from ansible.module_utils.basic import AnsibleModule
+
+DOCUMENTATION = r'''
+---
+module: adguard_rewrites
+short_description: Reconcile AdGuard Home DNS rewrites in one pass
+description:
+  - Reads C(/control/rewrite/list) once and compares it with the requested
+    rewrites using set lookups, so cost grows linearly with the number of
+    rewrites.
+  - Adds and deletes are sent over one persistent HTTPS connection.
+  - Supports check mode; the returned diff shows what would change.
+options:
+  url:
+    description: Base URL of the AdGuard Home web interface.
+    required: true
+    type: str
+  username:
+    description: AdGuard admin username.
+    default: admin
+    type: str
+  password:
+    description: AdGuard admin password.
+    required: true
+    type: str
+  validate_certs:
+    description: Verify the TLS certificate of the AdGuard web interface.
+    default: false
+    type: bool
+  present:
+    description:
+      - Rewrites that must exist. Each item needs C(domain) and C(answer);
+        other keys (comment, reason) are ignored.
+    default: []
+    type: list
+    elements: dict
+  absent:
+    description:
+      - Rewrites that must not exist. When C(answer) is omitted every
+        rewrite for that domain is removed.
+    default: []
+    type: list
+    elements: dict
+  exclusive:
+    description:
+      - Make each I(present) entry the only answer for its domain by also
+        deleting other answers for that domain. Without it, a rewrite with
+        a stale answer is kept next to the requested one.
+    default: false
+    type: bool
+  timeout:
+    description: Socket timeout in seconds for each request.
+    default: 10
+    type: int
+'''
+
+EXAMPLES = r'''
+- name: Fix proxmox.lan to route through Caddy
+  adguard_rewrites:
+    url: "https://10.10.20.10:3443"
+    password: "{{ SERVICES_PASSWORD }}"
+    absent:
+      - { domain: "proxmox.lan", answer: "10.10.20.20" }
+      - { domain: "application.lan" }
+    present:
+      - { domain: "proxmox.lan", answer: "10.10.20.10" }
+'''
+
+RETURN = r'''
+added:
+  description: Rewrites that were (or in check mode would be) added.
+  returned: always
+  type: list
+removed:
+  description: Rewrites that were (or in check mode would be) deleted.
+  returned: always
+  type: list
+rewrites:
+  description: Rewrite list after reconciliation.
+  returned: always
+  type: list
+'''
+
+
+# The connection dropped or timed out; the request may or may not have been applied
+CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError, TimeoutError)
+
+
+class AdGuardClient:
+    """Minimal AdGuard Home API client on a single HTTP/1.1 connection."""
+
+    def __init__(self, url, username, password, validate_certs=False, timeout=10):
+        parts = urlsplit(url)
+        self.base_path = parts.path.rstrip('/')
+        if parts.scheme == 'https':
+            context = ssl.create_default_context()
+            if not validate_certs:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            self.conn = http.client.HTTPSConnection(parts.hostname, parts.port or 443,
+                                                    timeout=timeout, context=context)
+        else:
+            self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80,
+                                                   timeout=timeout)
+        credentials = base64.b64encode(f"{username}:{password}".encode()).decode()
+        self.headers = {
+            "Authorization": f"Basic {credentials}",
+            "Content-Type": "application/json",
+            "Connection": "keep-alive",
+        }
+
+    def request(self, method, path, body=None):
+        """Send a request and return (status, decoded body), reusing the socket.
+
+        Reads are retried once on a fresh connection; writes are not, since
+        the server may have applied them before the connection dropped.
+        """
+        payload = json.dumps(body) if body is not None else None
+        attempts = 2 if method == 'GET' else 1
+        for attempt in range(attempts):
+            try:
+                self.conn.request(method, self.base_path + path, body=payload, headers=self.headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except CONNECTION_ERRORS:
+                # Server closed an idle keep-alive socket; reconnect on the next request
+                self.conn.close()
+                if attempt == attempts - 1:
+                    raise
+        text = data.decode('utf-8', errors='replace')
+        try:
+            return response.status, json.loads(text) if text else None
+        except ValueError:
+            return response.status, text
+
+    def list_rewrites(self):
+        status, data = self.request('GET', '/control/rewrite/list')
+        if status != 200:
+            raise RuntimeError(f"rewrite/list returned HTTP {status}: {data}")
+        return data or []
+
+    def write(self, action, domain, answer):
+        """POST rewrite/add or rewrite/delete; after a dropped connection the
+        list is read again and the request is only repeated if it was not applied."""
+        body = {'domain': domain, 'answer': answer}
+        try:
+            status, data = self.request('POST', f'/control/rewrite/{action}', body)
+        except CONNECTION_ERRORS:
+            exists = any((r.get('domain'), r.get('answer')) == (domain, answer) for r in self.list_rewrites())
+            if exists == (action == 'add'):
+                return
+            status, data = self.request('POST', f'/control/rewrite/{action}', body)
+        if status != 200:
+            raise RuntimeError(f"rewrite/{action} {domain} → {answer} returned HTTP {status}: {data}")
+
+    def add(self, domain, answer):
+        self.write('add', domain, answer)
+
+    def delete(self, domain, answer):
+        self.write('delete', domain, answer)
+
+    def close(self):
+        self.conn.close()
+
+
+def compute_changes(existing, present, absent, exclusive=False):
+    """Return (to_remove, to_add) as lists of (domain, answer) tuples.
+
+    With exclusive, every domain in present is also listed as absent, so
+    answers other than the requested ones are removed. Uses set and dict
+    lookups only, so the work is O(existing + present + absent).
+    """
+    if exclusive:
+        absent = list(absent) + [{'domain': item['domain']} for item in present]
+    existing_pairs = set()
+    answers_by_domain = {}
+    for rewrite in existing:
+        pair = (rewrite.get('domain'), rewrite.get('answer'))
+        if pair not in existing_pairs:
+            existing_pairs.add(pair)
+            answers_by_domain.setdefault(pair[0], []).append(pair[1])
+
+    wanted = {(item['domain'], item['answer']) for item in present}
+
+    to_remove = []
+    seen = set()
+    for item in absent:
+        domain = item['domain']
+        if item.get('answer') is None:
+            candidates = [(domain, answer) for answer in answers_by_domain.get(domain, [])]
+        else:
+            candidates = [(domain, item['answer'])]
+        for pair in candidates:
+            # Never delete a rewrite that is also requested as present
+            if pair in existing_pairs and pair not in wanted and pair not in seen:
+                seen.add(pair)
+                to_remove.append(pair)
+
+    to_add = []
+    for item in present:
+        pair = (item['domain'], item['answer'])
+        if pair not in existing_pairs and pair not in seen:
+            seen.add(pair)
+            to_add.append(pair)
+
+    return to_remove, to_add
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            url=dict(type='str', required=True),
+            username=dict(type='str', default='admin'),
+            password=dict(type='str', required=True, no_log=True),
+            validate_certs=dict(type='bool', default=False),
+            present=dict(type='list', elements='dict', default=[]),
+            absent=dict(type='list', elements='dict', default=[]),
+            exclusive=dict(type='bool', default=False),
+            timeout=dict(type='int', default=10),
+        ),
+        supports_check_mode=True,
+    )
+    params = module.params
+
+    for item in params['present']:
+        if not item.get('domain') or not item.get('answer'):
+            module.fail_json(msg=f"present entries need domain and answer: {item}")
+    for item in params['absent']:
+        if not item.get('domain'):
+            module.fail_json(msg=f"absent entries need a domain: {item}")
+
+    client = AdGuardClient(params['url'], params['username'], params['password'],
+                           params['validate_certs'], params['timeout'])
+    try:
+        existing = client.list_rewrites()
+        to_remove, to_add = compute_changes(existing, params['present'], params['absent'], params['exclusive'])
+
+        if not module.check_mode:
+            for domain, answer in to_remove:
+                client.delete(domain, answer)
+            for domain, answer in to_add:
+                client.add(domain, answer)
+
+        # Derive the final list locally instead of re-fetching it
+        removed = set(to_remove)
+        final = [r for r in existing if (r.get('domain'), r.get('answer')) not in removed]
+        final.extend({'domain': d, 'answer': a} for d, a in to_add)
+    except (OSError, RuntimeError, http.client.HTTPException) as e:
+        module.fail_json(msg=f"AdGuard API error: {e}")
+    finally:
+        client.close()
+
+    def as_dicts(pairs):
+        return [{'domain': d, 'answer': a} for d, a in pairs]
+
+    module.exit_json(
+        changed=bool(to_remove or to_add),
+        added=as_dicts(to_add),
+        removed=as_dicts(to_remove),
+        rewrites=final,
+        diff={
+            'before': '\n'.join(f"{d} → {a}" for d, a in sorted(removed)) + '\n',
+            'after': '\n'.join(f"{d} → {a}" for d, a in sorted(to_add)) + '\n',
+        },
+    )
+
+
+if __name__ == '__main__':
+    main()
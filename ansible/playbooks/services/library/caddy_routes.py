@@ -0,0 +1,361 @@
+#!/usr/bin/python3
+"""
+Caddy site route manager using the admin API.
+Adds, updates and removes individual reverse proxy sites in the running
+Caddy with one config patch per run, and keeps a Caddyfile snippet per
+site on disk so the routes survive a restart.
+"""
+import ctypes
+import http.client
+import json
+import os
+from urllib.parse import urlsplit
+
+from ansible.module_utils.basic import AnsibleModule
+
+DOCUMENTATION = r'''
+---
+module: caddy_routes
+short_description: Register reverse proxy sites with Caddy without reloading it
+description:
+  - Each site is written as a Caddyfile snippet to I(snippets_dir), which
+    the main Caddyfile imports, so it is part of the config Caddy loads on
+    start.
+  - The running Caddy is updated through its admin API instead of a full
+    reload. Changed snippets are adapted to JSON by Caddy itself in one
+    C(/adapt) call, and all added, updated and removed routes and their TLS
+    policies are applied with a single C(PATCH /config/apps) guarded by
+    the config ETag. Caddy swaps that config in gracefully and keeps its
+    certificate cache, so other sites and their certificates are untouched.
+  - A site whose snippet is unchanged and whose route is live causes no API
+    write at all.
+  - Caddy runs in a container with the admin API on C(localhost:2019) of
+    the container network, which is not published. The module enters the
+    network namespace of I(container) to reach it, so it must run as root.
+  - Supports check mode.
+options:
+  present:
+    description:
+      - Sites to add or update. Each needs C(host) and C(upstream) (for
+        example C(https://10.10.20.30:9443)). C(insecure_skip_verify)
+        (default true) skips upstream certificate checks for HTTPS
+        upstreams; C(frame_deny) (default true) sends X-Frame-Options DENY.
+    default: []
+    type: list
+    elements: dict
+  absent:
+    description: Hosts whose site must be removed.
+    default: []
+    type: list
+    elements: str
+  snippets_dir:
+    description: Host directory of the site snippets, mounted as /config/sites in the container.
+    default: /opt/caddy/config/sites
+    type: path
+  admin_url:
+    description: Caddy admin API address as seen from the Caddy container.
+    default: http://localhost:2019
+    type: str
+  container:
+    description:
+      - Container whose network namespace holds the admin API. Empty to
+        connect from the host network directly.
+    default: caddy
+    type: str
+  timeout:
+    description: Socket timeout in seconds for each API request.
+    default: 10
+    type: int
+'''
+
+EXAMPLES = r'''
+- name: Route application.lan to the Applications VM
+  caddy_routes:
+    present:
+      - host: "application.lan"
+        upstream: "https://10.10.20.30:9443"
+
+- name: Remove a site
+  caddy_routes:
+    absent:
+      - "application.lan"
+'''
+
+RETURN = r'''
+added:
+  description: Hosts whose site was added.
+  returned: always
+  type: list
+updated:
+  description: Hosts whose site changed.
+  returned: always
+  type: list
+removed:
+  description: Hosts whose site was removed.
+  returned: always
+  type: list
+unchanged:
+  description: Hosts that were already up to date.
+  returned: always
+  type: list
+'''
+
+CLONE_NEWNET = 0x40000000
+
+
+class CaddyAdmin:
+    """Caddy admin API client on a single HTTP/1.1 connection."""
+
+    def __init__(self, url, timeout=10):
+        parts = urlsplit(url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 2019, timeout=timeout)
+
+    def request(self, method, path, body=None, headers=None):
+        """Return (status, response headers, decoded body)."""
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+            headers = {'Content-Type': 'application/json', **(headers or {})}
+        self.conn.request(method, path, body=body, headers=headers or {})
+        response = self.conn.getresponse()
+        text = response.read().decode('utf-8', errors='replace')
+        try:
+            data = json.loads(text) if text else None
+        except ValueError:
+            data = text
+        return response.status, response.headers, data
+
+    def get_apps(self):
+        status, headers, data = self.request('GET', '/config/apps')
+        if status != 200:
+            raise RuntimeError(f"GET /config/apps returned HTTP {status}: {data}")
+        return data or {}, headers.get('Etag')
+
+    def patch_apps(self, apps, etag):
+        """Replace the apps config in one change; False when it changed since it was read."""
+        status, _, data = self.request('PATCH', '/config/apps', apps, {'If-Match': etag} if etag else None)
+        if status == 412:
+            return False
+        if status != 200:
+            raise RuntimeError(f"PATCH /config/apps returned HTTP {status}: {data}")
+        return True
+
+    def adapt(self, caddyfile):
+        status, _, data = self.request('POST', '/adapt', caddyfile, {'Content-Type': 'text/caddyfile'})
+        if status != 200:
+            raise RuntimeError(f"Caddy rejected the site snippets: {data}")
+        # Newer versions wrap the config together with adapter warnings
+        return data.get('result', data) if isinstance(data, dict) else {}
+
+    def close(self):
+        self.conn.close()
+
+
+def enter_network_namespace(module, container):
+    """Join the network namespace of the container so its localhost is ours."""
+    rc, out, err = module.run_command(['podman', 'inspect', '--format', '{{.State.Pid}}', container])
+    if rc != 0 or not out.strip().isdigit() or out.strip() == '0':
+        module.fail_json(msg=f"Container {container} is not running: {err.strip() or out.strip()}")
+    fd = os.open(f"/proc/{out.strip()}/ns/net", os.O_RDONLY)
+    try:
+        if hasattr(os, 'setns'):
+            os.setns(fd, CLONE_NEWNET)
+        elif ctypes.CDLL(None, use_errno=True).setns(fd, CLONE_NEWNET) != 0:
+            # Python < 3.12 has no os.setns
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    finally:
+        os.close(fd)
+
+
+# ============================================
+# Sites and routes
+# ============================================
+
+def render_snippet(site):
+    """Caddyfile block for one site, in the style of the main Caddyfile."""
+    upstream = site['upstream']
+    lines = [f"# Registered by caddy_routes - {site['host']}",
+             f"{site['host']} {{",
+             "    tls internal",
+             "",
+             f"    reverse_proxy {upstream} {{",
+             "        header_up Host {upstream_hostport}",
+             "        header_up X-Real-IP {remote_host}",
+             "        header_up X-Forwarded-For {remote_host}",
+             "        header_up X-Forwarded-Proto {scheme}"]
+    if upstream.startswith('https://') and site.get('insecure_skip_verify', True):
+        lines += ["", "        transport http {", "            tls_insecure_skip_verify", "        }"]
+    lines += ["    }", "", "    header {", "        -Server", "        X-Content-Type-Options nosniff"]
+    if site.get('frame_deny', True):
+        lines.append("        X-Frame-Options DENY")
+    lines += ["    }", "}"]
+    return '\n'.join(lines) + '\n'
+
+
+def route_id(host):
+    return f"privatebox-site-{host}"
+
+
+def policy_id(host):
+    return f"privatebox-tls-{host}"
+
+
+def route_hosts(route):
+    return [host for matcher in route.get('match') or [] for host in matcher.get('host') or []]
+
+
+def serves(route, host):
+    """True for the route of this site: tagged by us, or loaded from its snippet on start."""
+    return route.get('@id') == route_id(host) or route_hosts(route) == [host]
+
+
+def https_server(apps):
+    """The HTTP server that holds the site routes (the one on :443)."""
+    servers = apps.get('http', {}).get('servers', {})
+    for server in servers.values():
+        if any(address.endswith(':443') for address in server.get('listen', [])):
+            return server
+    raise RuntimeError("Caddy has no server listening on :443")
+
+
+def site_config(adapted, host):
+    """Route and TLS policy for host from an adapted snippet."""
+    route = policy = None
+    for server in adapted.get('apps', {}).get('http', {}).get('servers', {}).values():
+        for candidate in server.get('routes', []):
+            if host in route_hosts(candidate):
+                route = dict(candidate, **{'@id': route_id(host)})
+    for candidate in adapted.get('apps', {}).get('tls', {}).get('automation', {}).get('policies', []):
+        if host in candidate.get('subjects', []):
+            policy = dict(candidate, subjects=[host], **{'@id': policy_id(host)})
+    if route is None:
+        raise RuntimeError(f"Adapted snippet has no route for {host}")
+    return route, policy
+
+
+def remove_site(apps, host):
+    server = https_server(apps)
+    server['routes'] = [r for r in server.get('routes', []) if not serves(r, host)]
+    automation = apps.get('tls', {}).get('automation', {})
+    policies = []
+    for policy in automation.get('policies', []):
+        if policy.get('@id') == policy_id(host):
+            continue
+        if host in policy.get('subjects', []):
+            policy['subjects'] = [s for s in policy['subjects'] if s != host]
+            # A policy without subjects would turn into a catch-all
+            if not policy['subjects']:
+                continue
+        policies.append(policy)
+    if 'policies' in automation:
+        automation['policies'] = policies
+
+
+def put_site(apps, host, route, policy):
+    """Replace the site's route in place, or add it ahead of wildcard and catch-all routes."""
+    server = https_server(apps)
+    routes = server.setdefault('routes', [])
+    position = next((i for i, r in enumerate(routes) if serves(r, host)), None)
+    remove_site(apps, host)
+    routes = server['routes']
+    if position is None:
+        position = next((i for i, r in enumerate(routes)
+                         if not route_hosts(r) or any('*' in h for h in route_hosts(r))), len(routes))
+    routes.insert(min(position, len(routes)), route)
+    if policy:
+        policies = apps.setdefault('tls', {}).setdefault('automation', {}).setdefault('policies', [])
+        # Subject policies before the catch-all, so this one wins for its host
+        policies.insert(0, policy)
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            present=dict(type='list', elements='dict', default=[]),
+            absent=dict(type='list', elements='str', default=[]),
+            snippets_dir=dict(type='path', default='/opt/caddy/config/sites'),
+            admin_url=dict(type='str', default='http://localhost:2019'),
+            container=dict(type='str', default='caddy'),
+            timeout=dict(type='int', default=10),
+        ),
+        supports_check_mode=True,
+    )
+    params = module.params
+
+    for site in params['present']:
+        if not site.get('host') or not site.get('upstream'):
+            module.fail_json(msg=f"present entries need host and upstream: {site}")
+        if site['host'] in params['absent']:
+            module.fail_json(msg=f"{site['host']} is both present and absent")
+
+    if params['container']:
+        try:
+            enter_network_namespace(module, params['container'])
+        except OSError as e:
+            module.fail_json(msg=f"Cannot enter the network namespace of {params['container']}: {e}")
+
+    snippets = {site['host']: render_snippet(site) for site in params['present']}
+    client = CaddyAdmin(params['admin_url'], params['timeout'])
+    result = dict(added=[], updated=[], removed=[], unchanged=[])
+    try:
+        for attempt in range(3):
+            apps, etag = client.get_apps()
+            live = https_server(apps).get('routes', [])
+
+            changed_sites = []
+            for host, snippet in snippets.items():
+                path = os.path.join(params['snippets_dir'], f"{host}.caddy")
+                try:
+                    with open(path) as f:
+                        on_disk = f.read()
+                except FileNotFoundError:
+                    on_disk = None
+                is_live = any(serves(route, host) for route in live)
+                if on_disk == snippet and is_live:
+                    result['unchanged'].append(host)
+                else:
+                    changed_sites.append(host)
+                    result['updated' if is_live else 'added'].append(host)
+            removed = [host for host in params['absent']
+                       if any(serves(route, host) for route in live)
+                       or os.path.exists(os.path.join(params['snippets_dir'], f"{host}.caddy"))]
+            result['removed'] = removed
+
+            if not changed_sites and not removed:
+                break
+            if changed_sites:
+                # All changed snippets are adapted together by the running Caddy
+                adapted = client.adapt(''.join(snippets[host] for host in changed_sites))
+                for host in changed_sites:
+                    put_site(apps, host, *site_config(adapted, host))
+            for host in removed:
+                remove_site(apps, host)
+            if module.check_mode or client.patch_apps(apps, etag):
+                break
+            # Config changed between read and write; start over from the new one
+            result = dict(added=[], updated=[], removed=[], unchanged=[])
+        else:
+            module.fail_json(msg="Caddy config kept changing during the update", **result)
+    except (OSError, RuntimeError, http.client.HTTPException) as e:
+        module.fail_json(msg=f"Caddy admin API error: {e}", **result)
+    finally:
+        client.close()
+
+    if not module.check_mode:
+        # Disk follows the live config, so a restart loads the same sites
+        os.makedirs(params['snippets_dir'], mode=0o755, exist_ok=True)
+        for host in result['added'] + result['updated']:
+            path = os.path.join(params['snippets_dir'], f"{host}.caddy")
+            with open(path + '.tmp', 'w') as f:
+                f.write(snippets[host])
+            os.chmod(path + '.tmp', 0o644)
+            os.replace(path + '.tmp', path)
+        for host in result['removed']:
+            path = os.path.join(params['snippets_dir'], f"{host}.caddy")
+            if os.path.exists(path):
+                os.unlink(path)
+
+    module.exit_json(changed=bool(result['added'] or result['updated'] or result['removed']), **result)
+
+
+if __name__ == '__main__':
+    main()
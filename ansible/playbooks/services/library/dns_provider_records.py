@@ -0,0 +1,381 @@
+#!/usr/bin/python3
+"""
+DNS provider record cleanup module.
+One client per supported DynDNS provider (deSEC, Dynu, Cloudflare, DuckDNS)
+that lists and deletes records over a pooled keep-alive connection, using
+the provider's bulk endpoint where one exists.
+"""
+import http.client
+import json
+import queue
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlencode
+
+from ansible.module_utils.basic import AnsibleModule
+
+DOCUMENTATION = r'''
+---
+module: dns_provider_records
+short_description: List and delete DNS records at the DynDNS providers
+description:
+  - Finds records with a given name and type (by default the
+    C(_acme-challenge) TXT records left behind by ACME DNS challenges)
+    and deletes them.
+  - Cloudflare deletes go in one C(dns_records/batch) request. deSEC
+    deletes the RRset with one C(DELETE) (one bulk C(PATCH) when several
+    RRsets match). Dynu has no bulk endpoint, so its deletes run
+    concurrently within the provider's rate limit. DuckDNS holds a single
+    TXT value, which is cleared with one update call.
+  - All requests to a provider share a small pool of keep-alive HTTPS
+    connections; HTTP 429 responses are retried after C(Retry-After).
+  - DuckDNS cannot list its TXT value, so the record is always reported
+    as found; C(changed) follows the provider's UPDATED/NOCHANGE answer.
+  - Supports check mode (records are listed, nothing is deleted). For
+    DuckDNS check mode cannot tell whether a value is set and reports a
+    change.
+options:
+  provider:
+    description: DNS provider of the domain.
+    required: true
+    type: str
+    choices: [desec, dynu, cloudflare, duckdns]
+  domain:
+    description: The DynDNS domain, e.g. C(example.dedyn.io).
+    required: true
+    type: str
+  api_token:
+    description: Provider API token (Dynu API key, DuckDNS token).
+    required: true
+    type: str
+  zone_id:
+    description: Cloudflare zone ID; required for C(cloudflare).
+    type: str
+  record_name:
+    description: Record name relative to I(domain).
+    default: _acme-challenge
+    type: str
+  record_type:
+    description: Record type to match.
+    default: TXT
+    type: str
+  state:
+    description:
+      - C(absent) deletes the matching records, C(query) only lists them.
+    default: absent
+    choices: [absent, query]
+    type: str
+  timeout:
+    description: Socket timeout in seconds for each request.
+    default: 10
+    type: int
+'''
+
+EXAMPLES = r'''
+- name: Remove stale ACME challenge records
+  dns_provider_records:
+    provider: "{{ dns_provider }}"
+    domain: "{{ ddns_domain }}"
+    api_token: "{{ dns_api_token }}"
+    zone_id: "{{ cloudflare_zone_id }}"
+  register: acme_cleanup
+'''
+
+RETURN = r'''
+records:
+  description: Matching records found before deletion (provider-specific IDs and values).
+  returned: always
+  type: list
+deleted:
+  description: Number of records deleted (or that would be deleted in check mode). Records that
+    were already gone when the delete ran are not counted.
+  returned: always
+  type: int
+requests:
+  description: Number of API requests sent to the provider.
+  returned: always
+  type: int
+'''
+
+
+class ProviderError(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Keep-alive HTTPS connections to one provider host, with a request rate limit.
+
+    With writes_only the rate limit applies to write methods only and reads
+    are sent right away.
+    """
+
+    def __init__(self, host, size=1, min_interval=0.0, timeout=10, writes_only=False):
+        self.host = host
+        self.timeout = timeout
+        self.context = ssl.create_default_context()
+        self.connections = queue.LifoQueue()
+        for _ in range(size):
+            self.connections.put(None)
+        self.min_interval = min_interval
+        self.writes_only = writes_only
+        self.rate_lock = threading.Lock()
+        self.next_slot = 0.0
+        self.count_lock = threading.Lock()
+        self.requests = 0
+
+    def _wait_for_slot(self):
+        """Space request starts at least min_interval apart across all threads."""
+        with self.rate_lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def request(self, method, path, headers, body=None, retries=3):
+        """Send a request and return (status, decoded body)."""
+        payload = json.dumps(body) if body is not None else None
+        request_headers = dict(headers, Connection='keep-alive')
+        if payload is not None:
+            request_headers['Content-Type'] = 'application/json'
+        conn = self.connections.get()
+        try:
+            for attempt in range(retries + 1):
+                if conn is None:
+                    conn = http.client.HTTPSConnection(self.host, timeout=self.timeout, context=self.context)
+                if not (self.writes_only and method == 'GET'):
+                    self._wait_for_slot()
+                with self.count_lock:
+                    self.requests += 1
+                try:
+                    conn.request(method, path, body=payload, headers=request_headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                    # Provider closed an idle keep-alive socket; reconnect
+                    conn.close()
+                    conn = None
+                    if attempt == retries:
+                        raise
+                    continue
+                if response.status == 429 and attempt < retries:
+                    retry_after = response.getheader('Retry-After', '')
+                    time.sleep(min(float(retry_after), 30) if retry_after.isdigit() else 2 ** attempt)
+                    continue
+                break
+        finally:
+            self.connections.put(conn)
+
+        text = data.decode('utf-8', errors='replace')
+        try:
+            return response.status, json.loads(text) if text else None
+        except ValueError:
+            return response.status, text
+
+    def map(self, function, items, workers):
+        """Run function over items on up to workers threads; results keep item order."""
+        if len(items) <= 1 or workers <= 1:
+            return [function(item) for item in items]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(function, items))
+
+    def close(self):
+        while not self.connections.empty():
+            conn = self.connections.get_nowait()
+            if conn is not None:
+                conn.close()
+
+
+class DesecClient:
+    """deSEC: one RRset holds all values, so deleting the RRset removes every record."""
+
+    def __init__(self, domain, token, timeout):
+        self.domain = domain
+        # deSEC throttles write requests per domain to about one per second
+        self.pool = ConnectionPool('desec.io', size=1, min_interval=1.0, timeout=timeout, writes_only=True)
+        self.headers = {'Authorization': f'Token {token}'}
+        self.base = f'/api/v1/domains/{quote(domain)}/rrsets/'
+
+    def list(self, name, record_type):
+        status, data = self.pool.request(
+            'GET', self.base + '?' + urlencode({'subname': name, 'type': record_type}), self.headers)
+        if status != 200:
+            raise ProviderError(f"deSEC rrsets returned HTTP {status}: {data}")
+        return data or []
+
+    def delete(self, records):
+        if len(records) == 1:
+            # The usual case (name and type select one RRset): a single DELETE
+            record = records[0]
+            path = f"{self.base}{quote(record['subname'] or '@')}/{quote(record['type'])}/"
+            status, data = self.pool.request('DELETE', path, self.headers)
+            if status == 404:
+                return 0
+            if status not in (200, 204):
+                raise ProviderError(f"deSEC RRset DELETE returned HTTP {status}: {data}")
+            return 1
+        body = [{'subname': r['subname'], 'type': r['type'], 'records': []} for r in records]
+        status, data = self.pool.request('PATCH', self.base, self.headers, body)
+        if status not in (200, 204):
+            raise ProviderError(f"deSEC bulk RRset PATCH returned HTTP {status}: {data}")
+        return len(records)
+
+
+class DynuClient:
+    """Dynu: records are deleted one by one, so deletes run concurrently."""
+
+    WORKERS = 4
+
+    def __init__(self, domain, token, timeout):
+        self.domain = domain
+        self.pool = ConnectionPool('api.dynu.com', size=self.WORKERS, min_interval=0.1, timeout=timeout)
+        self.headers = {'accept': 'application/json', 'API-Key': token}
+        self.domain_id = None
+
+    def list(self, name, record_type):
+        status, data = self.pool.request('GET', '/v2/dns', self.headers)
+        if status != 200:
+            raise ProviderError(f"Dynu dns returned HTTP {status}: {data}")
+        self.domain_id = next((d['id'] for d in (data or {}).get('domains', []) if d.get('name') == self.domain), None)
+        if self.domain_id is None:
+            return []
+        status, data = self.pool.request('GET', f'/v2/dns/{self.domain_id}/record', self.headers)
+        if status != 200:
+            raise ProviderError(f"Dynu records returned HTTP {status}: {data}")
+        return [r for r in (data or {}).get('dnsRecords', [])
+                if r.get('nodeName') == name and r.get('recordType') == record_type]
+
+    def delete(self, records):
+        def delete_one(record):
+            status, data = self.pool.request('DELETE', f"/v2/dns/{self.domain_id}/record/{record['id']}", self.headers)
+            if status not in (200, 404):
+                raise ProviderError(f"Dynu delete of record {record['id']} returned HTTP {status}: {data}")
+            return status == 200
+
+        return sum(self.pool.map(delete_one, records, self.WORKERS))
+
+
+class CloudflareClient:
+    """Cloudflare: deletes go in one batch request, with concurrent DELETEs as fallback."""
+
+    WORKERS = 4
+
+    def __init__(self, domain, token, zone_id, timeout):
+        if not zone_id:
+            raise ProviderError("Cloudflare Zone ID is required but not found in configuration")
+        self.domain = domain
+        # Cloudflare allows 1200 requests per 5 minutes per user
+        self.pool = ConnectionPool('api.cloudflare.com', size=self.WORKERS, min_interval=0.25, timeout=timeout)
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.base = f'/client/v4/zones/{quote(zone_id)}/dns_records'
+
+    def list(self, name, record_type):
+        fqdn = f'{name}.{self.domain}' if name and name != '@' else self.domain
+        records, page = [], 1
+        while True:
+            query = urlencode({'type': record_type, 'name': fqdn, 'per_page': 100, 'page': page})
+            status, data = self.pool.request('GET', f'{self.base}?{query}', self.headers)
+            if status != 200 or not isinstance(data, dict):
+                raise ProviderError(f"Cloudflare dns_records returned HTTP {status}: {data}")
+            records.extend(data.get('result') or [])
+            info = data.get('result_info') or {}
+            if page >= info.get('total_pages', 1):
+                return records
+            page += 1
+
+    def delete(self, records):
+        body = {'deletes': [{'id': r['id']} for r in records]}
+        status, data = self.pool.request('POST', f'{self.base}/batch', self.headers, body)
+        if status == 200:
+            return len(records)
+        if status not in (404, 405):
+            raise ProviderError(f"Cloudflare batch returned HTTP {status}: {data}")
+
+        def delete_one(record):
+            status, data = self.pool.request('DELETE', f"{self.base}/{record['id']}", self.headers)
+            if status not in (200, 404):
+                raise ProviderError(f"Cloudflare delete of {record['id']} returned HTTP {status}: {data}")
+            return status == 200
+
+        return sum(self.pool.map(delete_one, records, self.WORKERS))
+
+
+class DuckDnsClient:
+    """DuckDNS: one TXT value per domain and no read API; clearing is a single update."""
+
+    def __init__(self, domain, token, timeout):
+        self.subdomain = domain[:-len('.duckdns.org')] if domain.endswith('.duckdns.org') else domain
+        self.token = token
+        self.pool = ConnectionPool('www.duckdns.org', timeout=timeout)
+
+    def list(self, name, record_type):
+        if name != '_acme-challenge' or record_type != 'TXT':
+            raise ProviderError("DuckDNS only manages the _acme-challenge TXT record")
+        # The value cannot be read back; report the one slot that may hold a stale token
+        return [{'name': f'{name}.{self.subdomain}.duckdns.org', 'type': 'TXT'}]
+
+    def delete(self, records):
+        query = urlencode({'domains': self.subdomain, 'token': self.token, 'txt': '', 'clear': 'true',
+                           'verbose': 'true'})
+        status, data = self.pool.request('GET', f'/update?{query}', {})
+        lines = str(data).split()
+        if status != 200 or not lines or lines[0] != 'OK':
+            raise ProviderError(f"DuckDNS TXT clear failed: HTTP {status} {data}")
+        # verbose answers end with UPDATED or NOCHANGE; count anything else as a change
+        return 0 if lines[-1] == 'NOCHANGE' else 1
+
+
+def make_client(params):
+    provider, domain, token, timeout = params['provider'], params['domain'], params['api_token'], params['timeout']
+    if provider == 'desec':
+        return DesecClient(domain, token, timeout)
+    if provider == 'dynu':
+        return DynuClient(domain, token, timeout)
+    if provider == 'cloudflare':
+        return CloudflareClient(domain, token, params['zone_id'], timeout)
+    return DuckDnsClient(domain, token, timeout)
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            provider=dict(type='str', required=True, choices=['desec', 'dynu', 'cloudflare', 'duckdns']),
+            domain=dict(type='str', required=True),
+            api_token=dict(type='str', required=True, no_log=True),
+            zone_id=dict(type='str'),
+            record_name=dict(type='str', default='_acme-challenge'),
+            record_type=dict(type='str', default='TXT'),
+            state=dict(type='str', default='absent', choices=['absent', 'query']),
+            timeout=dict(type='int', default=10),
+        ),
+        supports_check_mode=True,
+    )
+    params = module.params
+
+    client = None
+    deleting = params['state'] == 'absent'
+    try:
+        client = make_client(params)
+        records = client.list(params['record_name'], params['record_type'])
+        deleted = len(records) if deleting else 0
+        if records and deleting and not module.check_mode:
+            deleted = client.delete(records)
+    except (OSError, ProviderError, http.client.HTTPException) as e:
+        module.fail_json(msg=f"{params['provider']} API error: {e}",
+                         requests=client.pool.requests if client else 0)
+    finally:
+        if client:
+            client.pool.close()
+
+    module.exit_json(
+        changed=deleted > 0,
+        records=records,
+        deleted=deleted,
+        requests=client.pool.requests,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+#!/usr/bin/python3
+"""
+Homer dashboard renderer driven by a service registry.
+Keeps the dashboard definition (page settings, groups, services) in a
+JSON registry next to config.yml, renders config.yml from it
+deterministically and only writes the file and restarts Homer when the
+rendered content actually changed.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+
+from ansible.module_utils.basic import AnsibleModule
+
+DOCUMENTATION = r'''
+---
+module: homer_dashboard
+short_description: Register services with the Homer dashboard and render config.yml
+description:
+  - Services are kept in C(registry.json) in I(config_dir), keyed by name,
+    so deploy, DynDNS and service registration playbooks all update the
+    same definition instead of re-templating or patching config.yml.
+  - config.yml is rendered from the registry with a fixed key order and
+    compared with the file on disk by SHA-256. It is only replaced (and
+    Homer only restarted) when the content differs, so re-running a flow
+    that changes nothing causes no restart.
+  - All services passed in one call are applied before rendering, so
+    several registrations cost at most one restart.
+  - Supports check mode and diff mode.
+options:
+  config_dir:
+    description: Homer assets directory holding config.yml and registry.json.
+    default: /opt/homer
+    type: path
+  settings:
+    description:
+      - Page settings rendered above the services (title, theme, colors,
+        links, ...). Replaces the stored settings when given.
+    type: dict
+  domain:
+    description:
+      - Domain substituted for C({domain}) in service URLs. Kept from the
+        registry when omitted; C(lan) for a new registry.
+    type: str
+  groups:
+    description:
+      - Service groups in display order, each with C(name) and optional
+        C(icon). Groups that only appear in I(services) follow in order of
+        first use.
+    default: []
+    type: list
+    elements: dict
+  services:
+    description:
+      - Services to add or update, matched by C(name). Each needs C(name),
+        C(group) and C(url); C(logo), C(icon), C(subtitle), C(tag),
+        C(type) and C(target) are optional.
+    default: []
+    type: list
+    elements: dict
+  absent:
+    description: Names of services to remove from the dashboard.
+    default: []
+    type: list
+    elements: str
+  backup:
+    description: Copy the previous config.yml to config.yml.bak before replacing it.
+    default: false
+    type: bool
+  restart:
+    description: Restart I(service) when config.yml changed and the service is running.
+    default: true
+    type: bool
+  service:
+    description: systemd unit of the Homer container.
+    default: homer.service
+    type: str
+'''
+
+EXAMPLES = r'''
+- name: Register the Applications VM on the dashboard
+  homer_dashboard:
+    services:
+      - name: "Applications"
+        group: "Management"
+        logo: "assets/tools/portainer.png"
+        subtitle: "User Applications"
+        url: "https://application.lan"
+        type: "Ping"
+
+- name: Switch every service URL to the DynDNS domain
+  homer_dashboard:
+    domain: "example.dedyn.io"
+    backup: true
+'''
+
+RETURN = r'''
+changed_services:
+  description: Names of services that were added, updated or removed.
+  returned: always
+  type: list
+checksum:
+  description: SHA-256 of the rendered config.yml.
+  returned: always
+  type: str
+restarted:
+  description: Whether Homer was restarted.
+  returned: always
+  type: bool
+backup_file:
+  description: Path of the backup of the previous config.yml.
+  returned: when backup is true and config.yml changed
+  type: str
+'''
+
+SERVICE_KEYS = ('name', 'logo', 'icon', 'subtitle', 'tag', 'url', 'type', 'target')
+BARE_KEY_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+# ============================================
+# Rendering
+# ============================================
+
+def scalar(value):
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return str(value)
+    # JSON strings are valid double-quoted YAML scalars
+    return json.dumps(str(value), ensure_ascii=False)
+
+
+def yaml_lines(value, indent=0):
+    """Block-style YAML for dicts, lists and scalars, keys in the given order."""
+    pad = ' ' * indent
+    lines = []
+    if isinstance(value, dict):
+        for key, item in value.items():
+            key = key if BARE_KEY_RE.match(str(key)) else scalar(key)
+            if isinstance(item, (dict, list)) and item:
+                lines.append(f"{pad}{key}:")
+                lines.extend(yaml_lines(item, indent + 2))
+            else:
+                lines.append(f"{pad}{key}: {'{}' if item == {} else '[]' if item == [] else scalar(item)}")
+    else:
+        for item in value:
+            if isinstance(item, (dict, list)) and item:
+                nested = yaml_lines(item, indent + 2)
+                lines.append(f"{pad}- {nested[0].lstrip()}")
+                lines.extend(nested[1:])
+            else:
+                lines.append(f"{pad}- {scalar(item)}")
+    return lines
+
+
+def ordered_groups(registry):
+    """Group names in display order: declared groups first, then by first use."""
+    names = [group['name'] for group in registry['groups']]
+    for service in registry['services']:
+        if service['group'] not in names:
+            names.append(service['group'])
+    return names
+
+
+def render(registry):
+    icons = {group['name']: group.get('icon') for group in registry['groups']}
+    services = []
+    for group in ordered_groups(registry):
+        items = []
+        for service in registry['services']:
+            if service['group'] != group:
+                continue
+            item = {key: service[key] for key in SERVICE_KEYS if service.get(key) is not None}
+            item['url'] = item['url'].replace('{domain}', registry['domain'])
+            item.setdefault('target', '_blank')
+            items.append(item)
+        if items:
+            entry = {'name': group}
+            if icons.get(group):
+                entry['icon'] = icons[group]
+            entry['items'] = items
+            services.append(entry)
+
+    lines = ['---', '# Homer Dashboard Configuration',
+             '# Rendered by homer_dashboard from registry.json - register services instead of editing', '']
+    lines.extend(yaml_lines(registry['settings']))
+    lines.append('')
+    lines.extend(yaml_lines({'services': services}))
+    return '\n'.join(lines) + '\n'
+
+
+# ============================================
+# Registry
+# ============================================
+
+def load_registry(path):
+    try:
+        with open(path) as f:
+            registry = json.load(f)
+    except FileNotFoundError:
+        registry = {}
+    registry.setdefault('settings', {})
+    registry.setdefault('domain', 'lan')
+    registry.setdefault('groups', [])
+    registry.setdefault('services', [])
+    return registry
+
+
+def apply_changes(registry, params):
+    """Update the registry in place; returns the names of services that changed."""
+    if params['settings'] is not None:
+        registry['settings'] = params['settings']
+    if params['domain']:
+        registry['domain'] = params['domain']
+
+    groups = {group['name']: group for group in registry['groups']}
+    for group in params['groups']:
+        if group['name'] in groups:
+            groups[group['name']].update(group)
+        else:
+            registry['groups'].append(dict(group))
+            groups[group['name']] = registry['groups'][-1]
+
+    changed = []
+    by_name = {service['name']: service for service in registry['services']}
+    for service in params['services']:
+        wanted = {key: service[key] for key in ('group',) + SERVICE_KEYS if service.get(key) is not None}
+        current = by_name.get(service['name'])
+        if current == wanted:
+            continue
+        if current is None:
+            registry['services'].append(wanted)
+        else:
+            # Update in place so the service keeps its position on the dashboard
+            current.clear()
+            current.update(wanted)
+        by_name[service['name']] = wanted if current is None else current
+        changed.append(service['name'])
+
+    absent = set(params['absent'])
+    removed = [s['name'] for s in registry['services'] if s['name'] in absent]
+    registry['services'] = [s for s in registry['services'] if s['name'] not in absent]
+    return changed + removed
+
+
+def write_atomic(path, content):
+    """Replace path in one rename; Homer mounts the directory, so it never sees a partial file."""
+    directory = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.homer-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def checksum(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            config_dir=dict(type='path', default='/opt/homer'),
+            settings=dict(type='dict'),
+            domain=dict(type='str'),
+            groups=dict(type='list', elements='dict', default=[]),
+            services=dict(type='list', elements='dict', default=[]),
+            absent=dict(type='list', elements='str', default=[]),
+            backup=dict(type='bool', default=False),
+            restart=dict(type='bool', default=True),
+            service=dict(type='str', default='homer.service'),
+        ),
+        supports_check_mode=True,
+    )
+    params = module.params
+
+    for group in params['groups']:
+        if not group.get('name'):
+            module.fail_json(msg=f"groups entries need a name: {group}")
+    for service in params['services']:
+        if not service.get('name') or not service.get('group') or not service.get('url'):
+            module.fail_json(msg=f"services entries need name, group and url: {service}")
+
+    config_path = os.path.join(params['config_dir'], 'config.yml')
+    registry_path = os.path.join(params['config_dir'], 'registry.json')
+    registry = load_registry(registry_path)
+    if not registry['settings'] and not params['settings']:
+        # Rendering now would replace a working dashboard with an empty page
+        module.fail_json(msg=f"{registry_path} has no page settings yet; pass settings "
+                             f"(see templates/homer/dashboard.yml) or run Homer Update first")
+    registry_before = json.dumps(registry, sort_keys=True)
+    changed_services = apply_changes(registry, params)
+    registry_text = json.dumps(registry, indent=2) + '\n'
+
+    rendered = render(registry)
+    try:
+        with open(config_path) as f:
+            current = f.read()
+    except FileNotFoundError:
+        current = ''
+    config_changed = checksum(rendered) != checksum(current)
+    registry_changed = json.dumps(registry, sort_keys=True) != registry_before or not os.path.exists(registry_path)
+
+    result = dict(
+        changed=config_changed or registry_changed,
+        changed_services=changed_services,
+        checksum=checksum(rendered),
+        restarted=False,
+        diff={'before': current, 'after': rendered},
+    )
+    if module.check_mode:
+        module.exit_json(**result)
+
+    try:
+        if registry_changed:
+            write_atomic(registry_path, registry_text)
+        if config_changed:
+            if params['backup'] and current:
+                result['backup_file'] = config_path + '.bak'
+                shutil.copy2(config_path, result['backup_file'])
+            write_atomic(config_path, rendered)
+    except OSError as e:
+        module.fail_json(msg=f"Cannot write Homer configuration: {e}", **result)
+
+    if config_changed and params['restart']:
+        # Only restart a running Homer; a fresh deploy starts it later anyway
+        rc, _, _ = module.run_command(['systemctl', 'is-active', '--quiet', params['service']])
+        if rc == 0:
+            rc, _, err = module.run_command(['systemctl', 'restart', params['service']])
+            if rc != 0:
+                module.fail_json(msg=f"Restarting {params['service']} failed: {err.strip()}", **result)
+            result['restarted'] = True
+
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,422 @@
+#!/usr/bin/python3
+"""
+Concurrent HTTPS endpoint verifier.
+Probes every endpoint at the same time and measures, on one connection
+per endpoint, DNS resolution, TCP connect, TLS handshake and the HTTP
+response, plus the certificate served.
+
+Works as an Ansible module and from the command line:
+    python3 https_probe.py https://portainer.lan https://adguard.lan --insecure
+    python3 https_probe.py https://portainer.example.dedyn.io --json
+"""
+import argparse
+import datetime
+import hashlib
+import http.client
+import json
+import socket
+import ssl
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+try:
+    from ansible.module_utils.basic import AnsibleModule
+except ImportError:
+    # Command line use without Ansible installed
+    AnsibleModule = None
+
+DOCUMENTATION = r'''
+---
+module: https_probe
+short_description: Probe HTTPS endpoints concurrently with per-phase timings
+description:
+  - Probes all endpoints in parallel, so the run takes as long as the
+    slowest single probe instead of the sum of all of them.
+  - Each probe uses one connection and records DNS, TCP connect, TLS
+    handshake and time-to-first-byte in milliseconds, the HTTP status,
+    the negotiated TLS version and the certificate subject, issuer,
+    SANs and days until expiry.
+  - Never fails on unreachable endpoints unless I(fail_on_error) is set;
+    the report says which probes failed and why.
+options:
+  endpoints:
+    description:
+      - URLs to probe, or dicts with C(url) and optional C(name) and
+        C(validate_certs).
+    required: true
+    type: list
+    elements: raw
+  validate_certs:
+    description: Default for verifying certificates against the system CA store.
+    default: true
+    type: bool
+  status_codes:
+    description: HTTP status codes that count as success.
+    default: [200, 302, 401]
+    type: list
+    elements: int
+  timeout:
+    description: Timeout in seconds for each phase of a probe.
+    default: 10
+    type: int
+  min_cert_days:
+    description:
+      - Verified certificates expiring in fewer days are reported in
+        C(expiring). Unverified ones (self-signed, internal CA) are
+        short-lived by design and only listed per endpoint.
+    default: 30
+    type: int
+  fail_on_error:
+    description: Fail the task when any probe fails.
+    default: false
+    type: bool
+'''
+
+EXAMPLES = r'''
+- name: Probe services via .lan (self-signed) and the DynDNS domain
+  https_probe:
+    endpoints:
+      - { url: "https://portainer.lan", validate_certs: false }
+      - "https://portainer.example.dedyn.io"
+    min_cert_days: 60
+  register: https_report
+'''
+
+RETURN = r'''
+endpoints:
+  description:
+    - One entry per endpoint with ok, status, error, timings_ms and cert.
+    - cert holds the SHA-256 fingerprint, subject, issuer, DNS SANs, not_after and days_left.
+  returned: always
+  type: list
+passed:
+  description: Number of endpoints that answered with an accepted status.
+  returned: always
+  type: int
+failed:
+  description: Number of endpoints that did not.
+  returned: always
+  type: int
+expiring:
+  description: URLs whose verified certificate expires within min_cert_days.
+  returned: always
+  type: list
+elapsed_ms:
+  description: Wall time of the whole verification.
+  returned: always
+  type: int
+'''
+
+
+def elapsed_ms(start):
+    return round((time.monotonic() - start) * 1000, 1)
+
+
+def describe_name(name):
+    """Flatten an ssl getpeercert() name into 'CN=..., O=...'."""
+    return ', '.join(f"{key}={value}" for rdn in name or () for key, value in rdn)
+
+
+# Name attributes reported in subject/issuer, by DER-encoded OID
+NAME_OIDS = {
+    bytes.fromhex('550403'): 'commonName',
+    bytes.fromhex('55040a'): 'organizationName',
+    bytes.fromhex('55040b'): 'organizationalUnitName',
+    bytes.fromhex('550406'): 'countryName',
+}
+SAN_OID = bytes.fromhex('551d11')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def der_items(data, start=0, end=None):
+    """Yield (tag, value_start, value_end) for consecutive DER elements."""
+    end = len(data) if end is None else end
+    while start < end:
+        tag, length = data[start], data[start + 1]
+        start += 2
+        if length & 0x80:
+            count = length & 0x7f
+            length = int.from_bytes(data[start:start + count], 'big')
+            start += count
+        if start + length > end:
+            raise ValueError('truncated DER element')
+        yield tag, start, start + length
+        start += length
+
+
+def decode_name(der, start, end):
+    rdns = []
+    for _, set_start, set_end in der_items(der, start, end):
+        rdn = []
+        for _, attr_start, attr_end in der_items(der, set_start, set_end):
+            (_, oid_start, oid_end), (_, value_start, value_end) = list(der_items(der, attr_start, attr_end))[:2]
+            name = NAME_OIDS.get(der[oid_start:oid_end])
+            if name:
+                rdn.append((name, der[value_start:value_end].decode('utf-8', errors='replace')))
+        if rdn:
+            rdns.append(tuple(rdn))
+    return tuple(rdns)
+
+
+def decode_time(der, tag, start, end):
+    """UTCTime/GeneralizedTime as getpeercert()'s 'Mon DD HH:MM:SS YYYY GMT'."""
+    text = der[start:end].decode('ascii')
+    if tag == 0x17:
+        year = int(text[:2])
+        text = str(1900 + year if year >= 50 else 2000 + year) + text[2:]
+    year, month, day, hour, minute, second = (int(text[i:j]) for i, j in
+                                              ((0, 4), (4, 6), (6, 8), (8, 10), (10, 12), (12, 14)))
+    return f"{MONTHS[month - 1]} {day:2d} {hour:02d}:{minute:02d}:{second:02d} {year} GMT"
+
+
+def decode_der(der):
+    """Decode subject, issuer, DNS SANs and notAfter of a DER certificate in getpeercert() form.
+
+    Unverified connections only expose the raw certificate and the public
+    ssl API has no decoder for it, so the few fields reported are read here.
+    """
+    try:
+        _, start, end = next(der_items(der))  # Certificate
+        _, start, end = next(der_items(der, start, end))  # TBSCertificate
+        fields = list(der_items(der, start, end))
+        if fields[0][0] == 0xa0:
+            fields = fields[1:]  # Explicit version
+        # serialNumber, signature, issuer, validity, subject, subjectPublicKeyInfo, [1], [2], [3]
+        validity = list(der_items(der, *fields[3][1:]))
+        cert = {
+            'issuer': decode_name(der, *fields[2][1:]),
+            'subject': decode_name(der, *fields[4][1:]),
+            'notAfter': decode_time(der, *validity[1]),
+        }
+        for tag, ext_start, ext_end in fields[6:]:
+            if tag != 0xa3:
+                continue
+            _, ext_start, ext_end = next(der_items(der, ext_start, ext_end))
+            for _, item_start, item_end in der_items(der, ext_start, ext_end):
+                parts = list(der_items(der, item_start, item_end))
+                if der[parts[0][1]:parts[0][2]] != SAN_OID:
+                    continue
+                _, names_start, names_end = next(der_items(der, parts[-1][1], parts[-1][2]))
+                cert['subjectAltName'] = tuple(('DNS', der[a:b].decode('ascii', errors='replace'))
+                                               for kind, a, b in der_items(der, names_start, names_end)
+                                               if kind == 0x82)
+        return cert
+    except (StopIteration, IndexError, ValueError):
+        return {}
+
+
+def certificate_info(tls_sock, verified):
+    der = tls_sock.getpeercert(binary_form=True)
+    if not der:
+        return None
+    cert = tls_sock.getpeercert() if verified else decode_der(der)
+    info = {
+        'sha256': hashlib.sha256(der).hexdigest(),
+        'subject': describe_name(cert.get('subject')),
+        'issuer': describe_name(cert.get('issuer')),
+        'san': [value for kind, value in cert.get('subjectAltName', ()) if kind == 'DNS'],
+        'not_after': cert.get('notAfter'),
+        'days_left': None,
+    }
+    if info['not_after']:
+        expires = datetime.datetime.fromtimestamp(ssl.cert_time_to_seconds(info['not_after']), datetime.timezone.utc)
+        info['not_after'] = expires.strftime('%Y-%m-%dT%H:%M:%SZ')
+        info['days_left'] = (expires - datetime.datetime.now(datetime.timezone.utc)).days
+    # Python 3.13+ can also return the chain the server sent
+    chain = getattr(tls_sock, 'get_verified_chain' if verified else 'get_unverified_chain', None)
+    if chain:
+        try:
+            info['chain_length'] = len(chain())
+        except (ssl.SSLError, ValueError):
+            pass
+    return info
+
+
+def probe(endpoint, timeout, status_codes):
+    """Probe one endpoint over a single connection; never raises."""
+    url = endpoint['url']
+    parts = urlsplit(url)
+    host = parts.hostname
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+    result = {'name': endpoint.get('name') or host, 'url': url, 'ok': False, 'status': None,
+              'error': None, 'address': None, 'tls_version': None, 'cert': None,
+              'cert_verified': False, 'verify_error': None, 'timings_ms': {}}
+    timings = result['timings_ms']
+    total_start = time.monotonic()
+    sock = None
+    phase = 'dns'
+    try:
+        start = time.monotonic()
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        timings['dns'] = elapsed_ms(start)
+
+        phase = 'connect'
+        start = time.monotonic()
+        last_error = None
+        for family, socktype, proto, _, address in addresses:
+            try:
+                sock = socket.socket(family, socktype, proto)
+                sock.settimeout(timeout)
+                sock.connect(address)
+                result['address'] = address[0]
+                break
+            except OSError as e:
+                sock.close()
+                sock = None
+                last_error = e
+        if sock is None:
+            raise last_error or OSError('no address')
+        timings['connect'] = elapsed_ms(start)
+
+        if parts.scheme == 'https':
+            phase = 'tls'
+            verify = endpoint.get('validate_certs', True)
+            context = ssl.create_default_context()
+            if not verify:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            start = time.monotonic()
+            try:
+                sock = context.wrap_socket(sock, server_hostname=host)
+            except ssl.SSLCertVerificationError as e:
+                # Still report what the server presents; that needs a second, unverified handshake
+                result['verify_error'] = e.verify_message or str(e)
+                raise
+            timings['tls'] = elapsed_ms(start)
+            result['tls_version'] = sock.version()
+            result['cert'] = certificate_info(sock, verify)
+            result['cert_verified'] = verify
+
+        phase = 'http'
+        conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        conn.sock = sock
+        start = time.monotonic()
+        conn.request('GET', path, headers={'Host': parts.netloc, 'User-Agent': 'privatebox-https-probe',
+                                           'Connection': 'close'})
+        response = conn.getresponse()
+        timings['http'] = elapsed_ms(start)
+        result['status'] = response.status
+        response.close()
+        result['ok'] = response.status in status_codes
+        if not result['ok']:
+            result['error'] = f"unexpected HTTP status {response.status}"
+    except (OSError, http.client.HTTPException) as e:
+        result['error'] = f"{phase}: {e}"
+    finally:
+        if sock is not None:
+            sock.close()
+    timings['total'] = elapsed_ms(total_start)
+
+    if result['verify_error'] and result['cert'] is None:
+        result['cert'] = unverified_certificate(host, port, timeout)
+    return result
+
+
+def unverified_certificate(host, port, timeout):
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as raw:
+            with context.wrap_socket(raw, server_hostname=host) as tls_sock:
+                return certificate_info(tls_sock, False)
+    except OSError:
+        return None
+
+
+def normalize_endpoints(endpoints, validate_certs):
+    normalized = []
+    for item in endpoints:
+        entry = {'url': item} if isinstance(item, str) else dict(item)
+        if not entry.get('url'):
+            raise ValueError(f"endpoint without url: {item}")
+        entry.setdefault('validate_certs', validate_certs)
+        normalized.append(entry)
+    return normalized
+
+
+def run_probes(endpoints, timeout=10, status_codes=(200, 302, 401), min_cert_days=30):
+    """Probe all endpoints concurrently; returns the structured report."""
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, min(len(endpoints), 32))) as pool:
+        results = list(pool.map(lambda e: probe(e, timeout, status_codes), endpoints))
+    passed = sum(1 for r in results if r['ok'])
+    return {
+        'endpoints': results,
+        'passed': passed,
+        'failed': len(results) - passed,
+        'expiring': [r['url'] for r in results
+                     if r['cert_verified'] and r['cert']['days_left'] is not None
+                     and r['cert']['days_left'] < min_cert_days],
+        'elapsed_ms': round((time.monotonic() - start) * 1000),
+    }
+
+
+def format_result(result):
+    timings = result['timings_ms']
+    phases = ', '.join(f"{name} {timings[name]:.0f} ms" for name in ('dns', 'connect', 'tls', 'http') if name in timings)
+    line = f"{'✓' if result['ok'] else '✗'} {result['url']} → "
+    line += f"HTTP {result['status']}" if result['status'] else 'FAILED'
+    line += f" ({phases})" if phases else ''
+    if result['error']:
+        line += f" - {result['error']}"
+    if result['cert']:
+        line += f" [cert {result['cert']['days_left']} days left]"
+    return line
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            endpoints=dict(type='list', elements='raw', required=True),
+            validate_certs=dict(type='bool', default=True),
+            status_codes=dict(type='list', elements='int', default=[200, 302, 401]),
+            timeout=dict(type='int', default=10),
+            min_cert_days=dict(type='int', default=30),
+            fail_on_error=dict(type='bool', default=False),
+        ),
+        supports_check_mode=True,
+    )
+    params = module.params
+    try:
+        endpoints = normalize_endpoints(params['endpoints'], params['validate_certs'])
+    except ValueError as e:
+        module.fail_json(msg=str(e))
+
+    report = run_probes(endpoints, params['timeout'], params['status_codes'], params['min_cert_days'])
+    report['lines'] = [format_result(r) for r in report['endpoints']]
+    if params['fail_on_error'] and report['failed']:
+        module.fail_json(msg=f"{report['failed']} of {len(endpoints)} endpoint(s) failed", **report)
+    module.exit_json(changed=False, **report)
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Probe HTTPS endpoints concurrently")
+    parser.add_argument('urls', nargs='+')
+    parser.add_argument('--insecure', action='store_true', help="Do not verify certificates")
+    parser.add_argument('--timeout', type=int, default=10)
+    parser.add_argument('--min-cert-days', type=int, default=30)
+    parser.add_argument('--json', action='store_true', help="Print the full report as JSON")
+    args = parser.parse_args()
+
+    endpoints = normalize_endpoints(args.urls, not args.insecure)
+    report = run_probes(endpoints, args.timeout, min_cert_days=args.min_cert_days)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for result in report['endpoints']:
+            print(format_result(result))
+        print(f"\n{report['passed']}/{len(endpoints)} passed in {report['elapsed_ms']} ms")
+        for url in report['expiring']:
+            print(f"⚠ Certificate for {url} expires within {args.min_cert_days} days")
+    return 0 if report['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    # Ansible runs modules without command line arguments
+    if len(sys.argv) > 1 and not sys.argv[1].endswith('.json'):
+        sys.exit(cli())
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/python3
+"""
+OPNsense config.xml patch engine.
+Fetches /conf/config.xml once, applies declarative XPath edits locally with
+ElementTree and uploads the result in a single SSH session with one backup.
+"""
+import hashlib
+import os
+import re
+import shlex
+import subprocess
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+from ansible.module_utils.basic import AnsibleModule
+
+DOCUMENTATION = r'''
+---
+module: opnsense_config_patch
+short_description: Apply declarative edits to OPNsense config.xml in one session
+description:
+  - Reads C(/conf/config.xml) over one SSH call (or a local file with I(path)),
+    applies every edit in memory with ElementTree and, only when something
+    changed, writes a timestamped backup and the new file atomically in one
+    more SSH call.
+  - The upload is refused if config.xml changed on the firewall since it was
+    fetched.
+  - Unchanged parts of the document are serialised byte-for-byte as read.
+  - Supports check mode and returns a structural diff.
+options:
+  host:
+    description: OPNsense address. Mutually exclusive with I(path).
+    type: str
+  user:
+    description: SSH user.
+    default: root
+    type: str
+  key_file:
+    description: SSH private key used to reach OPNsense.
+    type: path
+  config_path:
+    description: Location of config.xml on the firewall.
+    default: /conf/config.xml
+    type: str
+  path:
+    description: Patch a local file instead of a remote firewall (used for testing against fixtures).
+    type: path
+  edits:
+    description:
+      - List of edits applied in order. Each edit has an C(xpath) relative to
+        the C(<opnsense>) root (a leading C(/opnsense/) or C(//) is accepted).
+      - C(state=absent) removes every match.
+      - C(value) sets the element text, creating the last path segment when
+        the parent exists.
+      - C(attribute) with C(value) sets an attribute instead of the text.
+      - C(only_if_empty=true) sets the value only on empty elements.
+    required: true
+    type: list
+    elements: dict
+  backup:
+    description: Keep a timestamped copy of the previous config.xml.
+    default: true
+    type: bool
+  post_command:
+    description: Command run on the firewall in the same session after a change (e.g. configctl unbound reconfigure).
+    type: str
+'''
+
+EXAMPLES = r'''
+- name: Clean up Unbound configuration
+  opnsense_config_patch:
+    host: 10.10.20.1
+    key_file: /root/.credentials/opnsense/id_ed25519
+    edits:
+      - { xpath: "//unbound", state: absent }
+      - { xpath: "OPNsense/unboundplus/general/active_interface", value: "lan,opt1" }
+    post_command: configctl unbound reconfigure
+'''
+
+RETURN = r'''
+changes:
+  description: One line per structural change ("- path", "+ path", "~ path: old → new").
+  returned: always
+  type: list
+backup_file:
+  description: Path of the backup on the firewall, when one was written.
+  returned: changed
+  type: str
+post_command_output:
+  description: Output of I(post_command).
+  returned: when post_command ran
+  type: str
+'''
+
+XML_DECLARATION = b'<?xml version="1.0"?>\n'
+SSH_OPTIONS = ['-o', 'StrictHostKeyChecking=no', '-o', 'BatchMode=yes', '-o', 'ConnectTimeout=10']
+
+
+# ============================================
+# XML handling
+# ============================================
+
+def parse_config(data):
+    """Parse config.xml keeping comments so they survive the round trip."""
+    parser = ET.XMLParser(target=ET.TreeBuilder(insert_comments=True))
+    return ET.fromstring(data, parser=parser)
+
+
+def serialize_config(root):
+    """Serialise in OPNsense's own style (no space before '/>')."""
+    return XML_DECLARATION + ET.tostring(root, encoding='utf-8').replace(b' />', b'/>') + b'\n'
+
+
+def normalize_xpath(xpath):
+    """Accept /opnsense/a/b, //a and a/b; return an ElementTree path from the root."""
+    xpath = xpath.strip()
+    if xpath.startswith('/opnsense/'):
+        xpath = xpath[len('/opnsense/'):]
+    elif xpath.startswith('//'):
+        return '.' + xpath
+    return './' + xpath.lstrip('/')
+
+
+def element_path(element, parents):
+    """Human readable /opnsense/... path for diffs."""
+    parts = []
+    while element is not None:
+        parts.append(element.tag)
+        element = parents.get(element)
+    return '/' + '/'.join(reversed(parts))
+
+
+def remove_element(element, parent):
+    """Remove element and keep the surrounding indentation tidy."""
+    children = list(parent)
+    index = children.index(element)
+    if index > 0:
+        # The previous sibling's tail already holds the indent for the next node
+        if index == len(children) - 1:
+            children[index - 1].tail = element.tail
+    elif index == len(children) - 1:
+        # Last remaining child: collapse the parent to <tag/>
+        parent.text = None
+    parent.remove(element)
+
+
+def create_child(parent, tag, depth):
+    """Append a child with indentation matching its siblings (two spaces per level)."""
+    children = list(parent)
+    child = ET.SubElement(parent, tag)
+    if children:
+        child.tail = children[-1].tail
+        children[-1].tail = parent.text
+    else:
+        child.tail = '\n' + '  ' * depth
+        parent.text = '\n' + '  ' * (depth + 1)
+    return child
+
+
+def apply_edits(root, edits):
+    """Apply edits in order; returns a list of change descriptions."""
+    changes = []
+    for edit in edits:
+        path = normalize_xpath(edit['xpath'])
+        parents = {child: parent for parent in root.iter() for child in parent}
+        matches = root.findall(path)
+
+        if edit.get('state') == 'absent':
+            for element in matches:
+                changes.append(f"- {element_path(element, parents)}")
+                remove_element(element, parents[element])
+            continue
+
+        if not matches:
+            parent_path, _, tag = path.rpartition('/')
+            if not re.match(r'^[A-Za-z_][\w.-]*$', tag):
+                raise ValueError(f"cannot create '{edit['xpath']}': last segment must be a plain tag")
+            parent = root.find(parent_path) if parent_path not in ('', '.') else root
+            if parent is None:
+                raise ValueError(f"cannot create '{edit['xpath']}': parent does not exist")
+            depth = len(element_path(parent, parents).split('/')) - 2
+            element = create_child(parent, tag, depth)
+            parents[element] = parent
+            changes.append(f"+ {element_path(element, parents)}")
+            matches = [element]
+
+        if 'value' not in edit:
+            continue
+        value = '' if edit['value'] is None else str(edit['value'])
+        for element in matches:
+            label = element_path(element, parents)
+            if edit.get('attribute'):
+                old = element.get(edit['attribute'])
+                if old != value:
+                    element.set(edit['attribute'], value)
+                    changes.append(f"~ {label}/@{edit['attribute']}: {old!r} → {value!r}")
+                continue
+            old = (element.text or '').strip() if len(element) == 0 else None
+            if old is None:
+                raise ValueError(f"cannot set text of '{label}': element has children")
+            if edit.get('only_if_empty') and old:
+                continue
+            if old != value:
+                element.text = value or None
+                changes.append(f"~ {label}: {old!r} → {value!r}")
+    return changes
+
+
+# ============================================
+# Transport
+# ============================================
+
+def ssh(params, command, stdin=None):
+    argv = ['ssh'] + SSH_OPTIONS
+    if params['key_file']:
+        argv += ['-i', params['key_file']]
+    argv += [f"{params['user']}@{params['host']}", command]
+    return subprocess.run(argv, input=stdin, capture_output=True, timeout=120)
+
+
+def fetch(params):
+    if params['path']:
+        with open(params['path'], 'rb') as f:
+            return f.read()
+    result = ssh(params, f"cat {shlex.quote(params['config_path'])}")
+    if result.returncode != 0:
+        raise RuntimeError(f"fetch failed: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
+
+
+def upload(params, original, patched):
+    """Write backup + new config in one step; returns (backup_file, post_output)."""
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+    target = params['path'] or params['config_path']
+    backup_file = f"{target}.{stamp}.bak" if params['backup'] else None
+
+    if params['path']:
+        with open(target, 'rb') as f:
+            if f.read() != original:
+                raise RuntimeError(f"{target} changed since it was read")
+        if backup_file:
+            with open(backup_file, 'wb') as f:
+                f.write(original)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(target)))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(patched)
+        os.replace(tmp, target)
+        return backup_file, None
+
+    # One session: concurrency check, backup, atomic replace, optional reload.
+    # Wrapped in /bin/sh because root's login shell on OPNsense is csh.
+    q = shlex.quote(target)
+    script = [
+        'set -e',
+        f'cur=$(sha256 -q {q} 2>/dev/null || sha256sum {q} | cut -d" " -f1)',
+        f'[ "$cur" = "{hashlib.sha256(original).hexdigest()}" ] || '
+        '{ echo "config.xml changed since it was fetched" >&2; exit 3; }',
+    ]
+    if backup_file:
+        script.append(f'cp -p {q} {shlex.quote(backup_file)}')
+    script += [
+        f'cat > {q}.new',
+        f'mv {q}.new {q}',
+    ]
+    if params['post_command']:
+        script.append(params['post_command'])
+    result = ssh(params, '/bin/sh -c ' + shlex.quote('\n'.join(script)), stdin=patched)
+    if result.returncode != 0:
+        raise RuntimeError(f"upload failed: {result.stderr.decode(errors='replace').strip()}")
+    return backup_file, result.stdout.decode(errors='replace').strip()
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            host=dict(type='str'),
+            user=dict(type='str', default='root'),
+            key_file=dict(type='path'),
+            config_path=dict(type='str', default='/conf/config.xml'),
+            path=dict(type='path'),
+            edits=dict(type='list', elements='dict', required=True),
+            backup=dict(type='bool', default=True),
+            post_command=dict(type='str'),
+        ),
+        mutually_exclusive=[('host', 'path')],
+        required_one_of=[('host', 'path')],
+        supports_check_mode=True,
+    )
+    params = module.params
+
+    for edit in params['edits']:
+        if not edit.get('xpath'):
+            module.fail_json(msg=f"every edit needs an xpath: {edit}")
+
+    try:
+        original = fetch(params)
+        root = parse_config(original)
+        changes = apply_edits(root, params['edits'])
+        patched = serialize_config(root)
+    except (ET.ParseError, ValueError, RuntimeError, OSError, subprocess.TimeoutExpired) as e:
+        module.fail_json(msg=str(e))
+
+    changed = patched != original
+    result = dict(changed=changed, changes=changes,
+                  diff={'before': '', 'after': '\n'.join(changes) + '\n' if changes else ''})
+
+    if changed and not module.check_mode:
+        try:
+            backup_file, post_output = upload(params, original, patched)
+        except (RuntimeError, OSError, subprocess.TimeoutExpired) as e:
+            module.fail_json(msg=str(e), changes=changes)
+        result['backup_file'] = backup_file
+        if post_output is not None:
+            result['post_command_output'] = post_output
+
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
@@ -24,6 +24,8 @@ LIB_DIR="${SCRIPT_DIR}/lib"
 LOG_FILE="/tmp/privatebox-bootstrap.log"
 CONFIG_FILE="/tmp/privatebox-config.conf"
 
+source "${LIB_DIR}/artifacts.sh"
+
 # Default values
 DRY_RUN=false
 VERBOSE=false
@@ -161,6 +163,7 @@ error_exit() {
 cleanup() {
     local exit_code=$?
     if [[ $exit_code -ne 0 ]]; then
+        stop_artifact_prefetch
         log "Bootstrap failed with exit code: $exit_code"
         display "❌ Bootstrap failed. Check $LOG_FILE for details"
     fi
@@ -176,6 +179,16 @@ main() {
     display "   PrivateBox Bootstrap"
     display "======================================"
     display ""
+
+    # Download the OPNsense template and Debian image in the background so
+    # they overlap with host preparation; Phases 2 and 3 wait for them
+    if [[ "$DRY_RUN" != true ]]; then
+        if start_artifact_prefetch; then
+            log "Artifact prefetch started (PID $PREFETCH_PID, log: $PREFETCH_LOG)"
+        else
+            log "python3 not found, artifacts will be downloaded by each phase"
+        fi
+    fi
     
     # Phase 1: Host Preparation
     display "Phase 1: Host Preparation"
@@ -19,8 +19,8 @@ SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 LOG_FILE="/tmp/privatebox-bootstrap.log"
 CONFIG_FILE="/tmp/privatebox-config.conf"
 WORK_DIR="/tmp/privatebox-vm-creation"
-DEBIAN_IMAGE_URL="https://cloud.debian.org/images/cloud/trixie/latest/debian-13-genericcloud-amd64.qcow2"
-IMAGE_CACHE_DIR="/var/lib/vz/template/cache"
+# Image URL and cache location shared with the prefetch
+source "${SCRIPT_DIR}/lib/artifacts.sh"
 
 # Parse command line arguments
 VERBOSE="--verbose"  # Default to verbose
@@ -104,11 +104,16 @@ error_exit() {
 download_image() {
     display "Downloading Debian cloud image..."
     
-    local image_name="debian-13-genericcloud-amd64.qcow2"
+    local image_name="$DEBIAN_IMAGE_NAME"
     local image_path="${IMAGE_CACHE_DIR}/${image_name}"
     
     # Create cache directory if needed
     mkdir -p "$IMAGE_CACHE_DIR"
+
+    # Wait for the download bootstrap.sh started during host preparation
+    if wait_for_artifact debian-image >>"$LOG_FILE" 2>&1; then
+        display "  Image prefetched during host preparation (SHA512 verified)"
+    fi
     
     # Check if image already exists
     if [[ -f "$image_path" ]]; then
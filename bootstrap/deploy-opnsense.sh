@@ -64,12 +64,9 @@ VM_STORAGE="${OPNSENSE_VM_STORAGE:-local-lvm}"
 START_AFTER_RESTORE="${OPNSENSE_START:-true}"
 WAN_BRIDGE="${WAN_BRIDGE:-vmbr0}"  # From prepare-host.sh config
 
-# Template Configuration
-TEMPLATE_URL="https://github.com/Rasped/privatebox/releases/download/v1.0.2-opnsense/vzdump-qemu-105-opnsense.vma.zst"
-TEMPLATE_FILENAME="vzdump-qemu-105-opnsense.vma.zst"
-TEMPLATE_MD5="c6d251e1c62f065fd28d720572f8f943"
-TEMPLATE_SIZE_MB=767
-CACHE_DIR="/var/tmp/opnsense-template"
+# Template Configuration (URL, checksum and cache location shared with the prefetch)
+source "${SCRIPT_DIR}/lib/artifacts.sh"
+CACHE_DIR="$TEMPLATE_CACHE_DIR"
 REQUIRED_SPACE_MB=5120  # 5GB for compressed + extracted
 
 # OPNsense Configuration
@@ -319,6 +316,12 @@ download_template() {
         fi
     fi
     
+    # Wait for the download bootstrap.sh started during host preparation;
+    # the cache check below verifies the result
+    if wait_for_artifact opnsense-template >>"$LOG_FILE" 2>&1; then
+        display "  Template prefetched during host preparation"
+    fi
+
     # Check if template is cached
     if [[ -f "$template_path" ]]; then
         display "  Checking cached template..."
@@ -0,0 +1,63 @@
+#!/bin/bash
+# Bootstrap download artifacts and the background prefetch around them.
+# Sourced by bootstrap.sh (starts the prefetch), deploy-opnsense.sh and
+# create-vm.sh (wait for their artifact, then fall back to downloading it).
+
+ARTIFACTS_LIB_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
+# OPNsense template (deploy-opnsense.sh)
+TEMPLATE_URL="https://github.com/Rasped/privatebox/releases/download/v1.0.2-opnsense/vzdump-qemu-105-opnsense.vma.zst"
+TEMPLATE_FILENAME="vzdump-qemu-105-opnsense.vma.zst"
+TEMPLATE_MD5="c6d251e1c62f065fd28d720572f8f943"
+TEMPLATE_SIZE_MB=767
+TEMPLATE_CACHE_DIR="/var/tmp/opnsense-template"
+
+# Debian cloud image (create-vm.sh)
+DEBIAN_IMAGE_URL="https://cloud.debian.org/images/cloud/trixie/latest/debian-13-genericcloud-amd64.qcow2"
+DEBIAN_IMAGE_NAME="debian-13-genericcloud-amd64.qcow2"
+DEBIAN_IMAGE_SUMS_URL="https://cloud.debian.org/images/cloud/trixie/latest/SHA512SUMS"
+IMAGE_CACHE_DIR="/var/lib/vz/template/cache"
+
+# Prefetch state shared between bootstrap.sh and the phase scripts
+PREFETCH_STATE_DIR="/tmp/privatebox-prefetch"
+PREFETCH_LOG="/tmp/privatebox-prefetch.log"
+
+# Start downloading every artifact in the background and return immediately.
+# Sets PREFETCH_PID; returns 1 when python3 is not available.
+start_artifact_prefetch() {
+    if ! command -v python3 &>/dev/null; then
+        return 1
+    fi
+
+    local artifacts=()
+    # A template in /tmp (testing/offline deployment) is copied by deploy-opnsense.sh
+    if [[ ! -f "/tmp/${TEMPLATE_FILENAME}" ]]; then
+        artifacts+=(--artifact opnsense-template "$TEMPLATE_URL"
+                    "${TEMPLATE_CACHE_DIR}/${TEMPLATE_FILENAME}" "md5:${TEMPLATE_MD5}")
+    fi
+    artifacts+=(--artifact debian-image "$DEBIAN_IMAGE_URL"
+                "${IMAGE_CACHE_DIR}/${DEBIAN_IMAGE_NAME}" "sha512sums:${DEBIAN_IMAGE_SUMS_URL}")
+
+    rm -rf "$PREFETCH_STATE_DIR"
+    nohup python3 "${ARTIFACTS_LIB_DIR}/prefetch-artifacts.py" fetch \
+        --state-dir "$PREFETCH_STATE_DIR" "${artifacts[@]}" >"$PREFETCH_LOG" 2>&1 &
+    PREFETCH_PID=$!
+}
+
+# Stop a running prefetch; partial downloads are resumed by the next run
+stop_artifact_prefetch() {
+    if [[ -n "${PREFETCH_PID:-}" ]]; then
+        kill "$PREFETCH_PID" 2>/dev/null || true
+    fi
+}
+
+# Block until the prefetch has finished the named artifact.
+# Returns non-zero when there is no prefetch for it or it failed;
+# the caller then downloads the artifact itself.
+wait_for_artifact() {
+    local name="$1"
+    if [[ ! -f "${PREFETCH_STATE_DIR}/${name}.pending" ]] || ! command -v python3 &>/dev/null; then
+        return 1
+    fi
+    python3 "${ARTIFACTS_LIB_DIR}/prefetch-artifacts.py" wait --state-dir "$PREFETCH_STATE_DIR" "$name"
+}
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Phonetic password generator for PrivateBox.
+Same output as password-generator.sh: distinct EFF words joined with
+hyphens, about one letter in five capitalized and exactly one letter per
+word replaced by a digit (e→3 o→0 i→1 l→1 a→4 s→5). The word list is read
+once per invocation and all randomness comes from the secrets module.
+
+Usage:
+    password-generator.py --services | --admin        One password (3 / 5 words)
+    password-generator.py --phonetic N | --random N   N words / N characters
+    password-generator.py --admin --count 10          Several passwords at once
+    password-generator.py --batch ADMIN_PASSWORD=admin SERVICES_PASSWORD=services
+                                                      NAME='password' lines for eval
+    password-generator.py --check [PASSWORD ...] --words 3
+                                                      Validate passwords (stdin if none)
+                                                      against the format rules
+Add --entropy to print the estimated entropy in bits after each password.
+"""
+import argparse
+import math
+import secrets
+import shlex
+import sys
+from pathlib import Path
+
+WORD_FILE = Path(__file__).resolve().parent / "phonetic-words.txt"
+SUBSTITUTIONS = {"e": "3", "o": "0", "i": "1", "l": "1", "a": "4", "s": "5"}
+REVERSE_SUBSTITUTIONS = {"3": "e", "0": "o", "1": "il", "4": "a", "5": "s"}
+CAPITALIZE_ODDS = 5  # one letter in five
+RANDOM_CHARSET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789@*+="
+PRESETS = {"services": 3, "admin": 5}
+FALLBACK_LENGTHS = {"services": 20, "admin": 32}
+
+_random = secrets.SystemRandom()
+
+
+class WordList:
+    """The phonetic word list, loaded once and indexed for generation and validation."""
+
+    def __init__(self, path=WORD_FILE):
+        self.words = []
+        with open(path) as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if line and not line.startswith("#"):
+                    self.words.append(line)
+        self.word_set = set(self.words)
+        self.max_hyphens = max(word.count("-") for word in self.words)
+
+    def __len__(self):
+        return len(self.words)
+
+    def sample(self, count):
+        if count > len(self.words):
+            raise ValueError("Not enough words in word file")
+        return _random.sample(self.words, count)
+
+
+def dress_word(word):
+    """Capitalize about one letter in five, then substitute exactly one eligible letter."""
+    chars = [c.upper() if secrets.randbelow(CAPITALIZE_ODDS) == 0 else c for c in word]
+    eligible = [i for i, c in enumerate(chars) if c.lower() in SUBSTITUTIONS]
+    if eligible:
+        position = secrets.choice(eligible)
+        chars[position] = SUBSTITUTIONS[chars[position].lower()]
+    return "".join(chars)
+
+
+def word_entropy(word):
+    """Bits added by capitalization and the substitution position for one word."""
+    letters = sum(1 for c in word if c.isalpha())
+    eligible = sum(1 for c in word if c in SUBSTITUTIONS)
+    p = 1 / CAPITALIZE_ODDS
+    capitalization = -(p * math.log2(p) + (1 - p) * math.log2(1 - p))
+    # The substituted letter becomes a digit, so its capitalization is lost
+    return (math.log2(eligible) if eligible else 0) + capitalization * (letters - (1 if eligible else 0))
+
+
+def phonetic_password(wordlist, count):
+    """Return (password, estimated entropy in bits)."""
+    words = wordlist.sample(count)
+    # Ordered choice of distinct words: log2(N! / (N - count)!)
+    selection = sum(math.log2(len(wordlist) - i) for i in range(count))
+    return "-".join(dress_word(w) for w in words), selection + sum(word_entropy(w) for w in words)
+
+
+def random_password(length):
+    """Random password with at least one upper, lower, digit and special character."""
+    if length < 4:
+        raise ValueError("Random passwords need at least 4 characters")
+    chars = [secrets.choice(group) for group in
+             (RANDOM_CHARSET[:26], RANDOM_CHARSET[26:52], RANDOM_CHARSET[52:62], RANDOM_CHARSET[62:])]
+    chars += [secrets.choice(RANDOM_CHARSET) for _ in range(length - 4)]
+    _random.shuffle(chars)
+    return "".join(chars), length * math.log2(len(RANDOM_CHARSET))
+
+
+def generate(wordlist, kind):
+    """Generate one password for 'services', 'admin' or a random-password length."""
+    if kind in PRESETS:
+        try:
+            return phonetic_password(wordlist(), PRESETS[kind])
+        except (OSError, ValueError):
+            # Same fallback as password-generator.sh
+            return random_password(FALLBACK_LENGTHS[kind])
+    return random_password(int(kind))
+
+
+def undress_segment(segment, wordlist):
+    """True when segment is a list word with the capitalization and substitution rules applied."""
+    digits = [i for i, c in enumerate(segment) if c.isdigit()]
+    if len(digits) > 1:
+        return False
+    lowered = segment.lower()
+    if not digits:
+        # Only words without any substitutable letter stay digit-free
+        return lowered in wordlist.word_set and not any(c in SUBSTITUTIONS for c in lowered)
+    position = digits[0]
+    for letter in REVERSE_SUBSTITUTIONS.get(segment[position], ""):
+        if lowered[:position] + letter + lowered[position + 1:] in wordlist.word_set:
+            return True
+    return False
+
+
+def check_phonetic(password, wordlist, count):
+    """Return None when password follows the generator's format, else the reason it does not."""
+    if any(c not in RANDOM_CHARSET[:62] + "-" for c in password):
+        return "unexpected character"
+    tokens = password.split("-")
+
+    # List words may contain hyphens themselves, so try every way of grouping tokens
+    def parse(start, used):
+        if start == len(tokens):
+            return [] if len(used) == count else None
+        for width in range(1, wordlist.max_hyphens + 2):
+            segment = "-".join(tokens[start:start + width])
+            if start + width > len(tokens) or not undress_segment(segment, wordlist):
+                continue
+            base = segment.lower()
+            if base in used:
+                continue
+            rest = parse(start + width, used | {base})
+            if rest is not None:
+                return [segment] + rest
+        return None
+
+    if parse(0, frozenset()) is None:
+        return f"not {count} distinct list words with one substitution each"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate PrivateBox passwords")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--services", action="store_true", help="Services password (3 words)")
+    mode.add_argument("--admin", action="store_true", help="Admin password (5 words)")
+    mode.add_argument("--phonetic", type=int, metavar="N", help="N-word phonetic password")
+    mode.add_argument("--random", type=int, metavar="N", help="N-character random password")
+    mode.add_argument("--batch", nargs="+", metavar="NAME=TYPE",
+                      help="Print NAME='password' for each TYPE (services, admin or a length)")
+    mode.add_argument("--check", nargs="*", metavar="PASSWORD",
+                      help="Validate phonetic passwords (read from stdin when none given)")
+    parser.add_argument("--count", type=int, default=1, help="Number of passwords to generate")
+    parser.add_argument("--words", type=int, default=3, help="Word count expected by --check")
+    parser.add_argument("--entropy", action="store_true", help="Print estimated entropy in bits")
+    args = parser.parse_args()
+
+    # Loaded lazily and only once, however many passwords are generated
+    loaded = []
+
+    def wordlist():
+        if not loaded:
+            loaded.append(WordList())
+        return loaded[0]
+
+    def emit(password, bits, name=None):
+        line = f"{name}={shlex.quote(password)}" if name else password
+        print(f"{line}\t{bits:.1f}" if args.entropy else line)
+
+    try:
+        if args.check is not None:
+            passwords = args.check or [line.strip() for line in sys.stdin if line.strip()]
+            failures = 0
+            for password in passwords:
+                reason = check_phonetic(password, wordlist(), args.words)
+                if reason:
+                    failures += 1
+                    print(f"✗ {password}: {reason}")
+            print(f"{len(passwords) - failures}/{len(passwords)} password(s) match the format")
+            return 1 if failures else 0
+
+        if args.batch:
+            for spec in args.batch:
+                name, _, kind = spec.partition("=")
+                if not name.isidentifier() or not kind:
+                    parser.error(f"--batch entries must be NAME=TYPE: {spec}")
+                emit(*generate(wordlist, kind), name=name)
+            return 0
+
+        for _ in range(args.count):
+            if args.services or args.admin:
+                emit(*generate(wordlist, "services" if args.services else "admin"))
+            elif args.phonetic is not None:
+                emit(*phonetic_password(wordlist(), args.phonetic))
+            else:
+                emit(*random_password(args.random))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
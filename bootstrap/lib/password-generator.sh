@@ -1,11 +1,19 @@
 #!/bin/bash
 # Phonetic password generator for PrivateBox
 # Generates memorable passwords using 5-letter words with number substitutions
+# Uses password-generator.py (same format, secrets-based randomness, word list
+# loaded once) when python3 is available; the bash functions are the fallback.
 
 # Get the directory where this script is located
 # Use LIB_DIR instead of SCRIPT_DIR to avoid overwriting parent script's variable
 LIB_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 WORD_FILE="${LIB_DIR}/phonetic-words.txt"
+PASSWORD_GENERATOR_PY="${LIB_DIR}/password-generator.py"
+
+# True when the Python generator can be used
+have_python_generator() {
+    command -v python3 &>/dev/null && [[ -f "$PASSWORD_GENERATOR_PY" ]]
+}
 
 # Letter to number substitution map
 apply_substitutions() {
@@ -147,6 +155,13 @@ generate_fallback_password() {
 # Wrapper function that tries phonetic first, falls back to random
 generate_password() {
     local type="${1:-services}"  # "services" or "admin"
+
+    if have_python_generator; then
+        case "$type" in
+            services|admin) python3 "$PASSWORD_GENERATOR_PY" "--${type}" 2>/dev/null && return 0 ;;
+            *) python3 "$PASSWORD_GENERATOR_PY" --random "${type:-32}" 2>/dev/null && return 0 ;;
+        esac
+    fi
     
     case "$type" in
         services)
@@ -174,6 +189,19 @@ generate_password() {
     esac
 }
 
+# Generate several passwords in one call; prints NAME='password' lines for eval
+# Usage: eval "$(generate_passwords admin_password=admin services_password=services)"
+generate_passwords() {
+    if have_python_generator && python3 "$PASSWORD_GENERATOR_PY" --batch "$@" 2>/dev/null; then
+        return 0
+    fi
+
+    local spec
+    for spec in "$@"; do
+        printf '%s=%q\n' "${spec%%=*}" "$(generate_password "${spec#*=}")"
+    done
+}
+
 # Allow direct execution for testing
 if [[ "${BASH_SOURCE[0]}" == "${0}" ]]; then
     # Parse command line arguments
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Bootstrap artifact prefetcher.
+Downloads the large bootstrap artifacts (OPNsense template, Debian cloud
+image) concurrently while host preparation runs, so the later phases only
+wait for their own artifact instead of downloading it themselves.
+
+Downloads go to <dest>.part and resume with HTTP Range requests after a
+dropped connection or an interrupted bootstrap. A file is moved into place
+only after its checksum matches; then <state-dir>/<name>.status says
+"ready <path>" (or "failed <reason>").
+
+Commands:
+    fetch --state-dir DIR --artifact NAME URL DEST CHECKSUM [--artifact ...]
+    wait  --state-dir DIR NAME [--timeout SECONDS]
+
+CHECKSUM is md5:<hex>, sha512:<hex>, sha512sums:<url of a SHA512SUMS file>
+or none. Files already at DEST are reused when they match a fixed hash;
+with sha512sums (a moving "latest" image) an existing file is reused as is.
+
+wait exits 0 when the artifact is ready, 1 when its download failed and
+2 when no prefetch was started for it (the caller downloads it itself).
+Uses only the standard library: it runs on a bare Proxmox host.
+"""
+import argparse
+import hashlib
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+CHUNK_SIZE = 1024 * 1024
+ATTEMPTS = 5
+SOCKET_TIMEOUT = 60
+USER_AGENT = "privatebox-bootstrap-prefetch"
+
+print_lock = threading.Lock()
+
+
+def say(name, message):
+    with print_lock:
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] prefetch {name}: {message}", flush=True)
+
+
+def write_status(state_dir, name, status):
+    """Write <name>.status atomically so waiters never read a partial line."""
+    path = Path(state_dir) / f"{name}.status"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(status + "\n")
+    os.replace(tmp, path)
+
+
+def file_hash(path, algorithm):
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest
+
+
+def resolve_checksum(spec, dest):
+    """Return (algorithm, expected hex or None, trust_existing)."""
+    if spec == "none":
+        return None, None, True
+    kind, _, value = spec.partition(":")
+    if kind in ("md5", "sha256", "sha512"):
+        return kind, value.lower(), False
+    if kind == "sha512sums":
+        request = urllib.request.Request(value, headers={"User-Agent": USER_AGENT})
+        with urllib.request.urlopen(request, timeout=SOCKET_TIMEOUT) as response:
+            sums = response.read().decode()
+        for line in sums.splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[1].lstrip("*") == Path(dest).name:
+                return "sha512", parts[0].lower(), True
+        raise ValueError(f"{Path(dest).name} not listed in {value}")
+    raise ValueError(f"unknown checksum type '{spec}'")
+
+
+def download(name, url, part, algorithm):
+    """Download url into part, resuming what is already there; returns the digest."""
+    offset = part.stat().st_size if part.exists() else 0
+    digest = hashlib.new(algorithm) if algorithm else None
+    if digest and offset:
+        # Rebuild the running hash from the bytes kept by the last attempt
+        digest = file_hash(part, algorithm)
+
+    headers = {"User-Agent": USER_AGENT}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        response = urllib.request.urlopen(request, timeout=SOCKET_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and offset:
+            # Range starts at the end: the previous attempt got everything
+            return digest
+        raise
+
+    with response:
+        if offset and response.status != 206:
+            say(name, "server ignored the range request, starting over")
+            offset = 0
+            digest = hashlib.new(algorithm) if algorithm else None
+        elif offset:
+            say(name, f"resuming at {offset // (1024 * 1024)} MB")
+        length = response.headers.get("Content-Length")
+        total = offset + int(length) if length else None
+        received = offset
+        next_report = (received * 10 // total + 1) / 10 if total else 1
+        with open(part, "ab" if offset else "wb") as f:
+            for block in iter(lambda: response.read(CHUNK_SIZE), b""):
+                f.write(block)
+                if digest:
+                    digest.update(block)
+                received += len(block)
+                if total and received / total >= next_report:
+                    say(name, f"{received * 100 // total}% of {total // (1024 * 1024)} MB")
+                    next_report += 0.1
+        if total and received < total:
+            raise ConnectionError(f"connection closed after {received} of {total} bytes")
+    return digest
+
+
+def fetch(name, url, dest, checksum, state_dir):
+    """Make dest available and verified; reports the result through the status file."""
+    dest = Path(dest)
+    part = dest.with_name(dest.name + ".part")
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    start = time.monotonic()
+    try:
+        algorithm, expected, trust_existing = resolve_checksum(checksum, dest)
+    except (OSError, ValueError) as e:
+        if not dest.exists():
+            say(name, f"failed: cannot resolve checksum: {e}")
+            write_status(state_dir, name, f"failed checksum unavailable: {e}")
+            return False
+        algorithm, expected, trust_existing = None, None, True
+
+    if dest.exists():
+        if trust_existing or (expected and file_hash(dest, algorithm).hexdigest() == expected):
+            say(name, f"using cached {dest}")
+            write_status(state_dir, name, f"ready {dest}")
+            return True
+        say(name, "cached file checksum mismatch, downloading again")
+        dest.unlink()
+
+    for attempt in range(1, ATTEMPTS + 1):
+        try:
+            digest = download(name, url, part, algorithm)
+        except (OSError, urllib.error.URLError) as e:
+            say(name, f"attempt {attempt}/{ATTEMPTS} interrupted: {e}")
+        else:
+            actual = digest.hexdigest() if digest else None
+            if actual == expected:
+                os.replace(part, dest)
+                say(name, f"ready in {time.monotonic() - start:.0f} s ({dest.stat().st_size // (1024 * 1024)} MB)")
+                write_status(state_dir, name, f"ready {dest}")
+                return True
+            say(name, f"attempt {attempt}/{ATTEMPTS}: {algorithm} mismatch (expected {expected}, got {actual})")
+            # A corrupt file cannot be resumed
+            part.unlink(missing_ok=True)
+        if attempt < ATTEMPTS:
+            time.sleep(min(30, 5 * 2 ** (attempt - 1)))
+
+    write_status(state_dir, name, f"failed after {ATTEMPTS} attempts")
+    return False
+
+
+def cmd_fetch(args):
+    state_dir = Path(args.state_dir)
+    state_dir.mkdir(parents=True, exist_ok=True)
+    for name, *_ in args.artifact:
+        (state_dir / f"{name}.status").unlink(missing_ok=True)
+        (state_dir / f"{name}.pending").write_text(f"{os.getpid()}\n")
+
+    results = []
+
+    def run(name, url, dest, checksum):
+        try:
+            results.append(fetch(name, url, dest, checksum, state_dir))
+        except Exception as e:
+            # Never leave a waiter without a status
+            say(name, f"failed: {e}")
+            write_status(state_dir, name, f"failed {e}")
+            results.append(False)
+
+    threads = [threading.Thread(target=run, args=artifact, name=artifact[0]) for artifact in args.artifact]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return 0 if all(results) else 1
+
+
+def cmd_wait(args):
+    state_dir = Path(args.state_dir)
+    status_file = state_dir / f"{args.name}.status"
+    pending = state_dir / f"{args.name}.pending"
+    if not pending.exists():
+        return 2
+
+    deadline = time.monotonic() + args.timeout
+    while not status_file.exists():
+        try:
+            pid = int(pending.read_text().strip())
+            os.kill(pid, 0)
+        except (OSError, ValueError):
+            # Re-check: the prefetcher may have written the status and exited just now
+            if status_file.exists():
+                break
+            print(f"prefetch of {args.name} stopped without a result")
+            return 1
+        if time.monotonic() >= deadline:
+            print(f"timed out after {args.timeout} s waiting for {args.name}")
+            return 1
+        time.sleep(0.5)
+
+    status = status_file.read_text().strip()
+    print(status)
+    return 0 if status.startswith("ready ") else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefetch bootstrap artifacts concurrently")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_fetch = sub.add_parser("fetch", help="Download artifacts in parallel")
+    p_fetch.add_argument("--state-dir", required=True)
+    p_fetch.add_argument("--artifact", nargs=4, action="append", required=True,
+                         metavar=("NAME", "URL", "DEST", "CHECKSUM"))
+    p_wait = sub.add_parser("wait", help="Block until one artifact is ready")
+    p_wait.add_argument("--state-dir", required=True)
+    p_wait.add_argument("name")
+    p_wait.add_argument("--timeout", type=int, default=3600)
+    args = parser.parse_args()
+
+    if args.command == "fetch":
+        return cmd_fetch(args)
+    return cmd_wait(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
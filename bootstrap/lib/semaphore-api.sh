@@ -686,7 +686,9 @@ run_generate_templates_task() {
     fi
     
     log_info "Triggering Generate Templates (template_id=$template_id)"
-    local payload=$(jq -n --argjson tid "$template_id" '{template_id: $tid, debug: false, dry_run: false}')
+    # OUTPUT_MODE=quiet keeps the task log (stored in Semaphore's database) short
+    local payload=$(jq -n --argjson tid "$template_id" \
+        '{template_id: $tid, debug: false, dry_run: false, environment: ({OUTPUT_MODE: "quiet"} | tostring)}')
     local api_result=$(make_api_request "POST" \
         "https://localhost:2443/api/project/$project_id/tasks" \
         "$payload" "$admin_session" "Running Generate Templates")
@@ -875,8 +877,9 @@ run_service_orchestration() {
 
     log_info "Found Orchestrate Services template with ID: $template_id"
 
-    # Run the orchestration
-    local payload=$(jq -n --argjson tid "$template_id" '{template_id: $tid, debug: false, dry_run: false}')
+    # Run the orchestration; quiet output still includes the progress markers parsed below
+    local payload=$(jq -n --argjson tid "$template_id" \
+        '{template_id: $tid, debug: false, dry_run: false, environment: ({OUTPUT_MODE: "quiet"} | tostring)}')
     local api_result=$(make_api_request "POST" \
         "https://localhost:2443/api/project/$project_id/tasks" \
         "$payload" "$admin_session" "Starting service orchestration")
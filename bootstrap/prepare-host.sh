@@ -215,9 +215,9 @@ generate_config() {
     # Detect Proxmox node name - use hostname as it's more reliable
     local proxmox_node=$(hostname -s 2>/dev/null || echo "proxmox")
     
-    # Generate passwords
-    local admin_password=$(generate_password admin)
-    local services_password=$(generate_password services)
+    # Generate passwords (one generator run for both)
+    local admin_password services_password
+    eval "$(generate_passwords admin_password=admin services_password=services)"
     
     # Generate Proxmox API token
     display "Creating Proxmox API token for automation..."
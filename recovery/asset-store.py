@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+PrivateBox content-addressed asset store.
+Splits the `podman save` archives listed in assets-manifest.json into their
+members (layers, configs, manifests) and stores each member once by SHA-256.
+Shared base layers are therefore kept once instead of once per image.
+
+Layout (inside --store, default <assets-dir>/store):
+    blobs/sha256/<aa>/<digest>   one file per unique member
+    index.json                   manifest entry → ordered list of tar members
+    .lock                        held by ingest, sync and gc while they run
+
+Commands:
+    ingest [NAME...]            Add container archives from <assets-dir>/containers
+    export NAME [-o FILE]       Rebuild a loadable archive (stdout when -o is omitted)
+    sync SOURCE_STORE           Copy index and only the blobs missing locally
+    verify                      Re-hash every referenced blob
+    gc                          Delete blobs no longer referenced by the index
+    stats                       Logical versus stored size
+
+Examples:
+    ./asset-store.py ingest
+    ./asset-store.py export adguard | podman load
+    ./asset-store.py sync /var/privatebox/assets/store --store /mnt/recovery/store
+"""
+import argparse
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+DEFAULT_MANIFEST = SCRIPT_DIR / "assets-manifest.json"
+DEFAULT_ASSETS_DIR = os.environ.get("ASSETS_DIR", "/var/privatebox/assets")
+CHUNK_SIZE = 1024 * 1024
+INDEX_VERSION = 1
+INCOMING_GRACE = 6 * 3600  # Age after which an .incoming- temp file counts as abandoned
+
+
+def human(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+
+
+class AssetStore:
+    """Blob directory plus a JSON index of archives built from those blobs."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.blob_dir = self.root / "blobs" / "sha256"
+        self.index_path = self.root / "index.json"
+        self.index = self._load_index()
+
+    def _load_index(self):
+        if self.index_path.exists():
+            with open(self.index_path) as f:
+                index = json.load(f)
+            if index.get("version") != INDEX_VERSION:
+                raise SystemExit(f"✗ Unsupported index version in {self.index_path}")
+            return index
+        return {"version": INDEX_VERSION, "images": {}}
+
+    def save_index(self):
+        """Write the index atomically so an interrupted run never corrupts it."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".index-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+            f.write("\n")
+        os.replace(tmp, self.index_path)
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Hold the store lock and re-read the index, which another run may have changed."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".lock", "w") as lock:
+            # gc must not delete a blob that an ingest has found and not yet indexed
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.index = self._load_index()
+            yield
+
+    def blob_path(self, digest):
+        return self.blob_dir / digest[:2] / digest
+
+    def has_blob(self, digest):
+        return self.blob_path(digest).exists()
+
+    def put_stream(self, stream):
+        """Store a stream by content; returns (digest, size, is_new)."""
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.blob_dir, prefix=".incoming-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    out.write(chunk)
+                    sha.update(chunk)
+                    size += len(chunk)
+            digest = sha.hexdigest()
+            target = self.blob_path(digest)
+            if target.exists():
+                os.unlink(tmp)
+                return digest, size, False
+            target.parent.mkdir(exist_ok=True)
+            os.replace(tmp, target)
+            return digest, size, True
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def referenced(self):
+        """Map of digest → size for every blob the index refers to."""
+        refs = {}
+        for entry in self.index["images"].values():
+            for member in entry["members"]:
+                if member["type"] == "file":
+                    refs[member["digest"]] = member["size"]
+        return refs
+
+    # ============================================
+    # Operations
+    # ============================================
+
+    def ingest(self, name, archive_path, image=None):
+        """Split one archive into blobs; returns (new_blobs, new_bytes, reused_bytes)."""
+        members = []
+        new_blobs = new_bytes = reused_bytes = 0
+        with self.locked(), tarfile.open(archive_path, "r:") as tar:
+            for info in tar:
+                record = {
+                    "name": info.name, "mode": info.mode, "mtime": info.mtime,
+                    "uid": info.uid, "gid": info.gid, "uname": info.uname, "gname": info.gname,
+                }
+                if info.isfile():
+                    digest, size, is_new = self.put_stream(tar.extractfile(info))
+                    record.update(type="file", digest=digest, size=size)
+                    if is_new:
+                        new_blobs += 1
+                        new_bytes += size
+                    else:
+                        reused_bytes += size
+                elif info.isdir():
+                    record["type"] = "dir"
+                elif info.issym() or info.islnk():
+                    record.update(type="symlink" if info.issym() else "hardlink", target=info.linkname)
+                else:
+                    # docker-archive/OCI archives only contain the types above
+                    continue
+                members.append(record)
+
+            self.index["images"][name] = {
+                "filename": Path(archive_path).name,
+                "image": image,
+                "ingested": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "members": members,
+            }
+            self.save_index()
+        return new_blobs, new_bytes, reused_bytes
+
+    def export(self, name, out):
+        """Rebuild the archive for name into a binary file object."""
+        entry = self.index["images"].get(name)
+        if not entry:
+            raise KeyError(name)
+        with tarfile.open(fileobj=out, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+            for member in entry["members"]:
+                info = tarfile.TarInfo(member["name"])
+                info.mode = member["mode"]
+                info.mtime = member["mtime"]
+                info.uid, info.gid = member["uid"], member["gid"]
+                info.uname, info.gname = member["uname"], member["gname"]
+                if member["type"] == "file":
+                    info.size = member["size"]
+                    with open(self.blob_path(member["digest"]), "rb") as blob:
+                        tar.addfile(info, blob)
+                    continue
+                if member["type"] == "dir":
+                    info.type = tarfile.DIRTYPE
+                else:
+                    info.type = tarfile.SYMTYPE if member["type"] == "symlink" else tarfile.LNKTYPE
+                    info.linkname = member["target"]
+                tar.addfile(info)
+
+    def sync_from(self, source):
+        """Copy the source index and only the blobs this store lacks."""
+        copied = copied_bytes = 0
+        with self.locked():
+            for digest, size in source.referenced().items():
+                if self.has_blob(digest):
+                    continue
+                target = self.blob_path(digest)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                tmp = target.with_name(f".incoming-{digest}")
+                shutil.copyfile(source.blob_path(digest), tmp)
+                os.replace(tmp, target)
+                copied += 1
+                copied_bytes += size
+            self.index["images"].update(source.index["images"])
+            self.save_index()
+        return copied, copied_bytes
+
+    def verify(self):
+        """Re-hash referenced blobs; returns a list of bad digests."""
+        bad = []
+        for digest in self.referenced():
+            path = self.blob_path(digest)
+            if not path.exists():
+                bad.append(digest)
+                continue
+            sha = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    sha.update(chunk)
+            if sha.hexdigest() != digest:
+                bad.append(digest)
+        return bad
+
+    def gc(self):
+        """Remove unreferenced blobs and abandoned temp files; returns (count, bytes)."""
+        removed = freed = 0
+        if not self.blob_dir.exists():
+            return removed, freed
+        with self.locked():
+            refs = self.referenced()
+            now = time.time()
+            for path in [*self.blob_dir.glob(".incoming-*"), *self.blob_dir.glob("*/*")]:
+                try:
+                    st = path.stat()
+                    if path.name.startswith(".incoming-"):
+                        # Left by a put_stream caller outside the lock, or by an
+                        # interrupted run; only sweep the old ones
+                        if now - st.st_mtime < INCOMING_GRACE:
+                            continue
+                    elif path.name in refs:
+                        continue
+                    path.unlink()
+                except FileNotFoundError:
+                    # Renamed into place or removed by another process meanwhile
+                    continue
+                freed += st.st_size
+                removed += 1
+        return removed, freed
+
+
+def manifest_images(manifest_path):
+    """Map manifest entry name → (filename, image reference)."""
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    return {
+        entry["name"]: (entry["filename"], f"{entry['registry']}/{entry['image']}:{entry['tag']}")
+        for entry in manifest.get("container_images", {}).get("base_images", [])
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-addressed store for PrivateBox recovery assets")
+    parser.add_argument("--assets-dir", default=DEFAULT_ASSETS_DIR)
+    parser.add_argument("--manifest", default=str(DEFAULT_MANIFEST))
+    parser.add_argument("--store", help="Store directory (default: <assets-dir>/store)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_ingest = sub.add_parser("ingest", help="Add container archives to the store")
+    p_ingest.add_argument("names", nargs="*", help="Manifest entry names (default: all)")
+    p_ingest.add_argument("--remove-archives", action="store_true",
+                          help="Delete the original .tar files once stored")
+    p_export = sub.add_parser("export", help="Rebuild a loadable image archive")
+    p_export.add_argument("name")
+    p_export.add_argument("-o", "--output", help="Output file (default: stdout)")
+    p_sync = sub.add_parser("sync", help="Copy new blobs from another store")
+    p_sync.add_argument("source")
+    sub.add_parser("verify", help="Re-hash all referenced blobs")
+    sub.add_parser("gc", help="Delete unreferenced blobs")
+    sub.add_parser("stats", help="Show deduplication statistics")
+    args = parser.parse_args()
+
+    store = AssetStore(args.store or Path(args.assets_dir) / "store")
+
+    if args.command == "ingest":
+        images = manifest_images(args.manifest)
+        names = args.names or list(images)
+        failed = 0
+        for name in names:
+            if name not in images:
+                print(f"✗ {name}: not a container image in {args.manifest}")
+                failed += 1
+                continue
+            filename, image = images[name]
+            archive = Path(args.assets_dir) / "containers" / filename
+            if not archive.exists():
+                print(f"⚠ {name}: {archive} not found, skipping")
+                continue
+            try:
+                new_blobs, new_bytes, reused = store.ingest(name, archive, image)
+            except (tarfile.TarError, OSError) as e:
+                print(f"✗ {name}: {e}")
+                failed += 1
+                continue
+            print(f"✓ {name}: {new_blobs} new blob(s), {human(new_bytes)} stored, {human(reused)} deduplicated")
+            if args.remove_archives:
+                archive.unlink()
+        sys.exit(1 if failed else 0)
+
+    if args.command == "export":
+        try:
+            if args.output:
+                tmp = f"{args.output}.part"
+                with open(tmp, "wb") as out:
+                    store.export(args.name, out)
+                os.replace(tmp, args.output)
+                print(f"✓ Wrote {args.output}", file=sys.stderr)
+            else:
+                store.export(args.name, sys.stdout.buffer)
+        except KeyError:
+            print(f"✗ {args.name} is not in the store", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    if args.command == "sync":
+        copied, copied_bytes = store.sync_from(AssetStore(args.source))
+        print(f"✓ Copied {copied} new blob(s) ({human(copied_bytes)})")
+        return
+
+    if args.command == "verify":
+        bad = store.verify()
+        for digest in bad:
+            print(f"✗ Missing or corrupt blob: {digest}")
+        if bad:
+            sys.exit(1)
+        print(f"✓ {len(store.referenced())} blob(s) verified")
+        return
+
+    if args.command == "gc":
+        removed, freed = store.gc()
+        print(f"✓ Removed {removed} unreferenced blob(s), freed {human(freed)}")
+        return
+
+    if args.command == "stats":
+        logical = sum(m["size"] for e in store.index["images"].values()
+                      for m in e["members"] if m["type"] == "file")
+        stored = sum(store.referenced().values())
+        print(f"Images: {len(store.index['images'])}")
+        for name, entry in sorted(store.index["images"].items()):
+            size = sum(m["size"] for m in entry["members"] if m["type"] == "file")
+            print(f"  - {name}: {entry['filename']} ({human(size)})")
+        print(f"Logical size: {human(logical)}")
+        print(f"Stored size:  {human(stored)}")
+        if logical:
+            print(f"Saved:        {human(logical - stored)} ({(logical - stored) / logical * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,8 @@
 # - Source code (PrivateBox repository)
 # - Proxmox VE packages (for Debian → Proxmox conversion)
 #
+# Containers, VM images and source are fetched in parallel by fetch-assets.py.
+#
 # Usage: ./download-assets.sh [--assets-dir /path/to/assets]
 #
 
@@ -88,7 +90,7 @@ preflight_checks() {
     success "Running as root"
 
     # Check required commands
-    local required_commands=("wget" "podman" "jq" "md5sum")
+    local required_commands=("wget" "podman" "jq" "md5sum" "python3")
     for cmd in "${required_commands[@]}"; do
         if ! command -v "$cmd" &>/dev/null; then
             error_exit "Required command not found: $cmd"
@@ -127,124 +129,31 @@ create_directories() {
     success "Directory structure created at $ASSETS_DIR"
 }
 
-# Download container images
-download_container_images() {
-    log "Downloading container images..."
-
-    local containers_dir="$ASSETS_DIR/containers"
-
-    # Array of container images (registry/image:tag|filename)
-    local images=(
-        "docker.io/portainer/portainer-ce:latest|portainer-ce-latest.tar"
-        "docker.io/adguard/adguardhome:latest|adguard-home-latest.tar"
-        "docker.io/b4bz/homer:latest|homer-latest.tar"
-        "docker.io/semaphoreui/semaphore:latest|semaphore-base-latest.tar"
-        "docker.io/caddy:2-alpine|caddy-base-2-alpine.tar"
-    )
-
-    for image_spec in "${images[@]}"; do
-        local image="${image_spec%|*}"
-        local filename="${image_spec#*|}"
-        local filepath="$containers_dir/$filename"
-
-        if [[ -f "$filepath" ]]; then
-            info "Container image already exists: $filename"
-            continue
-        fi
-
-        info "Pulling container image: $image"
-        if podman pull "$image" 2>&1 | tee -a "$LOG_FILE"; then
-            info "Saving container image to: $filename"
-            if podman save -o "$filepath" "$image" 2>&1 | tee -a "$LOG_FILE"; then
-                success "Saved: $filename ($(du -h "$filepath" | cut -f1))"
-            else
-                error "Failed to save: $filename"
-            fi
-        else
-            error "Failed to pull: $image"
-        fi
-    done
+# Download container images, VM images and source code
+# Parallel, resumable and checksum-verified (see fetch-assets.py)
+fetch_assets() {
+    log "Fetching container images, VM images and source code..."
 
-    success "Container images download complete"
-}
-
-# Download VM images
-download_vm_images() {
-    log "Downloading VM images..."
-
-    # Debian cloud image
-    local debian_url="https://cloud.debian.org/images/cloud/trixie/latest/debian-13-genericcloud-amd64.qcow2"
-    local debian_file="$ASSETS_DIR/images/debian-13-genericcloud-amd64.qcow2"
-
-    if [[ -f "$debian_file" ]]; then
-        info "Debian cloud image already exists"
+    if python3 "$SCRIPT_DIR/fetch-assets.py" \
+        --assets-dir "$ASSETS_DIR" \
+        --manifest "$MANIFEST_FILE" 2>&1 | tee -a "$LOG_FILE"; then
+        success "Asset fetch complete"
     else
-        info "Downloading Debian 13 cloud image (~400MB)..."
-        if wget --progress=bar:force -O "$debian_file" "$debian_url" 2>&1 | tee -a "$LOG_FILE"; then
-            success "Downloaded: debian-13-genericcloud-amd64.qcow2 ($(du -h "$debian_file" | cut -f1))"
-        else
-            error "Failed to download Debian cloud image"
-            rm -f "$debian_file"
-        fi
-    fi
-
-    # OPNsense template
-    local opnsense_url="https://github.com/Rasped/privatebox/releases/download/v1.0.2-opnsense/vzdump-qemu-105-opnsense.vma.zst"
-    local opnsense_file="$ASSETS_DIR/templates/vzdump-qemu-105-opnsense.vma.zst"
-    local opnsense_md5="c6d251e1c62f065fd28d720572f8f943"
-
-    if [[ -f "$opnsense_file" ]]; then
-        info "OPNsense template already exists, verifying checksum..."
-        local existing_md5=$(md5sum "$opnsense_file" | awk '{print $1}')
-        if [[ "$existing_md5" == "$opnsense_md5" ]]; then
-            success "OPNsense template verified (MD5 match)"
-        else
-            warning "OPNsense template MD5 mismatch, re-downloading..."
-            rm -f "$opnsense_file"
-        fi
+        error "Some assets failed to download (re-run to resume)"
     fi
-
-    if [[ ! -f "$opnsense_file" ]]; then
-        info "Downloading OPNsense template (~767MB, this may take several minutes)..."
-        if wget --progress=bar:force -O "$opnsense_file" "$opnsense_url" 2>&1 | tee -a "$LOG_FILE"; then
-            # Verify MD5
-            local downloaded_md5=$(md5sum "$opnsense_file" | awk '{print $1}')
-            if [[ "$downloaded_md5" == "$opnsense_md5" ]]; then
-                success "Downloaded and verified: vzdump-qemu-105-opnsense.vma.zst ($(du -h "$opnsense_file" | cut -f1))"
-            else
-                error "OPNsense template MD5 verification failed"
-                error "Expected: $opnsense_md5, Got: $downloaded_md5"
-                rm -f "$opnsense_file"
-            fi
-        else
-            error "Failed to download OPNsense template"
-            rm -f "$opnsense_file"
-        fi
-    fi
-
-    success "VM images download complete"
 }
 
-# Download source code
-download_source_code() {
-    log "Downloading PrivateBox source code..."
-
-    local repo_url="https://github.com/Rasped/privatebox/archive/refs/heads/main.tar.gz"
-    local repo_file="$ASSETS_DIR/source/privatebox-main.tar.gz"
+# Record size/mtime/inode and digests so later health checks only re-hash changed files
+build_integrity_index() {
+    log "Building integrity index..."
 
-    if [[ -f "$repo_file" ]]; then
-        info "PrivateBox source already exists"
+    if python3 "$SCRIPT_DIR/verify-assets.py" build \
+        --assets-dir "$ASSETS_DIR" \
+        --manifest "$MANIFEST_FILE" 2>&1 | tee -a "$LOG_FILE"; then
+        success "Integrity index written to $ASSETS_DIR/integrity-index.json"
     else
-        info "Downloading PrivateBox repository..."
-        if wget --progress=bar:force -O "$repo_file" "$repo_url" 2>&1 | tee -a "$LOG_FILE"; then
-            success "Downloaded: privatebox-main.tar.gz ($(du -h "$repo_file" | cut -f1))"
-        else
-            error "Failed to download PrivateBox source"
-            rm -f "$repo_file"
-        fi
+        warning "Integrity index incomplete (missing or mismatched assets)"
     fi
-
-    success "Source code download complete"
 }
 
 # Download Proxmox packages
@@ -377,7 +286,7 @@ display_summary() {
     success "All assets downloaded successfully!"
     log ""
     log "Next steps:"
-    log "  1. Verify all assets are present and checksums match"
+    log "  1. Verify assets: python3 $SCRIPT_DIR/verify-assets.py verify [--deep]"
     log "  2. Copy assets to recovery partition (future implementation)"
     log "  3. Test offline installation using these assets"
     log ""
@@ -392,10 +301,9 @@ main() {
 
     preflight_checks
     create_directories
-    download_container_images
-    download_vm_images
-    download_source_code
+    fetch_assets
     download_proxmox_packages
+    build_integrity_index
     display_summary
 }
 
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+PrivateBox asset fetcher.
+Reads assets-manifest.json and fetches container images, VM images and
+source archives in parallel with bounded concurrency.
+
+- HTTP downloads resume from a .part file with Range requests
+- SHA-256 (and MD5 where the manifest only lists MD5) is computed while writing
+- Assets that are already present and verified are skipped; files whose
+  size, mtime and inode match integrity-index.json (verify-assets.py) are
+  trusted without re-hashing
+- Every finished asset gets a sha256sum-compatible sidecar (<file>.sha256)
+
+Proxmox .deb packages are still handled by download-assets.sh (apt-get).
+
+Usage: ./fetch-assets.py [--assets-dir /var/privatebox/assets] [--jobs 4] [--image-jobs 2]
+"""
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+DEFAULT_MANIFEST = SCRIPT_DIR / "assets-manifest.json"
+DEFAULT_ASSETS_DIR = os.environ.get("ASSETS_DIR", "/var/privatebox/assets")
+CHUNK_SIZE = 1024 * 1024
+INDEX_NAME = "integrity-index.json"  # Shared with verify-assets.py
+INDEX_VERSION = 1
+
+_print_lock = threading.Lock()
+
+
+def log(symbol, message):
+    with _print_lock:
+        print(f"{symbol} {message}", flush=True)
+
+
+class Asset:
+    """One downloadable or exportable file described by the manifest."""
+
+    def __init__(self, name, kind, dest, url=None, image=None, sha256=None, md5=None):
+        self.name = name
+        self.kind = kind  # "http" or "image"
+        self.dest = Path(dest)
+        self.url = url
+        self.image = image
+        self.sha256 = sha256
+        self.md5 = md5
+
+    @property
+    def sidecar(self):
+        return self.dest.with_name(self.dest.name + ".sha256")
+
+    @property
+    def part(self):
+        return self.dest.with_name(self.dest.name + ".part")
+
+
+def load_assets(manifest_path, assets_dir):
+    """Flatten the manifest sections into a list of Assets."""
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    assets_dir = Path(assets_dir)
+    assets = []
+
+    for entry in manifest.get("container_images", {}).get("base_images", []):
+        image = f"{entry['registry']}/{entry['image']}:{entry['tag']}"
+        assets.append(Asset(entry["name"], "image", assets_dir / "containers" / entry["filename"],
+                            image=image, sha256=entry.get("sha256")))
+
+    for entry in manifest.get("vm_images", {}).get("images", []):
+        subdir = "templates" if entry.get("format") == "vma.zst" else "images"
+        assets.append(Asset(entry["name"], "http", assets_dir / subdir / entry["filename"],
+                            url=entry["url"], sha256=entry.get("sha256"), md5=entry.get("md5")))
+
+    gpg = manifest.get("proxmox_packages", {}).get("gpg_key")
+    if gpg:
+        assets.append(Asset("proxmox-gpg-key", "http",
+                            assets_dir / "proxmox" / Path(gpg["url"]).name,
+                            url=gpg["url"], sha256=gpg.get("sha256"), md5=gpg.get("md5")))
+
+    repo = manifest.get("source_code", {}).get("repository")
+    if repo:
+        url = f"{repo['url']}/archive/refs/heads/{repo['branch']}.tar.gz"
+        assets.append(Asset(repo["name"], "http", assets_dir / "source" / repo["filename"],
+                            url=url, sha256=repo.get("sha256")))
+
+    return assets
+
+
+# ============================================
+# Verification
+# ============================================
+
+def hash_file(path, want_md5=False):
+    """Return (sha256, md5 or None) of a file."""
+    sha = hashlib.sha256()
+    md5 = hashlib.md5() if want_md5 else None
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha.update(chunk)
+            if md5:
+                md5.update(chunk)
+    return sha.hexdigest(), md5.hexdigest() if md5 else None
+
+
+def read_sidecar(asset):
+    try:
+        return asset.sidecar.read_text().split()[0]
+    except (OSError, IndexError):
+        return None
+
+
+def write_sidecar(asset, sha256):
+    asset.sidecar.write_text(f"{sha256}  {asset.dest.name}\n")
+
+
+def check_digests(asset, sha256, md5):
+    """Return an error string when digests do not match the manifest."""
+    if asset.sha256 and sha256 != asset.sha256:
+        return f"SHA256 mismatch (expected {asset.sha256}, got {sha256})"
+    if asset.md5 and md5 != asset.md5:
+        return f"MD5 mismatch (expected {asset.md5}, got {md5})"
+    return None
+
+
+def stat_key(st):
+    """The stat fields that must be unchanged for a recorded digest to be trusted."""
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}
+
+
+class StatIndex:
+    """SHA-256 digests keyed by stat data, stored in verify-assets.py's integrity index.
+
+    Lets a re-run skip hashing multi-GB assets that have not changed since
+    they were last verified. Entries written here carry no chunk digests;
+    verify-assets.py build adds them.
+    """
+
+    def __init__(self, assets_dir):
+        self.assets_dir = Path(assets_dir)
+        self.path = self.assets_dir / INDEX_NAME
+        self.data = {"version": INDEX_VERSION, "files": {}}
+        self.dirty = False
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                self.data = data
+        except (OSError, ValueError):
+            pass
+
+    def _rel(self, asset):
+        return asset.dest.relative_to(self.assets_dir).as_posix()
+
+    def lookup(self, asset):
+        """Recorded SHA-256 of the asset, or None when the file changed since."""
+        entry = self.data["files"].get(self._rel(asset))
+        if entry and entry.get("stat") == stat_key(asset.dest.stat()):
+            return entry.get("sha256")
+        return None
+
+    def record(self, asset, sha256):
+        entry = {"stat": stat_key(asset.dest.stat()), "sha256": sha256, "chunks": None}
+        with self._lock:
+            self.data["files"][self._rel(asset)] = entry
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty or not self.assets_dir.is_dir():
+            return
+        self.data["updated"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        fd, tmp = tempfile.mkstemp(dir=self.assets_dir, prefix=".integrity-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.data, f, indent=2, sort_keys=True)
+            f.write("\n")
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+def is_verified(asset, index):
+    """True when the asset exists and matches the manifest or its sidecar."""
+    if not asset.dest.is_file():
+        return False
+    expected = asset.sha256 or read_sidecar(asset)
+    if not expected and not asset.md5:
+        # Present but never verified; fetch again so it gets a checksum
+        return False
+    if expected and index.lookup(asset) == expected:
+        # Unchanged since it was last hashed; MD5 was checked back then too
+        if not asset.sidecar.exists():
+            write_sidecar(asset, expected)
+        return True
+    sha256, md5 = hash_file(asset.dest, want_md5=bool(asset.md5))
+    if check_digests(asset, sha256, md5) or (expected and sha256 != expected):
+        return False
+    if not asset.sidecar.exists():
+        write_sidecar(asset, sha256)
+    index.record(asset, sha256)
+    return True
+
+
+# ============================================
+# Fetchers
+# ============================================
+
+def download(asset, retries=3, timeout=30):
+    """Download asset.url, resuming any .part file, hashing while writing."""
+    for attempt in range(1, retries + 1):
+        sha = hashlib.sha256()
+        md5 = hashlib.md5() if asset.md5 else None
+        offset = asset.part.stat().st_size if asset.part.exists() else 0
+
+        # Bring the hash state up to date with the bytes already on disk
+        if offset:
+            with open(asset.part, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    sha.update(chunk)
+                    if md5:
+                        md5.update(chunk)
+
+        request = urllib.request.Request(asset.url, headers={"User-Agent": "privatebox-fetch-assets"})
+        if offset:
+            request.add_header("Range", f"bytes={offset}-")
+
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                if offset and response.status != 206:
+                    # Server ignored the Range header; start over
+                    offset = 0
+                    sha = hashlib.sha256()
+                    md5 = hashlib.md5() if asset.md5 else None
+                mode = "ab" if offset else "wb"
+                if offset:
+                    log("→", f"{asset.name}: resuming at {offset // (1024 * 1024)} MB")
+                expected = int(response.headers.get("Content-Length") or -1)
+                received = 0
+                with open(asset.part, mode) as out:
+                    for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                        out.write(chunk)
+                        sha.update(chunk)
+                        if md5:
+                            md5.update(chunk)
+                        received += len(chunk)
+                if 0 <= received < expected:
+                    raise http.client.IncompleteRead(b"", expected - received)
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset:
+                # Range not satisfiable: the .part is already complete (or bogus)
+                pass
+            else:
+                log("⚠", f"{asset.name}: HTTP {e.code} (attempt {attempt}/{retries})")
+                time.sleep(2 ** attempt)
+                continue
+        except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+            log("⚠", f"{asset.name}: {e} (attempt {attempt}/{retries}), will resume")
+            time.sleep(2 ** attempt)
+            continue
+
+        sha256, md5_hex = sha.hexdigest(), md5.hexdigest() if md5 else None
+        error = check_digests(asset, sha256, md5_hex)
+        if error:
+            # Corrupt data cannot be resumed; discard and retry from zero
+            asset.part.unlink()
+            log("⚠", f"{asset.name}: {error} (attempt {attempt}/{retries})")
+            continue
+
+        os.replace(asset.part, asset.dest)
+        write_sidecar(asset, sha256)
+        return None
+
+    return f"download failed after {retries} attempts"
+
+
+def export_image(asset):
+    """podman pull + podman save to a temporary file, then hash and rename."""
+    pull = subprocess.run(["podman", "pull", "-q", asset.image], capture_output=True, text=True)
+    if pull.returncode != 0:
+        return f"podman pull failed: {pull.stderr.strip()}"
+    if asset.part.exists():
+        asset.part.unlink()
+    save = subprocess.run(["podman", "save", "--format", "docker-archive", "-o", str(asset.part), asset.image],
+                          capture_output=True, text=True)
+    if save.returncode != 0:
+        return f"podman save failed: {save.stderr.strip()}"
+    sha256, _ = hash_file(asset.part)
+    error = check_digests(asset, sha256, None)
+    if error:
+        asset.part.unlink()
+        return error
+    os.replace(asset.part, asset.dest)
+    write_sidecar(asset, sha256)
+    return None
+
+
+def fetch(asset, index):
+    """Fetch one asset; returns (asset, status, detail)."""
+    start = time.monotonic()
+    if is_verified(asset, index):
+        return asset, "skipped", "already present and verified"
+    asset.dest.parent.mkdir(parents=True, exist_ok=True)
+    log("→", f"Fetching {asset.name} ({asset.image or asset.url})")
+    error = export_image(asset) if asset.kind == "image" else download(asset)
+    if error:
+        return asset, "failed", error
+    index.record(asset, read_sidecar(asset))
+    size_mb = asset.dest.stat().st_size / (1024 * 1024)
+    return asset, "fetched", f"{size_mb:.0f} MB in {time.monotonic() - start:.1f} s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch PrivateBox recovery assets in parallel")
+    parser.add_argument("--assets-dir", default=DEFAULT_ASSETS_DIR)
+    parser.add_argument("--manifest", default=str(DEFAULT_MANIFEST))
+    parser.add_argument("--jobs", type=int, default=4, help="Concurrent HTTP downloads (default: %(default)s)")
+    parser.add_argument("--image-jobs", type=int, default=2,
+                        help="Concurrent podman pull/save exports (default: %(default)s)")
+    parser.add_argument("--only", action="append", help="Fetch only the named asset (repeatable)")
+    args = parser.parse_args()
+
+    assets = load_assets(args.manifest, args.assets_dir)
+    if args.only:
+        assets = [a for a in assets if a.name in args.only]
+
+    if any(a.kind == "image" for a in assets) and not shutil.which("podman"):
+        log("✗", "podman not found; container images cannot be exported")
+        sys.exit(1)
+
+    print("=== PrivateBox Asset Fetcher ===")
+    print(f"Assets directory: {args.assets_dir}")
+    print(f"Assets: {len(assets)}  (http jobs: {args.jobs}, image jobs: {args.image_jobs})")
+
+    start = time.monotonic()
+    index = StatIndex(args.assets_dir)
+    results = {"fetched": [], "skipped": [], "failed": []}
+    # Separate pools so slow podman exports do not starve HTTP downloads
+    with ThreadPoolExecutor(max_workers=args.jobs) as http_pool, \
+            ThreadPoolExecutor(max_workers=args.image_jobs) as image_pool:
+        futures = [(image_pool if a.kind == "image" else http_pool).submit(fetch, a, index) for a in assets]
+        for future in as_completed(futures):
+            asset, status, detail = future.result()
+            results[status].append(asset)
+            symbol = {"fetched": "✓", "skipped": "✓", "failed": "✗"}[status]
+            log(symbol, f"{asset.dest.name}: {detail}")
+    index.save()
+
+    print("\n=== Summary ===")
+    print(f"Fetched: {len(results['fetched'])}  skipped: {len(results['skipped'])}  "
+          f"failed: {len(results['failed'])}  ({time.monotonic() - start:.1f} s)")
+    if results["failed"]:
+        for asset in results["failed"]:
+            print(f"  ✗ {asset.name}")
+        print("Re-run to resume interrupted downloads.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
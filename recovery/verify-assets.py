@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+PrivateBox recovery asset integrity index.
+Keeps integrity-index.json next to the assets with size, mtime, inode and
+SHA-256 for every file listed in assets-manifest.json, plus chunk digests
+for large files.
+
+- build          Create or refresh the index (only changed files are hashed)
+- verify         Re-hash only files whose stat data changed since indexing
+- verify --deep  Verify every chunk, in parallel across cores via mmap
+
+Usage:
+    ./verify-assets.py build  [--assets-dir /var/privatebox/assets]
+    ./verify-assets.py verify [--deep] [--jobs N]
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+DEFAULT_MANIFEST = SCRIPT_DIR / "assets-manifest.json"
+DEFAULT_ASSETS_DIR = os.environ.get("ASSETS_DIR", "/var/privatebox/assets")
+INDEX_NAME = "integrity-index.json"
+INDEX_VERSION = 1
+CHUNK_SIZE = 64 * 1024 * 1024  # Files larger than one chunk get chunk digests
+READ_SIZE = 1024 * 1024
+
+
+def manifest_files(manifest_path):
+    """Relative asset paths from the manifest, with any expected SHA-256."""
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    files = {}
+    for entry in manifest.get("container_images", {}).get("base_images", []):
+        files[f"containers/{entry['filename']}"] = entry.get("sha256")
+    for entry in manifest.get("vm_images", {}).get("images", []):
+        subdir = "templates" if entry.get("format") == "vma.zst" else "images"
+        files[f"{subdir}/{entry['filename']}"] = entry.get("sha256")
+    gpg = manifest.get("proxmox_packages", {}).get("gpg_key")
+    if gpg:
+        files[f"proxmox/{Path(gpg['url']).name}"] = gpg.get("sha256")
+    repo = manifest.get("source_code", {}).get("repository")
+    if repo:
+        files[f"source/{repo['filename']}"] = repo.get("sha256")
+    return files
+
+
+def stat_key(st):
+    """The stat fields that must be unchanged for a cached digest to be trusted."""
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}
+
+
+# ============================================
+# Hashing
+# ============================================
+
+def hash_range(path, offset, length):
+    """SHA-256 of one byte range through a memory-mapped read."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            # hashlib releases the GIL on large buffers, so threads use all cores
+            for start in range(offset, offset + length, READ_SIZE):
+                sha.update(view[start:min(start + READ_SIZE, offset + length)])
+        finally:
+            view.release()
+    return sha.hexdigest()
+
+
+def chunk_ranges(size):
+    return [(offset, min(CHUNK_SIZE, size - offset)) for offset in range(0, size, CHUNK_SIZE)]
+
+
+def hash_file(path, size, pool):
+    """Return (sha256, chunk digests or None).
+
+    Chunk digests are computed on the pool while this thread streams the
+    whole-file digest.
+    """
+    futures = None
+    if size > CHUNK_SIZE:
+        futures = [pool.submit(hash_range, path, offset, length) for offset, length in chunk_ranges(size)]
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_SIZE), b""):
+            sha.update(block)
+    chunks = [future.result() for future in futures] if futures else None
+    return sha.hexdigest(), chunks
+
+
+# ============================================
+# Index
+# ============================================
+
+class IntegrityIndex:
+    def __init__(self, assets_dir):
+        self.assets_dir = Path(assets_dir)
+        self.path = self.assets_dir / INDEX_NAME
+        self.entries = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                self.entries = data.get("files", {})
+
+    def save(self):
+        fd, tmp = tempfile.mkstemp(dir=self.assets_dir, prefix=".integrity-")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"version": INDEX_VERSION, "chunk_size": CHUNK_SIZE,
+                       "updated": time.strftime("%Y-%m-%dT%H:%M:%S"), "files": self.entries},
+                      f, indent=2, sort_keys=True)
+            f.write("\n")
+        os.replace(tmp, self.path)
+
+
+def build(index, files, pool):
+    """Index every manifest file, hashing only new or changed ones."""
+    problems = 0
+    for rel, expected in sorted(files.items()):
+        path = index.assets_dir / rel
+        if not path.is_file():
+            print(f"⚠ {rel}: missing, not indexed")
+            index.entries.pop(rel, None)
+            problems += 1
+            continue
+        st = path.stat()
+        entry = index.entries.get(rel)
+        # fetch-assets.py records digests without chunks; hash those once to add them
+        if entry and entry["stat"] == stat_key(st) and (entry.get("chunks") or st.st_size <= CHUNK_SIZE):
+            print(f"✓ {rel}: unchanged")
+            continue
+        sha256, chunks = hash_file(path, st.st_size, pool)
+        if expected and sha256 != expected:
+            print(f"✗ {rel}: SHA256 does not match manifest, not indexed")
+            index.entries.pop(rel, None)
+            problems += 1
+            continue
+        index.entries[rel] = {"stat": stat_key(st), "sha256": sha256, "chunks": chunks}
+        print(f"✓ {rel}: indexed ({st.st_size // (1024 * 1024)} MB)")
+    index.save()
+    return problems
+
+
+def verify(index, files, pool, deep):
+    """Check every manifest file against the index; returns the number of problems."""
+    problems = 0
+    cached = rehashed = 0
+    for rel in sorted(files):
+        path = index.assets_dir / rel
+        entry = index.entries.get(rel)
+        if not entry:
+            print(f"✗ {rel}: not in index (run build)")
+            problems += 1
+            continue
+        if not path.is_file():
+            print(f"✗ {rel}: missing")
+            problems += 1
+            continue
+        st = path.stat()
+        if st.st_size != entry["stat"]["size"]:
+            print(f"✗ {rel}: size changed ({entry['stat']['size']} → {st.st_size})")
+            problems += 1
+            continue
+
+        if deep and entry.get("chunks"):
+            ranges = chunk_ranges(st.st_size)
+            digests = list(pool.map(lambda r: hash_range(path, *r), ranges))
+            bad = [i for i, (got, want) in enumerate(zip(digests, entry["chunks"])) if got != want]
+            rehashed += 1
+            if bad:
+                print(f"✗ {rel}: {len(bad)} corrupt chunk(s) at offset(s) "
+                      + ", ".join(str(i * CHUNK_SIZE) for i in bad[:5]))
+                problems += 1
+                continue
+        elif deep or entry["stat"] != stat_key(st):
+            sha256, _ = hash_file(path, 0, pool)
+            rehashed += 1
+            if sha256 != entry["sha256"]:
+                print(f"✗ {rel}: content changed (SHA256 mismatch)")
+                problems += 1
+                continue
+        else:
+            cached += 1
+            continue
+
+        # Content is intact; refresh stat data (e.g. after a copy) so the next run is fast
+        entry["stat"] = stat_key(st)
+        print(f"✓ {rel}: verified")
+
+    index.save()
+    print(f"\n{len(files) - problems} of {len(files)} file(s) OK "
+          f"({cached} from cache, {rehashed} re-hashed)")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Integrity index for PrivateBox recovery assets")
+    parser.add_argument("command", choices=["build", "verify"])
+    parser.add_argument("--assets-dir", default=DEFAULT_ASSETS_DIR)
+    parser.add_argument("--manifest", default=str(DEFAULT_MANIFEST))
+    parser.add_argument("--deep", action="store_true", help="Re-hash everything (chunks in parallel)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Parallel chunk hashers (default: CPU count)")
+    args = parser.parse_args()
+
+    files = manifest_files(args.manifest)
+    index = IntegrityIndex(args.assets_dir)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        if args.command == "build":
+            problems = build(index, files, pool)
+        else:
+            problems = verify(index, files, pool, args.deep)
+    print(f"Completed in {time.monotonic() - start:.1f} s")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Shared helpers for the tests.
+The tools are standalone scripts with hyphenated names, so they are loaded
+from their path instead of imported as packages.
+"""
+import importlib.util
+import sys
+import threading
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+def load_script(relative_path, name=None):
+    """Import a script from the repository by its path, e.g. 'tools/health-check.py'."""
+    path = REPO / relative_path
+    name = name or path.stem.replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    # Registered before executing so dataclasses and pickling can find the module
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get("Range")))
+        if self.path not in server.files:
+            self.send_error(404)
+            return
+        fault = server.faults.pop(0) if server.faults else None
+        data = server.files[self.path]
+        body, status = data, 200
+        range_header = self.headers.get("Range")
+        if range_header and fault != "ignore-range":
+            start = int(range_header.split("=")[1].rstrip("-"))
+            if start >= len(data):
+                self.send_error(416)
+                return
+            body, status = data[start:], 206
+        if fault == "corrupt":
+            body = bytes([body[0] ^ 0xFF]) + body[1:]
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {len(data) - len(body)}-{len(data) - 1}/{len(data)}")
+        self.end_headers()
+        if fault == "drop":
+            # Announce the full length but hang up halfway through
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInHTTPServer(ThreadingHTTPServer):
+    """Local file server with Range support for download tests.
+
+    files maps URL paths to bytes. Each request pops one entry from faults:
+    "drop" (close halfway), "corrupt" (flip the first byte), "ignore-range"
+    (answer 200 with the whole file) or None. requests records
+    (path, Range header) per request.
+    """
+
+    def __init__(self, files):
+        super().__init__(("127.0.0.1", 0), _StandInHandler)
+        self.files = files
+        self.faults = []
+        self.requests = []
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server_port}{path}"
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+def load_ansible_module(name):
+    """Import a module from ansible/playbooks/services/library for its helper functions.
+
+    Ansible itself is not needed to test those, so a placeholder for
+    ansible.module_utils.basic is registered when it is not installed.
+    """
+    try:
+        import ansible.module_utils.basic  # noqa: F401
+    except ImportError:
+        basic = types.ModuleType("ansible.module_utils.basic")
+        basic.AnsibleModule = None
+        for package in ("ansible", "ansible.module_utils"):
+            sys.modules.setdefault(package, types.ModuleType(package))
+        sys.modules["ansible.module_utils.basic"] = basic
+    return load_script(f"ansible/playbooks/services/library/{name}.py")
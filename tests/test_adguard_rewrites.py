@@ -0,0 +1,85 @@
+"""adguard_rewrites client against a local stand-in AdGuard API."""
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from helpers import load_ansible_module
+
+rewrites = load_ansible_module("adguard_rewrites")
+
+
+class AdGuardHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(("GET", self.path))
+        self.reply(self.server.rewrites)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(("POST", self.path))
+        pair = {"domain": body["domain"], "answer": body["answer"]}
+        if self.path.endswith("/add"):
+            self.server.rewrites.append(pair)
+        elif pair in self.server.rewrites:
+            self.server.rewrites.remove(pair)
+        if self.server.drop_writes:
+            # Applied, but the connection is lost before the answer arrives
+            self.server.drop_writes -= 1
+            self.close_connection = True
+            return
+        self.reply(None)
+
+    def reply(self, data):
+        body = json.dumps(data).encode() if data is not None else b""
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class AdGuardClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), AdGuardHandler)
+        self.server.rewrites = [{"domain": "proxmox.lan", "answer": "10.10.20.20"}]
+        self.server.requests = []
+        self.server.drop_writes = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = rewrites.AdGuardClient(f"http://127.0.0.1:{self.server.server_port}", "admin", "secret")
+        self.addCleanup(self.client.close)
+
+    def posts(self):
+        return [path for method, path in self.server.requests if method == "POST"]
+
+    def test_dropped_add_is_not_sent_twice(self):
+        self.server.drop_writes = 1
+        self.client.add("proxmox.lan", "10.10.20.10")
+        self.assertEqual(self.posts(), ["/control/rewrite/add"])
+        self.assertEqual(self.server.rewrites.count({"domain": "proxmox.lan", "answer": "10.10.20.10"}), 1)
+
+    def test_dropped_delete_is_not_sent_twice(self):
+        self.server.drop_writes = 1
+        self.client.delete("proxmox.lan", "10.10.20.20")
+        self.assertEqual(self.posts(), ["/control/rewrite/delete"])
+        self.assertEqual(self.server.rewrites, [])
+
+    def test_reconciles_over_one_connection(self):
+        existing = self.client.list_rewrites()
+        to_remove, to_add = rewrites.compute_changes(
+            existing, [{"domain": "proxmox.lan", "answer": "10.10.20.10"}], [], exclusive=True)
+        for pair in to_remove:
+            self.client.delete(*pair)
+        for pair in to_add:
+            self.client.add(*pair)
+        self.assertEqual(self.server.rewrites, [{"domain": "proxmox.lan", "answer": "10.10.20.10"}])
+        self.assertEqual(self.posts(), ["/control/rewrite/delete", "/control/rewrite/add"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+"""asset-store.py ingest and export round trip and garbage collection."""
+import io
+import os
+import tarfile
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from helpers import load_script
+
+store_mod = load_script("recovery/asset-store.py")
+
+BASE_LAYER = os.urandom(300 * 1024)
+METADATA = {
+    "manifest.json": b'[{"Config":"config.json","Layers":["base/layer.tar","app/layer.tar"]}]',
+    "config.json": b'{"architecture":"amd64"}',
+}
+SHARED_BYTES = len(BASE_LAYER) + sum(len(data) for data in METADATA.values())
+
+
+def image_archive(path, app_layer):
+    """A docker-archive shaped like podman save output, sharing its base layer."""
+    files = {
+        **METADATA,
+        "base/layer.tar": BASE_LAYER,
+        "app/layer.tar": app_layer,
+    }
+    with tarfile.open(path, "w") as tar:
+        for directory in ("base", "app"):
+            info = tarfile.TarInfo(directory)
+            info.type, info.mode, info.mtime = tarfile.DIRTYPE, 0o755, 1760000000
+            tar.addfile(info)
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size, info.mode, info.mtime = len(data), 0o644, 1760000000
+            tar.addfile(info, io.BytesIO(data))
+        info = tarfile.TarInfo("app/VERSION")
+        info.type, info.linkname = tarfile.SYMTYPE, "../base/layer.tar"
+        tar.addfile(info)
+    return path
+
+
+def members(archive):
+    """Name, type, mode, mtime, link target and content of every member."""
+    with tarfile.open(fileobj=archive) as tar:
+        return [(m.name, m.type, m.mode, m.mtime, m.linkname,
+                 tar.extractfile(m).read() if m.isfile() else None) for m in tar]
+
+
+class IngestExportTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        self.store = store_mod.AssetStore(self.tmp / "store")
+        self.archive = image_archive(self.tmp / "adguard.tar", b"adguard" * 1000)
+
+    def export(self, name, store=None):
+        out = io.BytesIO()
+        (store or self.store).export(name, out)
+        out.seek(0)
+        return out
+
+    def test_round_trip(self):
+        image = "docker.io/adguard/adguardhome:v0.107"
+        new_blobs, new_bytes, reused = self.store.ingest("adguard", self.archive, image)
+        self.assertEqual((new_blobs, reused), (4, 0))
+        self.assertEqual(new_bytes, SHARED_BYTES + 7000)
+        with open(self.archive, "rb") as original:
+            self.assertEqual(members(self.export("adguard")), members(original))
+        # A fresh instance reads the same index from disk
+        reopened = store_mod.AssetStore(self.tmp / "store")
+        self.assertEqual(reopened.index["images"]["adguard"]["image"], image)
+        self.assertEqual(self.export("adguard", reopened).getvalue(), self.export("adguard").getvalue())
+        self.assertEqual(reopened.verify(), [])
+
+    def test_identical_archive_is_deduplicated(self):
+        self.store.ingest("adguard", self.archive)
+        blobs = sorted(self.store.blob_dir.glob("*/*"))
+        copy = self.tmp / "copy.tar"
+        copy.write_bytes(self.archive.read_bytes())
+
+        new_blobs, new_bytes, reused = self.store.ingest("adguard-copy", copy)
+        self.assertEqual((new_blobs, new_bytes), (0, 0))
+        self.assertEqual(reused, SHARED_BYTES + 7000)
+        self.assertEqual(sorted(self.store.blob_dir.glob("*/*")), blobs)
+        self.assertEqual(self.export("adguard-copy").getvalue(), self.export("adguard").getvalue())
+
+    def test_shared_base_layer_stored_once(self):
+        self.store.ingest("adguard", self.archive)
+        other = image_archive(self.tmp / "portainer.tar", b"portainer" * 1000)
+        new_blobs, new_bytes, reused = self.store.ingest("portainer", other)
+        # Only the app layer is new; base layer, config and manifest are shared
+        self.assertEqual((new_blobs, new_bytes, reused), (1, 9000, SHARED_BYTES))
+        with open(other, "rb") as original:
+            self.assertEqual(members(self.export("portainer")), members(original))
+
+    def test_gc_waits_for_a_running_ingest(self):
+        self.store.ingest("adguard", self.archive)
+        del self.store.index["images"]["adguard"]
+        self.store.save_index()
+        # The blobs are now unreferenced; a second ingest is about to reuse them
+        found, resume = threading.Event(), threading.Event()
+        put_stream = store_mod.AssetStore.put_stream
+
+        def slow_put_stream(store, stream):
+            result = put_stream(store, stream)
+            found.set()
+            resume.wait(5)
+            return result
+
+        with mock.patch.object(store_mod.AssetStore, "put_stream", slow_put_stream):
+            ingest = threading.Thread(target=self.store.ingest, args=("adguard", self.archive))
+            ingest.start()
+            self.assertTrue(found.wait(5))
+            gc_store = store_mod.AssetStore(self.tmp / "store")
+            gc = threading.Thread(target=gc_store.gc)
+            gc.start()
+            gc.join(0.3)
+            self.assertTrue(gc.is_alive())
+            resume.set()
+            ingest.join(5)
+            gc.join(5)
+
+        self.assertEqual(store_mod.AssetStore(self.tmp / "store").verify(), [])
+        with open(self.archive, "rb") as original:
+            self.assertEqual(members(self.export("adguard")), members(original))
+
+
+class GcTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = store_mod.AssetStore(self.tmp.name)
+
+    def put(self, data):
+        digest, _, _ = self.store.put_stream(io.BytesIO(data))
+        return self.store.blob_path(digest)
+
+    def test_keeps_referenced_blobs_and_recent_temp_files(self):
+        kept = self.put(b"layer")
+        orphan = self.put(b"orphan")
+        self.store.index["images"]["adguard"] = {
+            "members": [{"type": "file", "digest": kept.name, "size": 5}]}
+        self.store.save_index()
+        # One temp file per writer: put_stream and sync_from
+        writing = [self.store.blob_dir / ".incoming-abc123", kept.parent / ".incoming-deadbeef"]
+        for path in writing:
+            path.write_bytes(b"partial")
+
+        self.assertEqual(self.store.gc(), (1, 6))
+        self.assertTrue(kept.exists())
+        self.assertFalse(orphan.exists())
+        self.assertTrue(all(path.exists() for path in writing))
+
+    def test_sweeps_abandoned_temp_files(self):
+        stale = self.store.blob_dir / ".incoming-abc123"
+        stale.parent.mkdir(parents=True)
+        stale.write_bytes(b"partial")
+        old = time.time() - store_mod.INCOMING_GRACE - 60
+        os.utime(stale, (old, old))
+
+        self.assertEqual(self.store.gc(), (1, 7))
+        self.assertFalse(stale.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""benchmark-dns-stack.py against a local UDP stand-in resolver."""
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+from helpers import REPO, load_script
+
+bench = load_script("tools/benchmark-dns-stack.py")
+
+BLOCKED = "blocked.example"
+TRUNCATED = "truncated.example"
+
+
+class StandInResolver(threading.Thread):
+    """Answers A queries with 192.0.2.1, 0.0.0.0 for BLOCKED and a cut-off packet for TRUNCATED."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.address = "127.0.0.1:%d" % self.sock.getsockname()[1]
+
+    def run(self):
+        while True:
+            try:
+                query, peer = self.sock.recvfrom(512)
+            except OSError:
+                return
+            question = query[12:]
+            labels, offset = [], 0
+            while question[offset]:
+                labels.append(question[offset + 1:offset + 1 + question[offset]].decode())
+                offset += question[offset] + 1
+            domain = ".".join(labels)
+            address = "0.0.0.0" if domain == BLOCKED else "192.0.2.1"
+            header = struct.pack(">HHHHHH", struct.unpack(">H", query[:2])[0], 0x8180, 1, 1, 0, 0)
+            answer = b"\xc0\x0c" + struct.pack(">HHIH", 1, 1, 60, 4) + socket.inet_aton(address)
+            response = header + question + answer
+            if domain == TRUNCATED:
+                response = response[:-6]
+            self.sock.sendto(response, peer)
+
+    def close(self):
+        self.sock.close()
+
+
+class BenchmarkTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInResolver()
+        self.server.start()
+        self.resolver = bench.Resolver("Stand-in", self.server.address, timeout=1.0)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_query_returns_addresses(self):
+        _, rcode, addresses = self.resolver.query("example.org")
+        self.assertEqual((rcode, addresses), (0, ["192.0.2.1"]))
+
+    def test_validate_detects_blocking(self):
+        self.assertEqual(bench.validate(self.resolver, "example.org", [BLOCKED], True), 0)
+
+    def test_benchmark_counts_malformed_answers_as_errors(self):
+        domains = ["a.example", "b.example", TRUNCATED]
+        stats, _ = bench.benchmark(self.resolver, domains, 30, 4)
+        self.assertEqual(stats.completed, 22)
+        self.assertEqual(stats.errors, {"ValueError": 11})
+
+    def test_parse_response_rejects_garbage(self):
+        query = bench.build_query(7, "example.org")
+        for packet in (b"\x00\x07" + b"\x00" * 4 + b"\x00\x01\x00\x01" + b"\x00" * 2,
+                       query[:12] + b"\x3f"):
+            with self.assertRaises(ValueError):
+                bench.parse_response(packet, 7)
+
+
+class DomainsFileTest(unittest.TestCase):
+    def test_empty_domains_file_is_rejected(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".txt") as f:
+            f.write("# only comments\n\n")
+            f.flush()
+            result = subprocess.run([sys.executable, str(REPO / "tools/benchmark-dns-stack.py"),
+                                     "--domains", f.name, "--no-unbound"],
+                                    capture_output=True, text=True, timeout=30)
+        self.assertEqual(result.returncode, 2)
+        self.assertIn("no domains in", result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+"""caddy_routes config surgery on a fixture /config/apps document."""
+import copy
+import unittest
+
+from helpers import load_ansible_module
+
+caddy = load_ansible_module("caddy_routes")
+
+
+def route(*hosts, **extra):
+    return dict({"match": [{"host": list(hosts)}], "handle": [{"handler": "subroute"}], "terminal": True}, **extra)
+
+
+# Shaped like GET /config/apps of the Caddy container: the sites from the
+# main Caddyfile, a wildcard site and the catch-all, plus an HTTP redirect server
+APPS = {
+    "http": {"servers": {
+        "srv0": {"listen": [":443"], "routes": [
+            route("proxmox.lan"),
+            route("adguard.lan"),
+            route("*.lan"),
+            {"handle": [{"handler": "static_response", "status_code": 404}]},
+        ]},
+        "srv1": {"listen": [":80"], "routes": [route("redirect.lan")]},
+    }},
+    "tls": {"automation": {"policies": [
+        {"subjects": ["proxmox.lan", "adguard.lan"], "issuers": [{"module": "internal"}]},
+        {"issuers": [{"module": "internal"}]},
+    ]}},
+}
+
+# POST /adapt of a single snippet
+ADAPTED = {
+    "apps": {
+        "http": {"servers": {"srv0": {"listen": [":443"], "routes": [route("application.lan")]}}},
+        "tls": {"automation": {"policies": [{"subjects": ["application.lan"],
+                                             "issuers": [{"module": "internal"}]}]}},
+    },
+}
+
+
+def site_hosts(apps):
+    return [caddy.route_hosts(r) for r in caddy.https_server(apps)["routes"]]
+
+
+def policies(apps):
+    return apps["tls"]["automation"]["policies"]
+
+
+class SiteConfigTest(unittest.TestCase):
+    def test_tags_route_and_policy(self):
+        site_route, policy = caddy.site_config(ADAPTED, "application.lan")
+        self.assertEqual(site_route["@id"], "privatebox-site-application.lan")
+        self.assertEqual(caddy.route_hosts(site_route), ["application.lan"])
+        self.assertEqual(policy, {"@id": "privatebox-tls-application.lan", "subjects": ["application.lan"],
+                                  "issuers": [{"module": "internal"}]})
+
+    def test_policy_narrowed_to_the_host(self):
+        adapted = copy.deepcopy(ADAPTED)
+        policies(adapted["apps"])[0]["subjects"].append("other.lan")
+        _, policy = caddy.site_config(adapted, "application.lan")
+        self.assertEqual(policy["subjects"], ["application.lan"])
+
+    def test_missing_route(self):
+        with self.assertRaises(RuntimeError):
+            caddy.site_config(ADAPTED, "portainer.lan")
+
+
+class PutSiteTest(unittest.TestCase):
+    def setUp(self):
+        self.apps = copy.deepcopy(APPS)
+
+    def put(self, host, adapted=ADAPTED):
+        caddy.put_site(self.apps, host, *caddy.site_config(adapted, host))
+
+    def test_new_site_goes_ahead_of_wildcard_and_catch_all(self):
+        self.put("application.lan")
+        self.assertEqual(site_hosts(self.apps),
+                         [["proxmox.lan"], ["adguard.lan"], ["application.lan"], ["*.lan"], []])
+        self.assertEqual(policies(self.apps)[0]["@id"], "privatebox-tls-application.lan")
+        self.assertEqual(policies(self.apps)[1:], APPS["tls"]["automation"]["policies"])
+        self.assertEqual(self.apps["http"]["servers"]["srv1"], APPS["http"]["servers"]["srv1"])
+
+    def test_new_site_goes_ahead_of_catch_all_without_wildcard(self):
+        del caddy.https_server(self.apps)["routes"][2]
+        self.put("application.lan")
+        self.assertEqual(site_hosts(self.apps), [["proxmox.lan"], ["adguard.lan"], ["application.lan"], []])
+
+    def test_existing_site_replaced_in_place(self):
+        adapted = copy.deepcopy(ADAPTED)
+        adapted["apps"]["http"]["servers"]["srv0"]["routes"] = [route("adguard.lan", handle=[{"handler": "new"}])]
+        policies(adapted["apps"])[0]["subjects"] = ["adguard.lan"]
+        self.put("adguard.lan", adapted)
+
+        routes = caddy.https_server(self.apps)["routes"]
+        self.assertEqual(site_hosts(self.apps), [["proxmox.lan"], ["adguard.lan"], ["*.lan"], []])
+        self.assertEqual(routes[1]["handle"], [{"handler": "new"}])
+        self.assertEqual(routes[1]["@id"], "privatebox-site-adguard.lan")
+
+    def test_host_split_out_of_shared_policy(self):
+        adapted = copy.deepcopy(ADAPTED)
+        adapted["apps"]["http"]["servers"]["srv0"]["routes"] = [route("adguard.lan")]
+        policies(adapted["apps"])[0]["subjects"] = ["adguard.lan"]
+        self.put("adguard.lan", adapted)
+
+        self.assertEqual([p.get("subjects") for p in policies(self.apps)],
+                         [["adguard.lan"], ["proxmox.lan"], None])
+        self.assertEqual(policies(self.apps)[0]["@id"], "privatebox-tls-adguard.lan")
+
+    def test_second_put_is_a_no_op(self):
+        self.put("application.lan")
+        once = copy.deepcopy(self.apps)
+        self.put("application.lan")
+        self.assertEqual(self.apps, once)
+
+
+class RemoveSiteTest(unittest.TestCase):
+    def setUp(self):
+        self.apps = copy.deepcopy(APPS)
+
+    def test_removes_route_and_own_policy(self):
+        caddy.put_site(self.apps, "application.lan", *caddy.site_config(ADAPTED, "application.lan"))
+        caddy.remove_site(self.apps, "application.lan")
+        self.assertEqual(self.apps, APPS)
+
+    def test_shared_policy_keeps_other_hosts(self):
+        caddy.remove_site(self.apps, "proxmox.lan")
+        self.assertEqual(site_hosts(self.apps), [["adguard.lan"], ["*.lan"], []])
+        self.assertEqual([p.get("subjects") for p in policies(self.apps)], [["adguard.lan"], None])
+
+    def test_policy_dropped_when_empty(self):
+        caddy.remove_site(self.apps, "proxmox.lan")
+        caddy.remove_site(self.apps, "adguard.lan")
+        self.assertEqual(site_hosts(self.apps), [["*.lan"], []])
+        # The catch-all policy stays; an emptied subject policy would have become a second one
+        self.assertEqual(policies(self.apps), [{"issuers": [{"module": "internal"}]}])
+
+    def test_unknown_host_changes_nothing(self):
+        caddy.remove_site(self.apps, "portainer.lan")
+        self.assertEqual(self.apps, APPS)
+
+    def test_no_https_server(self):
+        del self.apps["http"]["servers"]["srv0"]
+        with self.assertRaises(RuntimeError):
+            caddy.remove_site(self.apps, "proxmox.lan")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+"""config-backup.py chunking and a backup, restore and prune round trip."""
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from helpers import REPO, load_script
+
+SCRIPT = REPO / "tools" / "config-backup.py"
+backup = load_script("tools/config-backup.py")
+
+
+def config_xml(seed=1, items=4000):
+    """Text shaped like an OPNsense config.xml, large enough for a few dozen chunks."""
+    rng = random.Random(seed)
+    lines = [f'    <item id="{i}"><value>{rng.getrandbits(64):016x}</value></item>' for i in range(items)]
+    return ("<opnsense>\n" + "\n".join(lines) + "\n</opnsense>\n").encode()
+
+
+def edited(data, offset, insert):
+    return data[:offset] + insert + data[offset:]
+
+
+def chunks(data):
+    return list(backup.chunk_stream(io.BytesIO(data)))
+
+
+class ChunkingTest(unittest.TestCase):
+    def setUp(self):
+        self.data = config_xml()
+
+    def test_chunks_rebuild_the_input_within_bounds(self):
+        parts = chunks(self.data)
+        self.assertEqual(b"".join(parts), self.data)
+        self.assertGreater(len(parts), 10)
+        self.assertTrue(all(backup.MIN_CHUNK <= len(p) <= backup.MAX_CHUNK for p in parts[:-1]))
+
+    def test_boundaries_do_not_depend_on_read_size(self):
+        with mock.patch.object(backup, "READ_SIZE", 5000):
+            small_reads = chunks(self.data)
+        self.assertEqual(small_reads, chunks(self.data))
+
+    def test_local_edit_changes_only_nearby_chunks(self):
+        before = chunks(self.data)
+        after = chunks(edited(self.data, len(self.data) // 2, b'    <item id="new"/>\n'))
+        self.assertLessEqual(len(set(after) - set(before)), 2)
+        self.assertLessEqual(len(set(before) - set(after)), 2)
+
+    def test_empty_stream(self):
+        self.assertEqual(chunks(b""), [])
+
+
+class RoundTripTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        self.repo = self.tmp / "repo"
+        self.source = self.tmp / "source"
+        conf = self.source / "conf"
+        conf.mkdir(parents=True)
+        self.config = config_xml()
+        self.files = {
+            "conf/config.xml": self.config,
+            # A .bak identical to the live config and one from an earlier edit
+            "conf/config.xml.20261018-0200.bak": self.config,
+            "conf/config.xml.20261017-0200.bak": edited(self.config, 1000, b"<!-- old -->\n"),
+            "homer/config.yml": b"title: PrivateBox\n",
+        }
+        for name, data in self.files.items():
+            self.write(name, data, mtime=1760000000)
+        (self.source / "homer" / "current").symlink_to("config.yml")
+
+    def write(self, name, data, mtime):
+        path = self.source / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        os.utime(path, ns=(mtime * 1_000_000_000, mtime * 1_000_000_000))
+
+    def run_tool(self, *args):
+        result = subprocess.run([sys.executable, str(SCRIPT), "--repo", str(self.repo), *args],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        return result.stdout
+
+    def run_backup(self):
+        self.run_tool("backup", "--no-opnsense", "--source", str(self.source))
+        latest = backup.Repository(self.repo).snapshots()[-1]
+        return json.loads((self.repo / "snapshots" / f"{latest}.json").read_text())
+
+    def chunks_of(self, manifest, name):
+        return next(e["chunks"] for e in manifest["files"] if e["path"] == str(self.source / name))
+
+    def stored_chunks(self):
+        return {p.name for p in (self.repo / "chunks").glob("*/*")}
+
+    def restore(self, manifest, *args):
+        target = self.tmp / f"restore-{manifest['id']}"
+        self.run_tool("restore", manifest["id"], "--target", str(target), *args)
+        return target / str(self.source).lstrip("/")
+
+    def test_backup_modify_backup_restore_prune(self):
+        older_bak = self.files["conf/config.xml.20261017-0200.bak"]
+        first = self.run_backup()
+        stats = first["stats"]
+        self.assertEqual((stats["files"], stats["unchanged_files"]), (5, 0))
+        # The .bak copies are stored once: identical chunks, and only the edit is new
+        live = self.chunks_of(first, "conf/config.xml")
+        self.assertEqual(self.chunks_of(first, "conf/config.xml.20261018-0200.bak"), live)
+        older = self.chunks_of(first, "conf/config.xml.20261017-0200.bak")
+        self.assertLessEqual(len(set(older) - set(live)), 2)
+        referenced = {d for e in first["files"] for d in e.get("chunks", ())}
+        self.assertEqual(self.stored_chunks(), referenced)
+        self.assertEqual(stats["new_chunks"], len(referenced))
+        self.assertLess(stats["new_chunks"], sum(len(e.get("chunks", ())) for e in first["files"]) // 2)
+
+        # OPNsense saves an edit and rotates out the oldest .bak
+        self.files["conf/config.xml"] = edited(self.config, len(self.config) // 2, b"<!-- edit -->\n")
+        self.write("conf/config.xml", self.files["conf/config.xml"], mtime=1760086400)
+        (self.source / "conf" / "config.xml.20261017-0200.bak").unlink()
+        del self.files["conf/config.xml.20261017-0200.bak"]
+
+        second = self.run_backup()
+        stats = second["stats"]
+        # Only the edited file is read again; the others come from the files cache
+        self.assertEqual((stats["files"], stats["unchanged_files"]), (4, 2))
+        self.assertEqual(stats["read_bytes"], len(self.files["conf/config.xml"]))
+        self.assertLessEqual(stats["new_chunks"], 2)
+        self.assertEqual(self.chunks_of(second, "homer/config.yml"), self.chunks_of(first, "homer/config.yml"))
+
+        restored = self.restore(first)
+        self.assertEqual((restored / "conf" / "config.xml").read_bytes(), self.config)
+        self.assertEqual((restored / "conf" / "config.xml.20261017-0200.bak").read_bytes(), older_bak)
+        self.assertEqual((restored / "conf" / "config.xml").stat().st_mtime_ns, 1760000000 * 1_000_000_000)
+        self.assertEqual(os.readlink(restored / "homer" / "current"), "config.yml")
+
+        restored = self.restore(second, "--path", str(self.source / "conf"))
+        self.assertEqual(sorted(p.name for p in restored.rglob("*") if p.is_file()),
+                         ["config.xml", "config.xml.20261018-0200.bak"])
+        self.assertEqual((restored / "conf" / "config.xml").read_bytes(), self.files["conf/config.xml"])
+
+        only_first = self.stored_chunks() - {d for e in second["files"] for d in e.get("chunks", ())}
+        self.assertTrue(only_first)
+        output = self.run_tool("prune", "--keep", "1")
+        self.assertIn(f"Deleted 1 backup(s) and {len(only_first)} unused chunk(s)", output)
+        self.assertEqual([p.stem for p in (self.repo / "snapshots").glob("*.json")], [second["id"]])
+        self.assertFalse(self.stored_chunks() & only_first)
+
+        # What is left still restores completely
+        restored = self.restore(second)
+        for name, data in self.files.items():
+            self.assertEqual((restored / name).read_bytes(), data)
+
+    def test_files_cache_ignored_when_chunks_are_gone(self):
+        self.run_backup()
+        # A chunk deleted behind the cache's back is not trusted, the file is read again
+        for path in (self.repo / "chunks").glob("*/*"):
+            path.unlink()
+        manifest = self.run_backup()
+        self.assertGreaterEqual(manifest["stats"]["read_bytes"], len(self.config))
+        self.assertEqual(self.stored_chunks(), {d for e in manifest["files"] for d in e.get("chunks", ())})
+        restored = self.restore(manifest)
+        for name, data in self.files.items():
+            self.assertEqual((restored / name).read_bytes(), data)
+
+
+if __name__ == "__main__":
+    unittest.main()
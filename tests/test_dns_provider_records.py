@@ -0,0 +1,167 @@
+"""dns_provider_records clients against a local stand-in provider API."""
+import http.client
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from helpers import load_ansible_module
+
+records = load_ansible_module("dns_provider_records")
+
+
+class ProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def respond(self):
+        server = self.server
+        payload = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        server.requests.append((self.command, self.path))
+        server.bodies.append(json.loads(payload) if payload else None)
+        server.connections.add(self.client_address)
+        if self.command == "DELETE":
+            time.sleep(server.delete_delay)
+        status, body = server.routes.get((self.command, self.path.split("?")[0]), (404, {"detail": "Not found."}))
+        data = body.encode() if isinstance(body, str) else json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_DELETE = do_PATCH = do_POST = respond
+
+    def log_message(self, *args):
+        pass
+
+
+class ProviderTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ProviderHandler)
+        self.server.routes = {}
+        self.server.requests = []
+        self.server.bodies = []
+        self.server.connections = set()
+        self.server.delete_delay = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        port = self.server.server_port
+
+        def connect(host, timeout=None, context=None):
+            return http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+
+        patcher = mock.patch.object(records.http.client, "HTTPSConnection", connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class DesecTest(ProviderTest):
+    BASE = "/api/v1/domains/example.dedyn.io/rrsets/"
+
+    def test_single_rrset_is_deleted_without_waiting_for_a_write_slot(self):
+        rrset = {"subname": "_acme-challenge", "type": "TXT", "records": ['"token"']}
+        self.server.routes = {("GET", self.BASE): (200, [rrset]),
+                              ("DELETE", self.BASE + "_acme-challenge/TXT/"): (204, None)}
+        client = records.DesecClient("example.dedyn.io", "secret", 5)
+        start = time.monotonic()
+        found = client.list("_acme-challenge", "TXT")
+        self.assertEqual(client.delete(found), 1)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual([method for method, _ in self.server.requests], ["GET", "DELETE"])
+
+    def test_rrset_already_gone_is_not_a_change(self):
+        client = records.DesecClient("example.dedyn.io", "secret", 5)
+        self.assertEqual(client.delete([{"subname": "_acme-challenge", "type": "TXT"}]), 0)
+
+    def test_writes_stay_spaced(self):
+        self.server.routes = {("PATCH", self.BASE): (200, [])}
+        client = records.DesecClient("example.dedyn.io", "secret", 5)
+        client.pool.min_interval = 0.2
+        rrsets = [{"subname": "a", "type": "TXT"}, {"subname": "b", "type": "TXT"}]
+        start = time.monotonic()
+        client.delete(rrsets)
+        client.delete(rrsets)
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+
+class CloudflareTest(ProviderTest):
+    BASE = "/client/v4/zones/zone123/dns_records"
+    RECORDS = [{"id": "a1", "name": "_acme-challenge.example.com", "type": "TXT"},
+               {"id": "b2", "name": "_acme-challenge.example.com", "type": "TXT"}]
+
+    def client(self):
+        client = records.CloudflareClient("example.com", "secret", "zone123", 5)
+        client.pool.min_interval = 0
+        return client
+
+    def test_deletes_in_one_batch_request(self):
+        self.server.routes = {("GET", self.BASE): (200, {"result": self.RECORDS, "result_info": {"total_pages": 1}}),
+                              ("POST", self.BASE + "/batch"): (200, {"success": True})}
+        client = self.client()
+        found = client.list("_acme-challenge", "TXT")
+        self.assertIn("name=_acme-challenge.example.com", self.server.requests[0][1])
+        self.assertEqual(client.delete(found), 2)
+        self.assertEqual(self.server.requests[1:], [("POST", self.BASE + "/batch")])
+        self.assertEqual(self.server.bodies[1], {"deletes": [{"id": "a1"}, {"id": "b2"}]})
+
+    def test_falls_back_to_single_deletes(self):
+        for status in (404, 405):
+            with self.subTest(status):
+                self.server.requests.clear()
+                # b2 is already gone: its DELETE answers 404 and is not counted
+                self.server.routes = {("POST", self.BASE + "/batch"): (status, {"success": False}),
+                                      ("DELETE", self.BASE + "/a1"): (200, {"result": {"id": "a1"}})}
+                self.assertEqual(self.client().delete(self.RECORDS), 1)
+                self.assertEqual(sorted(self.server.requests[1:]),
+                                 [("DELETE", self.BASE + "/a1"), ("DELETE", self.BASE + "/b2")])
+
+    def test_batch_error_is_not_retried_as_single_deletes(self):
+        self.server.routes = {("POST", self.BASE + "/batch"): (403, {"success": False})}
+        with self.assertRaises(records.ProviderError):
+            self.client().delete(self.RECORDS)
+        self.assertEqual([method for method, _ in self.server.requests], ["POST"])
+
+
+class DynuTest(ProviderTest):
+    def test_concurrent_deletes_share_pooled_connections(self):
+        acme = [{"id": n, "nodeName": "_acme-challenge", "recordType": "TXT"} for n in range(1, 9)]
+        other = {"id": 99, "nodeName": "www", "recordType": "A"}
+        self.server.routes = {("GET", "/v2/dns"): (200, {"domains": [{"id": 7, "name": "example.dynu.net"}]}),
+                              ("GET", "/v2/dns/7/record"): (200, {"dnsRecords": acme + [other]})}
+        # Record 8 was removed in the meantime, so its DELETE answers 404
+        self.server.routes.update({("DELETE", f"/v2/dns/7/record/{n}"): (200, {"statusCode": 200})
+                                   for n in range(1, 8)})
+        self.server.delete_delay = 0.2
+        client = records.DynuClient("example.dynu.net", "secret", 5)
+        client.pool.min_interval = 0
+
+        found = client.list("_acme-challenge", "TXT")
+        self.assertEqual([r["id"] for r in found], list(range(1, 9)))
+        start = time.monotonic()
+        self.assertEqual(client.delete(found), 7)
+        # Eight 0.2 s deletes take 1.6 s one after another, 0.4 s on four connections
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertLessEqual(len(self.server.connections), records.DynuClient.WORKERS)
+        client.pool.close()
+
+
+class DuckDnsTest(ProviderTest):
+    def clear(self, answer):
+        self.server.routes = {("GET", "/update"): (200, answer)}
+        client = records.DuckDnsClient("example.duckdns.org", "secret", 5)
+        return client.delete(client.list("_acme-challenge", "TXT"))
+
+    def test_reports_change_only_when_updated(self):
+        self.assertEqual(self.clear("OK\n\nUPDATED"), 1)
+        self.assertEqual(self.clear("OK\n\nNOCHANGE"), 0)
+        self.assertIn("verbose=true", self.server.requests[-1][1])
+
+    def test_rejects_ko(self):
+        with self.assertRaises(records.ProviderError):
+            self.clear("KO")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""fetch-assets.py against a local HTTP stand-in with Range support."""
+import hashlib
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from helpers import StandInHTTPServer, load_script
+
+fa = load_script("recovery/fetch-assets.py")
+
+PAYLOAD = os.urandom(3 * 1024 * 1024 + 123)
+SHA256 = hashlib.sha256(PAYLOAD).hexdigest()
+
+
+class FetchAssetsTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInHTTPServer({"/debian.qcow2": PAYLOAD})
+        self.tmp = tempfile.TemporaryDirectory()
+        self.assets_dir = Path(self.tmp.name)
+        self.asset = fa.Asset("debian-cloud", "http", self.assets_dir / "images" / "debian.qcow2",
+                              url=self.server.url("/debian.qcow2"), sha256=SHA256)
+        self.asset.dest.parent.mkdir()
+        self.index = fa.StatIndex(self.assets_dir)
+        # Retries back off with sleep(2 ** attempt)
+        patcher = mock.patch.object(fa.time, "sleep")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.close()
+        self.tmp.cleanup()
+
+    def ranges(self):
+        return [range_header for _, range_header in self.server.requests]
+
+    def assertFetched(self):
+        self.assertEqual(self.asset.dest.read_bytes(), PAYLOAD)
+        self.assertFalse(self.asset.part.exists())
+        self.assertEqual(fa.read_sidecar(self.asset), SHA256)
+
+    def test_resumes_existing_part_file(self):
+        self.asset.part.write_bytes(PAYLOAD[:1000])
+        self.assertIsNone(fa.download(self.asset))
+        self.assertEqual(self.ranges(), ["bytes=1000-"])
+        self.assertFetched()
+
+    def test_interrupted_transfer_resumes_on_retry(self):
+        self.server.faults = ["drop"]
+        self.assertIsNone(fa.download(self.asset))
+        self.assertEqual(len(self.ranges()), 2)
+        self.assertIsNone(self.ranges()[0])
+        self.assertTrue(self.ranges()[1].startswith("bytes="))
+        self.assertFetched()
+
+    def test_checksum_mismatch_restarts_from_zero(self):
+        self.server.faults = ["corrupt"]
+        self.assertIsNone(fa.download(self.asset))
+        # The corrupt .part is discarded, so the retry is a full download
+        self.assertEqual(self.ranges(), [None, None])
+        self.assertFetched()
+
+    def test_persistent_mismatch_fails_without_keeping_data(self):
+        self.server.faults = ["corrupt"] * 3
+        self.assertEqual(fa.download(self.asset, retries=3), "download failed after 3 attempts")
+        self.assertFalse(self.asset.dest.exists())
+        self.assertFalse(self.asset.part.exists())
+
+    def test_unchanged_asset_is_not_rehashed(self):
+        _, status, _ = fa.fetch(self.asset, self.index)
+        self.assertEqual(status, "fetched")
+        self.index.save()
+
+        index = fa.StatIndex(self.assets_dir)
+        with mock.patch.object(fa, "hash_file", side_effect=AssertionError("re-hashed")):
+            _, status, _ = fa.fetch(self.asset, index)
+        self.assertEqual(status, "skipped")
+        self.assertEqual(len(self.ranges()), 1)
+
+    def test_changed_asset_is_rehashed(self):
+        fa.fetch(self.asset, self.index)
+        st = self.asset.dest.stat()
+        with open(self.asset.dest, "r+b") as f:
+            f.write(bytes([PAYLOAD[0] ^ 0xFF]))
+        # Within one timestamp tick the write would not change mtime
+        os.utime(self.asset.dest, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        _, status, _ = fa.fetch(self.asset, self.index)
+        self.assertEqual(status, "fetched")
+        self.assertFetched()
+
+
+if __name__ == "__main__":
+    unittest.main()
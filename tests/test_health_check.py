@@ -0,0 +1,36 @@
+"""health-check.py address parsing and result cache."""
+import argparse
+import unittest
+
+from helpers import load_script
+
+hc = load_script("tools/health-check.py")
+
+
+def targets(**overrides):
+    values = dict(proxmox=hc.DEFAULT_PROXMOX, opnsense=hc.DEFAULT_OPNSENSE, unbound=hc.DEFAULT_UNBOUND,
+                  adguard=hc.DEFAULT_ADGUARD, caddy=hc.DEFAULT_CADDY, test_domain="google.com",
+                  blocked_domain="doubleclick.net")
+    values.update(overrides)
+    return argparse.Namespace(**values)
+
+
+class SplitAddressTest(unittest.TestCase):
+    def test_forms(self):
+        self.assertEqual(hc.split_address("9100", 80), ("", 9100))
+        self.assertEqual(hc.split_address("0.0.0.0:9100", 80), ("0.0.0.0", 9100))
+        self.assertEqual(hc.split_address(":9100", 80), ("", 9100))
+        self.assertEqual(hc.split_address("10.10.20.1", 443), ("10.10.20.1", 443))
+
+
+class CacheFileTest(unittest.TestCase):
+    def test_keyed_by_targets(self):
+        default = hc.default_cache_file(targets())
+        self.assertEqual(default, hc.default_cache_file(targets()))
+        self.assertNotEqual(default, hc.default_cache_file(targets(caddy="192.168.1.10")))
+        self.assertNotEqual(default, hc.default_cache_file(targets(adguard="10.10.20.11:53")))
+        self.assertTrue(default.startswith("/tmp/privatebox-health-"))
+
+
+if __name__ == "__main__":
+    unittest.main()
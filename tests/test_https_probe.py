@@ -0,0 +1,91 @@
+"""https_probe against a local TLS server with a self-signed certificate."""
+import hashlib
+import http.server
+import shutil
+import socket
+import ssl
+import subprocess
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from helpers import load_ansible_module
+
+probe = load_ansible_module("https_probe")
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipUnless(shutil.which("openssl"), "openssl is needed to create a test certificate")
+class HttpsProbeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.cert = Path(cls.tmp.name) / "cert.pem"
+        key = Path(cls.tmp.name) / "key.pem"
+        # A 10000-day certificate ends after 2050, so notAfter is a GeneralizedTime
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "10000",
+                        "-keyout", str(key), "-out", str(cls.cert),
+                        "-subj", "/C=DE/O=PrivateBox/CN=localhost",
+                        "-addext", "subjectAltName=DNS:localhost,DNS:portainer.lan,IP:127.0.0.1"],
+                       check=True, capture_output=True)
+        cls.der = ssl.PEM_cert_to_DER_cert(cls.cert.read_text())
+
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cls.cert, key)
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        cls.server.socket = context.wrap_socket(cls.server.socket, server_side=True)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"https://localhost:{cls.server.server_port}/"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.tmp.cleanup()
+
+    def test_decode_der_matches_getpeercert(self):
+        context = ssl.create_default_context(cafile=str(self.cert))
+        with socket.create_connection(("127.0.0.1", self.server.server_port)) as raw:
+            with context.wrap_socket(raw, server_hostname="localhost") as tls_sock:
+                verified = tls_sock.getpeercert()
+        decoded = probe.decode_der(self.der)
+        for key in ("subject", "issuer", "notAfter"):
+            self.assertEqual(decoded[key], verified[key])
+        self.assertEqual(decoded["subjectAltName"],
+                         tuple(name for name in verified["subjectAltName"] if name[0] == "DNS"))
+
+    def test_insecure_probe_reports_certificate(self):
+        report = probe.run_probes(probe.normalize_endpoints([self.url], validate_certs=False))
+        result = report["endpoints"][0]
+        self.assertTrue(result["ok"], result["error"])
+        cert = result["cert"]
+        self.assertEqual(cert["sha256"], hashlib.sha256(self.der).hexdigest())
+        self.assertEqual(cert["subject"], "countryName=DE, organizationName=PrivateBox, commonName=localhost")
+        self.assertEqual(cert["san"], ["localhost", "portainer.lan"])
+        self.assertGreater(cert["days_left"], 9000)
+
+    def test_verification_failure_still_reports_certificate(self):
+        result = probe.run_probes(probe.normalize_endpoints([self.url], validate_certs=True))["endpoints"][0]
+        self.assertFalse(result["ok"])
+        self.assertIn("self-signed", result["verify_error"])
+        self.assertFalse(result["cert_verified"])
+        self.assertEqual(result["cert"]["sha256"], hashlib.sha256(self.der).hexdigest())
+        self.assertEqual(result["cert"]["issuer"], "countryName=DE, organizationName=PrivateBox, commonName=localhost")
+
+    def test_decode_der_rejects_garbage(self):
+        self.assertEqual(probe.decode_der(b"\x30\x82\xff\xff\x01"), {})
+        self.assertEqual(probe.decode_der(self.der[:200]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+"""opnsense_config_patch against the OPNsense config.xml fixtures."""
+import difflib
+import unittest
+
+from helpers import REPO, load_ansible_module
+
+patch = load_ansible_module("opnsense_config_patch")
+
+FIXTURES = REPO / "ansible" / "templates" / "opnsense"
+
+# The edits opnsense-post-config.yml applies
+PLAYBOOK_EDITS = [
+    {"xpath": "//unbound", "state": "absent"},
+    {"xpath": "OPNsense/unboundplus/general/active_interface", "value": "lan,opt1", "only_if_empty": True},
+]
+
+LEGACY_UNBOUND = (b"  <unbound>\n"
+                  b"    <enable>1</enable>\n"
+                  b"    <port>5353</port>\n"
+                  b"  </unbound>\n")
+
+
+def patched(data, edits):
+    root = patch.parse_config(data)
+    changes = patch.apply_edits(root, edits)
+    return patch.serialize_config(root), changes
+
+
+def line_diff(before, after):
+    diff = difflib.unified_diff(before.decode().splitlines(), after.decode().splitlines(), lineterm="", n=0)
+    return [line for line in diff if line[:1] in "+-" and not line.startswith(("+++", "---"))]
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_fixtures_round_trip_byte_identical(self):
+        for name in ("config-template.xml", "config-current.xml"):
+            with self.subTest(name):
+                data = (FIXTURES / name).read_bytes()
+                self.assertEqual(patched(data, [])[0], data)
+
+
+class PlaybookEditsTest(unittest.TestCase):
+    def setUp(self):
+        self.current = (FIXTURES / "config-current.xml").read_bytes()
+
+    def test_sets_empty_active_interface_only(self):
+        after, changes = patched(self.current, PLAYBOOK_EDITS)
+        self.assertEqual(changes, ["~ /opnsense/OPNsense/unboundplus/general/active_interface: '' → 'lan,opt1'"])
+        self.assertEqual(line_diff(self.current, after), [
+            "-        <active_interface/>",
+            "+        <active_interface>lan,opt1</active_interface>",
+        ])
+
+    def test_removes_legacy_unbound_without_touching_the_rest(self):
+        anchor = self.current.index(b"  <OPNsense>")
+        with_legacy = self.current[:anchor] + LEGACY_UNBOUND + self.current[anchor:]
+        expected, _ = patched(self.current, PLAYBOOK_EDITS)
+
+        after, changes = patched(with_legacy, PLAYBOOK_EDITS)
+        self.assertEqual(changes[0], "- /opnsense/unbound")
+        self.assertEqual(after, expected)
+
+    def test_second_run_is_a_no_op(self):
+        once, _ = patched(self.current, PLAYBOOK_EDITS)
+        twice, changes = patched(once, PLAYBOOK_EDITS)
+        self.assertEqual((twice, changes), (once, []))
+
+    def test_template_already_matches(self):
+        template = (FIXTURES / "config-template.xml").read_bytes()
+        self.assertEqual(patched(template, PLAYBOOK_EDITS), (template, []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+"""password-generator.sh and password-generator.py produce the same format."""
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from helpers import REPO, load_script
+
+LIB = REPO / "bootstrap" / "lib"
+GENERATOR_SH = LIB / "password-generator.sh"
+GENERATOR_PY = LIB / "password-generator.py"
+
+pwgen = load_script("bootstrap/lib/password-generator.py")
+
+HYPHENATED_WORDS = ["drop-down", "felt-tip", "t-shirt", "yo-yo", "x-ray", "bull-dog", "sea-side", "rock-salt"]
+
+
+def bash(script, **env):
+    """Run script after sourcing password-generator.sh; returns stdout lines."""
+    result = subprocess.run(["bash", "-c", f"source {GENERATOR_SH}\n{script}"], capture_output=True, text=True,
+                            check=True, env={"PATH": f"{Path(sys.executable).parent}:/usr/bin:/bin", **env})
+    return result.stdout.splitlines()
+
+
+def check(passwords, words):
+    """Run --check on passwords through stdin; returns (exit code, output)."""
+    result = subprocess.run([sys.executable, str(GENERATOR_PY), "--check", "--words", str(words)],
+                            input="\n".join(passwords) + "\n", capture_output=True, text=True)
+    return result.returncode, result.stdout
+
+
+class CrossCheckTest(unittest.TestCase):
+    def assertFormat(self, passwords, words):
+        code, out = check(passwords, words)
+        self.assertEqual(code, 0, out)
+        self.assertIn(f"{len(passwords)}/{len(passwords)} password(s) match the format", out)
+
+    def test_bash_passwords_pass_python_check(self):
+        self.assertFormat(bash("for n in $(seq 15); do generate_phonetic_password 3; done"), 3)
+        self.assertFormat(bash("for n in $(seq 5); do generate_phonetic_password 5; done"), 5)
+
+    def test_python_passwords_pass_python_check(self):
+        for preset, words in (("--services", 3), ("--admin", 5)):
+            out = subprocess.run([sys.executable, str(GENERATOR_PY), preset, "--count", "200"],
+                                 capture_output=True, text=True, check=True).stdout.split()
+            self.assertEqual(len(out), 200)
+            self.assertFormat(out, words)
+
+    def test_check_rejects_other_formats(self):
+        code, out = check(["Wrist-sprinkle-h4nd", "ab0ut-ab0ut-ab0ut", "w4t3r-f1sh-d0g"], 3)
+        self.assertEqual(code, 1)
+        self.assertIn("0/3 password(s) match the format", out)
+
+
+class HyphenatedWordsTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False)
+        tmp.write("# hyphenated list words\n" + "\n".join(HYPHENATED_WORDS) + "\n")
+        tmp.close()
+        self.word_file = tmp.name
+        self.addCleanup(Path(tmp.name).unlink)
+        self.wordlist = pwgen.WordList(self.word_file)
+
+    def test_bash_hyphenated_words(self):
+        # WORD_FILE is set when the script is sourced, so override it afterwards
+        passwords = bash(f"WORD_FILE={self.word_file}\nfor n in $(seq 10); do generate_phonetic_password 3; done")
+        for password in passwords:
+            self.assertGreaterEqual(password.count("-"), 5)
+            self.assertIsNone(pwgen.check_phonetic(password, self.wordlist, 3), password)
+
+    def test_python_hyphenated_words(self):
+        for _ in range(50):
+            password, _ = pwgen.phonetic_password(self.wordlist, 3)
+            self.assertIsNone(pwgen.check_phonetic(password, self.wordlist, 3), password)
+
+    def test_hyphen_grouping_must_use_list_words(self):
+        self.assertIsNotNone(pwgen.check_phonetic("dr0p-down-f3lt-tip", self.wordlist, 3))
+        self.assertIsNotNone(pwgen.check_phonetic("dr0p-d0wn-f3lt-tip-t-5hirt", self.wordlist, 3))
+
+
+class BatchEvalTest(unittest.TestCase):
+    SPECS = "ADMIN_PASSWORD=admin SERVICES_PASSWORD=services API_KEY=24"
+    PRINT = 'printf "%s\\n" "$ADMIN_PASSWORD" "$SERVICES_PASSWORD" "$API_KEY"'
+
+    def assertBatch(self, lines):
+        admin, services, api_key = lines
+        self.assertIsNone(pwgen.check_phonetic(admin, pwgen.WordList(), 5), admin)
+        self.assertIsNone(pwgen.check_phonetic(services, pwgen.WordList(), 3), services)
+        self.assertEqual(len(api_key), 24)
+        self.assertTrue(set(api_key) <= set(pwgen.RANDOM_CHARSET), api_key)
+
+    def test_python_batch_output_evaluates(self):
+        self.assertEqual(bash("have_python_generator && echo python"), ["python"])
+        for _ in range(10):
+            self.assertBatch(bash(f'eval "$(generate_passwords {self.SPECS})"\n{self.PRINT}'))
+
+    def test_bash_fallback_batch_output_evaluates(self):
+        script = f'have_python_generator() {{ return 1; }}\neval "$(generate_passwords {self.SPECS})"\n{self.PRINT}'
+        for _ in range(3):
+            self.assertBatch(bash(script))
+
+
+if __name__ == "__main__":
+    unittest.main()
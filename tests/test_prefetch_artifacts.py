@@ -0,0 +1,127 @@
+"""prefetch-artifacts.py against a local HTTP stand-in with Range support."""
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from helpers import REPO, StandInHTTPServer, load_script
+
+prefetch = load_script("bootstrap/lib/prefetch-artifacts.py")
+
+IMAGE = os.urandom(2 * 1024 * 1024 + 77)
+MD5 = hashlib.md5(IMAGE).hexdigest()
+SHA512 = hashlib.sha512(IMAGE).hexdigest()
+
+
+class PrefetchTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInHTTPServer({
+            "/opnsense.vma.zst": IMAGE,
+            "/SHA512SUMS": f"{'0' * 128}  other.qcow2\n{SHA512}  opnsense.vma.zst\n".encode(),
+        })
+        self.addCleanup(self.server.close)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.state_dir = Path(tmp.name) / "state"
+        self.state_dir.mkdir()
+        self.dest = Path(tmp.name) / "images" / "opnsense.vma.zst"
+        self.part = self.dest.with_name(self.dest.name + ".part")
+        self.url = self.server.url("/opnsense.vma.zst")
+        # Retries back off with sleep(5 * 2 ** n)
+        patcher = mock.patch.object(prefetch.time, "sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self, checksum=f"md5:{MD5}"):
+        return prefetch.fetch("opnsense", self.url, self.dest, checksum, self.state_dir)
+
+    def status(self):
+        return (self.state_dir / "opnsense.status").read_text().strip()
+
+    def image_requests(self):
+        return [range_header for path, range_header in self.server.requests if path == "/opnsense.vma.zst"]
+
+    def assertReady(self):
+        self.assertEqual(self.status(), f"ready {self.dest}")
+        self.assertEqual(self.dest.read_bytes(), IMAGE)
+        self.assertFalse(self.part.exists())
+
+    def test_resumes_part_file_from_interrupted_bootstrap(self):
+        self.dest.parent.mkdir()
+        self.part.write_bytes(IMAGE[:4096])
+        self.assertTrue(self.fetch())
+        self.assertEqual(self.image_requests(), ["bytes=4096-"])
+        self.assertReady()
+
+    def test_retries_dropped_connection_with_range(self):
+        self.server.faults = ["drop"]
+        self.assertTrue(self.fetch())
+        requests = self.image_requests()
+        self.assertEqual(len(requests), 2)
+        self.assertIsNone(requests[0])
+        self.assertEqual(requests[1], f"bytes={len(IMAGE) // 2}-")
+        self.assertEqual(self.sleep.call_count, 1)
+        self.assertReady()
+
+    def test_starts_over_when_server_ignores_range(self):
+        self.dest.parent.mkdir()
+        self.part.write_bytes(IMAGE[:4096])
+        self.server.faults = ["ignore-range"]
+        self.assertTrue(self.fetch())
+        self.assertReady()
+
+    def test_checksum_mismatch_discards_part_and_retries(self):
+        self.server.faults = ["corrupt"]
+        self.assertTrue(self.fetch())
+        # The corrupt download cannot be resumed, so the retry starts from zero
+        self.assertEqual(self.image_requests(), [None, None])
+        self.assertReady()
+
+    def test_persistent_mismatch_reports_failure(self):
+        self.server.faults = ["corrupt"] * prefetch.ATTEMPTS
+        self.assertFalse(self.fetch())
+        self.assertEqual(self.status(), f"failed after {prefetch.ATTEMPTS} attempts")
+        self.assertFalse(self.dest.exists())
+        self.assertFalse(self.part.exists())
+
+    def test_sha512sums_file(self):
+        self.assertTrue(self.fetch(f"sha512sums:{self.server.url('/SHA512SUMS')}"))
+        self.assertReady()
+
+    def test_reuses_cached_file_only_when_hash_matches(self):
+        self.dest.parent.mkdir()
+        self.dest.write_bytes(IMAGE)
+        self.assertTrue(self.fetch())
+        self.assertEqual(self.image_requests(), [])
+
+        self.dest.write_bytes(b"stale" + IMAGE[5:])
+        self.assertTrue(self.fetch())
+        self.assertEqual(self.image_requests(), [None])
+        self.assertReady()
+
+
+class WaitTest(unittest.TestCase):
+    def wait(self, state_dir, name):
+        return subprocess.run([sys.executable, str(REPO / "bootstrap/lib/prefetch-artifacts.py"), "wait",
+                               "--state-dir", str(state_dir), name, "--timeout", "5"],
+                              capture_output=True, text=True)
+
+    def test_exit_codes(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            self.assertEqual(self.wait(state_dir, "debian").returncode, 2)
+
+            Path(state_dir, "debian.pending").write_text(f"{os.getpid()}\n")
+            prefetch.write_status(state_dir, "debian", "ready /var/tmp/debian.qcow2")
+            result = self.wait(state_dir, "debian")
+            self.assertEqual((result.returncode, result.stdout.strip()), (0, "ready /var/tmp/debian.qcow2"))
+
+            prefetch.write_status(state_dir, "debian", "failed after 5 attempts")
+            self.assertEqual(self.wait(state_dir, "debian").returncode, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+"""zfs-snapshot.py against stand-in zfs and qm commands on PATH."""
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from helpers import REPO
+
+SCRIPT = REPO / "tools" / "zfs-snapshot.py"
+
+# Keeps pool state in $STANDIN_STATE and logs every call; datasets listed in
+# "refuse" fail to roll back as a busy or damaged disk would
+ZFS = '''#!/usr/bin/env python3
+import json, os, sys, time
+path = os.environ["STANDIN_STATE"]
+with open(path) as f:
+    state = json.load(f)
+args = sys.argv[1:]
+state["calls"].append(["zfs", *args])
+recursive = "-r" in args
+
+def covered(dataset, root):
+    return dataset == root or (recursive and dataset.startswith(root + "/"))
+
+def fail(message):
+    with open(path, "w") as f:
+        json.dump(state, f)
+    sys.exit(message)
+
+if args[0] == "list" and "snapshot" in args:
+    for snap in state["snapshots"]:
+        if snap["name"].split("@")[0] in args:
+            print(f"{snap['name']}\\t{snap['creation']}\\t{snap['used']}")
+elif args[0] == "list":
+    names = [d for d in state["datasets"] if covered(d, args[-1])]
+    if not names:
+        fail(f"cannot open '{args[-1]}': dataset does not exist")
+    print("\\n".join(names))
+elif args[0] == "snapshot":
+    for target in args[2:]:
+        root, name = target.split("@")
+        state["snapshots"] += [{"name": f"{d}@{name}", "creation": int(time.time()), "used": 0}
+                               for d in state["datasets"] if covered(d, root)]
+elif args[0] == "destroy":
+    root, names = args[-1].split("@")
+    doomed = {f"{d}@{name}" for name in names.split(",") for d in state["datasets"] if covered(d, root)}
+    state["snapshots"] = [s for s in state["snapshots"] if s["name"] not in doomed]
+elif args[0] == "rollback":
+    dataset = args[-1].split("@")[0]
+    if dataset in state["refuse"]:
+        fail(f"cannot rollback '{dataset}': dataset is busy")
+    mine = [s["name"] for s in state["snapshots"] if s["name"].startswith(dataset + "@")]
+    newer = mine[mine.index(args[-1]) + 1:]
+    if newer and not recursive:
+        fail(f"cannot rollback to '{args[-1]}': more recent snapshots or bookmarks exist")
+    state["snapshots"] = [s for s in state["snapshots"] if s["name"] not in newer]
+    state["rolled_back"].append(args[-1])
+with open(path, "w") as f:
+    json.dump(state, f)
+'''
+
+QM = '''#!/usr/bin/env python3
+import json, os, sys
+path = os.environ["STANDIN_STATE"]
+with open(path) as f:
+    state = json.load(f)
+state["calls"].append(["qm", *sys.argv[1:]])
+command = sys.argv[1]
+if command == "status":
+    print(f"status: {state['vm']}")
+elif command in ("stop", "shutdown"):
+    state["vm"] = "stopped"
+elif command == "start":
+    state["vm"] = "running"
+with open(path, "w") as f:
+    json.dump(state, f)
+'''
+
+DISKS = ["rpool/data/vm-100-disk-0", "rpool/data/vm-100-disk-1", "rpool/data/vm-9000-disk-0"]
+DATASETS = ["rpool/data", *DISKS, "rpool/ROOT", "rpool/ROOT/pve-1"]
+
+
+class ZfsSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        bin_dir = Path(tmp.name)
+        for name, source in (("zfs", ZFS), ("qm", QM)):
+            (bin_dir / name).write_text(source.replace("/usr/bin/env python3", sys.executable))
+            (bin_dir / name).chmod(0o755)
+        self.state_file = bin_dir / "state.json"
+        self.state = {"datasets": DATASETS, "snapshots": [], "calls": [], "rolled_back": [], "refuse": [],
+                      "vm": "running"}
+        self.env = dict(os.environ, PATH=f"{bin_dir}:{os.environ['PATH']}", STANDIN_STATE=str(self.state_file))
+
+    def add_snapshots(self, datasets, names, creation):
+        for i, name in enumerate(names):
+            self.state["snapshots"] += [{"name": f"{d}@{name}", "creation": creation + i, "used": 1024}
+                                        for d in datasets]
+
+    def run_tool(self, *args):
+        self.state_file.write_text(json.dumps(self.state))
+        result = subprocess.run([sys.executable, str(SCRIPT), *args, "--json"], env=self.env,
+                                capture_output=True, text=True)
+        self.state = json.loads(self.state_file.read_text())
+        return result
+
+    def zfs_calls(self, command):
+        return [call[2:] for call in self.state["calls"] if call[:2] == ["zfs", command]]
+
+    def test_create_snapshots_every_dataset_in_one_call(self):
+        result = self.run_tool("create", "pre-update", "opnsense-24.7.6")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        name = json.loads(result.stdout)["name"]
+        self.assertRegex(name, r"^pre-update-\d{8}-\d{4}-opnsense-24\.7\.6$")
+        self.assertEqual(len(self.zfs_calls("snapshot")), 1)
+        self.assertEqual({s["name"] for s in self.state["snapshots"]},
+                         {f"{d}@{name}" for d in [*DISKS, "rpool/ROOT", "rpool/ROOT/pve-1"]})
+
+    def test_prune_destroys_expired_snapshots_in_batches(self):
+        old = datetime.datetime(2020, 1, 1)
+        expired = [f"daily-{old + datetime.timedelta(hours=i):%Y%m%d-%H%M}" for i in range(250)]
+        self.add_snapshots([*DISKS, "rpool/ROOT"], expired, int(old.timestamp()))
+        self.add_snapshots(DISKS, ["manual-20200101-0000-keep"], int(old.timestamp()))
+
+        result = self.run_tool("prune")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = json.loads(result.stdout)
+        self.assertEqual(len(report["expired"]), 250)
+        self.assertEqual(report["kept"], 1)
+        # Three calls of at most 100 names for each of the four datasets
+        destroys = self.zfs_calls("destroy")
+        self.assertEqual(report["destroy_calls"], len(destroys))
+        self.assertEqual(len(destroys), 12)
+        self.assertTrue(all(len(call[-1].split("@")[1].split(",")) <= 100 for call in destroys))
+        self.assertIn(["-r", f"rpool/ROOT@{','.join(expired[:100])}"], destroys)
+        self.assertEqual([s["name"].split("@")[1] for s in self.state["snapshots"]],
+                         ["manual-20200101-0000-keep"] * len(DISKS))
+
+    def test_rollback_refuses_newer_snapshots_before_stopping_the_vm(self):
+        # Only the second disk has a newer snapshot, so zfs would refuse halfway through
+        self.add_snapshots(DISKS[:2], ["pre-update-20251023-1430"], 1761222600)
+        self.add_snapshots(DISKS[1:2], ["manual-20251024-0900"], 1761296400)
+        result = self.run_tool("rollback", "opnsense", "pre-update-20251023-1430", "--wait", "0")
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("1 newer snapshot(s)", result.stderr)
+        self.assertIn("--destroy-newer", result.stderr)
+        self.assertEqual([call for call in self.state["calls"] if call[0] == "qm"], [])
+        self.assertEqual(self.state["vm"], "running")
+
+    def test_rollback_destroy_newer(self):
+        self.add_snapshots(DISKS[:2], ["pre-update-20251023-1430", "daily-20251024-0300"], 1761222600)
+        result = self.run_tool("rollback", "opnsense", "latest", "--type", "pre-update", "--destroy-newer",
+                               "--wait", "0")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = json.loads(result.stdout)
+        self.assertEqual(report["destroyed"], ["daily-20251024-0300"])
+        self.assertEqual(self.state["rolled_back"], [f"{d}@pre-update-20251023-1430" for d in DISKS[:2]])
+        self.assertEqual(self.state["vm"], "running")
+
+    def test_partial_rollback_leaves_the_vm_stopped(self):
+        self.add_snapshots(DISKS[:2], ["pre-update-20251023-1430"], 1761222600)
+        self.state["refuse"] = [DISKS[1]]
+        result = self.run_tool("rollback", "opnsense", "pre-update-20251023-1430", "--wait", "0")
+        self.assertEqual(result.returncode, 1)
+        report = json.loads(result.stdout)
+        self.assertEqual(report["rolled_back"], [DISKS[0]])
+        self.assertFalse(report["started"])
+        self.assertIn("left stopped", report["error"])
+        self.assertEqual(self.state["vm"], "stopped")
+
+    def test_refused_first_disk_restarts_the_unchanged_vm(self):
+        self.add_snapshots(DISKS[:2], ["pre-update-20251023-1430"], 1761222600)
+        self.state["refuse"] = [DISKS[0]]
+        result = self.run_tool("rollback", "opnsense", "pre-update-20251023-1430", "--wait", "0")
+        self.assertEqual(result.returncode, 1)
+        report = json.loads(result.stdout)
+        self.assertEqual(report["rolled_back"], [])
+        self.assertTrue(report["started"])
+        self.assertEqual(self.state["vm"], "running")
+
+
+if __name__ == "__main__":
+    unittest.main()
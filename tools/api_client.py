@@ -0,0 +1,268 @@
+"""
+Shared Semaphore API client for the tools/ scripts.
+
+Every request goes through one process-wide controller:
+
+    AIMD limit        concurrent requests start at API_CONCURRENCY, grow by
+                      one slot per window of fast successes and halve when
+                      Semaphore answers 429/5xx or slower than
+                      API_LATENCY_TARGET seconds
+    GET retries       idempotent GETs are retried on connection errors,
+                      429 and 5xx with jittered exponential backoff
+    circuit breaker   after several consecutive connection errors or 5xx
+                      responses traffic pauses while Semaphore recovers,
+                      then a single probe decides whether to resume
+
+Tuning comes from KEY=VALUE arguments (how Semaphore passes variables) or
+PRIVATEBOX_<KEY> environment variables: API_CONCURRENCY, API_MAX_CONCURRENCY,
+API_LATENCY_TARGET, API_RETRIES. The current limit and rejection counts are
+available from api.stats().
+
+Callers use api.get/post/put/delete like the requests functions; errors are
+requests.exceptions.RequestException subclasses, so existing handlers apply.
+"""
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+SERVER_ERROR_STATUS = {500, 502, 503, 504}
+RETRY_STATUS = SERVER_ERROR_STATUS | {429}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Semaphore stayed unhealthy for longer than the breaker lets callers wait."""
+
+
+class AIMDLimiter:
+    """Concurrency limit with additive increase and multiplicative decrease."""
+
+    def __init__(self, initial=4, minimum=1, maximum=16, latency_target=2.0, decrease=0.5):
+        self.cond = threading.Condition()
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.in_flight = 0
+        self.decreases = 0
+        self.last_decrease = 0.0
+        self.rtt = None
+
+    def acquire(self):
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, overloaded=False):
+        """Return a slot and adapt the limit to how the request went.
+
+        latency is None for requests that failed before Semaphore answered;
+        those are left to the circuit breaker.
+        """
+        with self.cond:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            now = time.monotonic()
+            if latency is not None:
+                self.rtt = latency if self.rtt is None else 0.8 * self.rtt + 0.2 * latency
+            if overloaded or (latency is not None and latency > self.latency_target):
+                # Requests already in flight report the same overload; decrease
+                # at most once per round trip so one burst does not collapse
+                # the limit to the minimum
+                if now - self.last_decrease >= (self.rtt or 0):
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self.decreases += 1
+                    self.last_decrease = now
+            elif latency is not None and saturated:
+                # Grow only while the limit is actually the bottleneck
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self.cond.notify_all()
+
+
+class CircuitBreaker:
+    """Pause traffic after consecutive failures; probe once before resuming."""
+
+    def __init__(self, threshold=5, cooldown=5.0, max_cooldown=60.0, max_wait=120.0):
+        self.lock = threading.Lock()
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_wait = max_wait
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejected = 0
+        self.probing = False
+
+    def before_request(self):
+        """Block while the breaker is open; raise CircuitOpenError after max_wait."""
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self.state == "closed":
+                    return
+                if self.state == "open" and now - self.opened_at >= self.cooldown:
+                    self.state = "half-open"
+                if self.state == "half-open" and not self.probing:
+                    self.probing = True
+                    return
+                if now >= deadline:
+                    self.rejected += 1
+                    raise CircuitOpenError(
+                        f"Semaphore API unhealthy: circuit open for {now - self.opened_at:.0f}s")
+                # Open: sleep out the cooldown; half-open: wait for the probe's result
+                wait = self.opened_at + self.cooldown - now if self.state == "open" else 0.2
+            time.sleep(max(0.05, min(wait, deadline - now)))
+
+    def abort(self):
+        """Release a probe slot for a request that failed before reaching Semaphore."""
+        with self.lock:
+            self.probing = False
+
+    def record(self, healthy):
+        with self.lock:
+            probe = self.probing
+            self.probing = False
+            if healthy:
+                self.failures = 0
+                if self.state != "closed":
+                    self.state = "closed"
+                    self.cooldown = self.base_cooldown
+                return
+            self.failures += 1
+            if probe:
+                # Failed probe: stay open, and wait longer before the next one
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            elif self.state == "closed" and self.failures >= self.threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.opens += 1
+
+
+class ApiClient:
+    """requests-compatible get/post/put/delete behind the shared controller."""
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.retries = 3
+        self.backoff = 0.5
+        self.max_backoff = 8.0
+        self.stats_lock = threading.Lock()
+        self.counts = {"requests": 0, "retries": 0, "throttled": 0, "server_errors": 0, "connection_errors": 0}
+        self.configure()
+
+    def configure(self, variables=None):
+        """Apply tuning from KEY=VALUE variables or PRIVATEBOX_* environment variables."""
+        def setting(key, default, cast):
+            value = (variables or {}).get(key) or os.environ.get(f"PRIVATEBOX_{key}")
+            try:
+                return cast(value) if value else default
+            except ValueError:
+                print(f"⚠ Invalid {key} '{value}', using {default}")
+                return default
+
+        maximum = max(1, setting("API_MAX_CONCURRENCY", 16, int))
+        self.limiter = AIMDLimiter(initial=min(maximum, max(1, setting("API_CONCURRENCY", 4, int))),
+                                   maximum=maximum,
+                                   latency_target=setting("API_LATENCY_TARGET", 2.0, float))
+        self.breaker = CircuitBreaker()
+        self.retries = max(0, setting("API_RETRIES", 3, int))
+        # Enough pooled keep-alive connections for the largest possible limit
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=maximum)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        return self
+
+    def _count(self, key):
+        with self.stats_lock:
+            self.counts[key] += 1
+
+    def request(self, method, url, **kwargs):
+        method = method.upper()
+        attempts = 1 + (self.retries if method in IDEMPOTENT_METHODS else 0)
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            self.breaker.before_request()
+            self.limiter.acquire()
+            self._count("requests")
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.limiter.release()
+                self.breaker.record(healthy=False)
+                self._count("connection_errors")
+                if last_attempt:
+                    raise
+                self._sleep_before_retry(attempt)
+                continue
+            except BaseException:
+                self.limiter.release()
+                self.breaker.abort()
+                raise
+
+            overloaded = response.status_code in RETRY_STATUS
+            self.limiter.release(time.monotonic() - start, overloaded)
+            # 429 means Semaphore is up but busy: the limit backs off, the breaker stays closed
+            self.breaker.record(healthy=response.status_code not in SERVER_ERROR_STATUS)
+            if not overloaded:
+                return response
+            self._count("throttled" if response.status_code == 429 else "server_errors")
+            if last_attempt:
+                return response
+            self._sleep_before_retry(attempt, response.headers.get("Retry-After"))
+        return response
+
+    def _sleep_before_retry(self, attempt, retry_after=None):
+        self._count("retries")
+        # Full jitter keeps parallel workers from retrying in lockstep
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.max_backoff))
+        time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def stats(self):
+        """Current limit, in-flight requests and rejection counters."""
+        with self.stats_lock:
+            counts = dict(self.counts)
+        counts.update({
+            "limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "limit_decreases": self.limiter.decreases,
+            "circuit": self.breaker.state,
+            "circuit_opens": self.breaker.opens,
+            "circuit_rejected": self.breaker.rejected,
+        })
+        return counts
+
+    def describe(self):
+        s = self.stats()
+        return (f"{s['requests']} request(s), limit {s['limit']}, {s['retries']} retried, "
+                f"{s['throttled']} throttled (429), {s['server_errors']} server error(s), "
+                f"circuit {s['circuit']} (opened {s['circuit_opens']}x, {s['circuit_rejected']} rejected)")
+
+
+api = ApiClient()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Semaphore task log archive.
+Pulls the output of finished Semaphore tasks once, stores each task as its
+own gzip stream and keeps an inverted index of error signatures (FAILED!,
+fatal:, UNREACHABLE, ERROR!, HTTP 4xx/5xx) and template names, so failures
+across the whole task history can be searched without the API.
+
+Layout (inside --archive, default task-logs in Semaphore's data volume:
+/var/lib/semaphore/task-logs in the container, /opt/semaphore/data/task-logs
+on the host; TASK_LOG_ARCHIVE overrides it):
+    tasks/<id>.log.gz    one compressed stream per task
+    index.json           task metadata, template name → tasks and
+                         signature → task → matching lines
+
+The service orchestrators (orchestrate-*.py) run "sync" after every run.
+
+Commands:
+    sync                        Archive tasks finished since the last sync
+    search [REGEX]              Search lines (--signature, --template, --status, --context)
+    show TASK_ID                Print one archived log
+    stats                       Signature and per-template failure counts
+
+Examples:
+    ./archive-task-logs.py sync SEMAPHORE_API_TOKEN=...
+    ./archive-task-logs.py search --signature fatal --template AdGuard
+    ./archive-task-logs.py search 'Status code was 401' --status error
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Auto-install dependencies if not available
+try:
+    import requests
+    import urllib3
+except ImportError:
+    import subprocess
+    print("Installing requests package...")
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'requests'])
+    import requests
+    import urllib3
+
+# Disable SSL warnings for self-signed certificates (internal Services VLAN only)
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+from api_client import api
+
+DEFAULT_URL = "https://10.10.20.10:2443"
+# Same directory whether run inside the Semaphore container or on the host
+SEMAPHORE_DATA = "/var/lib/semaphore" if os.path.isdir("/var/lib/semaphore") else "/opt/semaphore/data"
+DEFAULT_ARCHIVE = os.environ.get("TASK_LOG_ARCHIVE", f"{SEMAPHORE_DATA}/task-logs")
+INDEX_VERSION = 1
+FINAL_STATUSES = ("success", "error", "failed", "stopped")
+MAX_INDEXED_LINE = 400
+
+ANSI_RE = re.compile(r'\x1b\[[0-9;]*m')
+SIGNATURES = [
+    ("failed", re.compile(r'FAILED!')),
+    ("fatal", re.compile(r'\bfatal:')),
+    ("unreachable", re.compile(r'UNREACHABLE!')),
+    ("error", re.compile(r'\bERROR!')),
+]
+# "HTTP 502", "HTTP/1.1 404", "Status code was 401", "status": 500, status_code=403
+HTTP_STATUS_RE = re.compile(
+    r'(?:\bHTTP(?:/\d(?:\.\d)?)?\s+|Status code was\s+|\bstatus(?:_code)?["\']?\s*[:=]\s*)([45]\d\d)\b')
+
+
+def signatures_for(line):
+    """Error signatures present in one log line."""
+    found = [name for name, pattern in SIGNATURES if pattern.search(line)]
+    found += [f"http-{code}" for code in sorted(set(HTTP_STATUS_RE.findall(line)))]
+    return found
+
+
+# ============================================
+# Archive
+# ============================================
+
+class TaskLogArchive:
+    """Compressed per-task logs plus a JSON inverted index."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.task_dir = self.root / "tasks"
+        self.index_path = self.root / "index.json"
+        self.index = {"version": INDEX_VERSION, "tasks": {}, "templates": {}, "signatures": {}}
+        if self.index_path.exists():
+            with open(self.index_path) as f:
+                index = json.load(f)
+            if index.get("version") != INDEX_VERSION:
+                raise SystemExit(f"✗ Unsupported index version in {self.index_path}")
+            if "templates" not in index:
+                # Archives written before the template index existed
+                index["templates"] = {}
+                for task_id, meta in index["tasks"].items():
+                    index["templates"].setdefault(meta.get("template") or "", []).append(task_id)
+            self.index = index
+
+    def save(self):
+        """Write the index atomically so an interrupted sync never corrupts it."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".index-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.index, f, separators=(",", ":"))
+        os.replace(tmp, self.index_path)
+
+    def log_path(self, task_id):
+        return self.task_dir / f"{task_id}.log.gz"
+
+    def has(self, task_id):
+        return str(task_id) in self.index["tasks"]
+
+    def add(self, task, template_name, lines):
+        """Store one task's lines and index their signatures."""
+        task_id = str(task["id"])
+        self.task_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.log_path(task_id).with_suffix(".part")
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+            for line in lines:
+                f.write(line + "\n")
+        os.replace(tmp, self.log_path(task_id))
+
+        for number, line in enumerate(lines, 1):
+            for signature in signatures_for(line):
+                postings = self.index["signatures"].setdefault(signature, {})
+                postings.setdefault(task_id, []).append([number, line[:MAX_INDEXED_LINE]])
+
+        self.index["templates"].setdefault(template_name or "", []).append(task_id)
+        self.index["tasks"][task_id] = {
+            "template": template_name,
+            "template_id": task.get("template_id"),
+            "status": task.get("status"),
+            "created": task.get("created"),
+            "lines": len(lines),
+        }
+
+    def read(self, task_id):
+        with gzip.open(self.log_path(task_id), "rt", encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    def select_tasks(self, template=None, status=None, since=None):
+        """Task IDs matching the metadata filters."""
+        if template:
+            # Match the few distinct template names, not every task record
+            template = template.lower()
+            candidates = [task_id for name, task_ids in self.index["templates"].items()
+                          if template in name.lower() for task_id in task_ids]
+        else:
+            candidates = self.index["tasks"]
+        if not status and not since:
+            return set(candidates)
+        selected = set()
+        for task_id in candidates:
+            meta = self.index["tasks"][task_id]
+            if status and meta.get("status") != status:
+                continue
+            if since and (meta.get("created") or "") < since:
+                continue
+            selected.add(task_id)
+        return selected
+
+
+# ============================================
+# Sync
+# ============================================
+
+def api_get(base_url, headers, path, timeout=30):
+    response = api.get(f"{base_url}{path}", headers=headers, timeout=timeout, verify=False)
+    response.raise_for_status()
+    return response.json()
+
+
+def sync(archive, base_url, api_token, project_id, jobs):
+    """Archive every finished task not yet in the archive; returns the number added."""
+    headers = {"Authorization": f"Bearer {api_token}"}
+    templates = {t["id"]: t.get("name") for t in api_get(base_url, headers, f"/api/project/{project_id}/templates")}
+    tasks = api_get(base_url, headers, f"/api/project/{project_id}/tasks")
+    new_tasks = [t for t in tasks if t.get("status") in FINAL_STATUSES and not archive.has(t["id"])]
+    print(f"  {len(tasks)} task(s) on server, {len(new_tasks)} new finished task(s) to archive")
+
+    def fetch(task):
+        output = api_get(base_url, headers, f"/api/project/{project_id}/tasks/{task['id']}/output")
+        return task, [ANSI_RE.sub('', line.get("output", "")).rstrip() for line in output]
+
+    added = 0
+    # Outputs are fetched in parallel; the archive itself is written from this thread
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for task, lines in pool.map(fetch, sorted(new_tasks, key=lambda t: t["id"])):
+            archive.add(task, templates.get(task.get("template_id"), f"template {task.get('template_id')}"), lines)
+            added += 1
+            if added % 50 == 0:
+                archive.save()
+    archive.save()
+    return added
+
+
+# ============================================
+# Search
+# ============================================
+
+def search(archive, pattern=None, signature=None, template=None, status=None, since=None, context=0, limit=50):
+    """Yield (task_id, line_number, line, context_lines) matches, newest task first."""
+    candidates = archive.select_tasks(template, status, since)
+    regex = re.compile(pattern) if pattern else None
+
+    if signature:
+        # Index path: matching lines are stored in the index, no decompression needed
+        postings = archive.index["signatures"].get(signature, {})
+        hits = [(task_id, number, text)
+                for task_id, lines in postings.items() if task_id in candidates
+                for number, text in lines if not regex or regex.search(text)]
+    elif regex:
+        # Full-text path: scan only the candidate tasks' compressed streams
+        def scan(task_id):
+            return [(task_id, number, line) for number, line in enumerate(archive.read(task_id), 1)
+                    if regex.search(line)]
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 2) as pool:
+            hits = [hit for result in pool.map(scan, candidates) for hit in result]
+    else:
+        hits = []
+
+    hits.sort(key=lambda h: (-int(h[0]), h[1]))
+    for task_id, number, text in hits[:limit]:
+        around = []
+        if context:
+            lines = archive.read(task_id)
+            around = [(n, lines[n - 1]) for n in range(max(1, number - context), min(len(lines), number + context) + 1)]
+        yield task_id, number, text, around
+    if len(hits) > limit:
+        print(f"… {len(hits) - limit} more match(es); use --limit to show more")
+
+
+def main():
+    # Semaphore passes variables as KEY=VALUE arguments; everything else is a normal CLI
+    variables = dict(arg.split("=", 1) for arg in sys.argv[1:] if re.match(r'^[A-Z_]+=', arg))
+    argv = [arg for arg in sys.argv[1:] if not re.match(r'^[A-Z_]+=', arg)]
+
+    parser = argparse.ArgumentParser(description="Archive and search Semaphore task logs")
+    parser.add_argument("--archive", default=DEFAULT_ARCHIVE)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_sync = sub.add_parser("sync", help="Archive newly finished tasks")
+    p_sync.add_argument("--url", default=variables.get("SEMAPHORE_URL", DEFAULT_URL))
+    p_sync.add_argument("--token", default=variables.get("SEMAPHORE_API_TOKEN") or os.environ.get("SEMAPHORE_API_TOKEN"))
+    p_sync.add_argument("--project", type=int, default=1)
+    p_sync.add_argument("--jobs", type=int, default=16,
+                        help="Download workers; the adaptive API limit decides how many run at once "
+                             "(default: %(default)s)")
+    p_search = sub.add_parser("search", help="Search archived lines")
+    p_search.add_argument("pattern", nargs="?", help="Regular expression")
+    p_search.add_argument("--signature", help="Error signature: failed, fatal, unreachable, error, http-NNN")
+    p_search.add_argument("--template", help="Template name substring (case-insensitive)")
+    p_search.add_argument("--status", choices=FINAL_STATUSES)
+    p_search.add_argument("--since", help="Only tasks created on or after this date (YYYY-MM-DD)")
+    p_search.add_argument("-C", "--context", type=int, default=0, help="Lines of context around matches")
+    p_search.add_argument("--limit", type=int, default=50)
+    p_show = sub.add_parser("show", help="Print one archived task log")
+    p_show.add_argument("task_id")
+    sub.add_parser("stats", help="Signature and failure counts")
+    args = parser.parse_args(argv)
+
+    archive = TaskLogArchive(args.archive)
+
+    if args.command == "sync":
+        if not args.token:
+            print("✗ SEMAPHORE_API_TOKEN not found in arguments or environment")
+            sys.exit(1)
+        print("=== Archiving Semaphore Task Logs ===")
+        api.configure(variables)
+        start = time.monotonic()
+        try:
+            added = sync(archive, args.url, args.token, args.project, args.jobs)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            archive.save()
+            print(f"✗ Sync failed: {e}")
+            sys.exit(1)
+        print(f"✓ Archived {added} task(s) in {time.monotonic() - start:.1f} s "
+              f"({len(archive.index['tasks'])} total)")
+        print(f"  Semaphore API: {api.describe()}")
+        return
+
+    if args.command == "search":
+        if not args.pattern and not args.signature:
+            parser.error("search needs a REGEX, --signature or both")
+        if args.signature and args.signature not in archive.index["signatures"]:
+            known = ", ".join(sorted(archive.index["signatures"])) or "none yet"
+            print(f"⚠ No lines with signature '{args.signature}' (indexed: {known})")
+            return
+        start = time.perf_counter()
+        count = 0
+        for task_id, number, text, around in search(archive, args.pattern, args.signature, args.template,
+                                                    args.status, args.since, args.context, args.limit):
+            meta = archive.index["tasks"][task_id]
+            count += 1
+            print(f"task {task_id} [{meta.get('status')}] {meta.get('template')} :{number}")
+            if around:
+                for n, line in around:
+                    print(f"  {'→' if n == number else ' '} {n:>5}  {line}")
+            else:
+                print(f"    {text}")
+        print(f"\n{count} match(es) in {(time.perf_counter() - start) * 1000:.1f} ms "
+              f"across {len(archive.index['tasks'])} archived task(s)")
+        return
+
+    if args.command == "show":
+        if not archive.has(args.task_id):
+            print(f"✗ Task {args.task_id} is not archived")
+            sys.exit(1)
+        print("\n".join(archive.read(args.task_id)))
+        return
+
+    if args.command == "stats":
+        tasks = archive.index["tasks"]
+        print(f"Archived tasks: {len(tasks)}")
+        print("Signatures:")
+        for signature, postings in sorted(archive.index["signatures"].items()):
+            lines = sum(len(v) for v in postings.values())
+            print(f"  - {signature}: {lines} line(s) in {len(postings)} task(s)")
+        failures = {}
+        for meta in tasks.values():
+            if meta.get("status") != "success":
+                failures[meta.get("template")] = failures.get(meta.get("template"), 0) + 1
+        if failures:
+            print("Failed tasks by template:")
+            for template, count in sorted(failures.items(), key=lambda item: -item[1]):
+                print(f"  - {template}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+DNS stack validator and load benchmark.
+Fires concurrent UDP/TCP queries at OPNsense Unbound and AdGuard Home and
+reports throughput, latency percentiles, cold versus cached latency,
+block-rule correctness and error rates.
+
+Uses only the standard library so it runs on Proxmox, the management VM or
+a workstation without installing anything.
+
+Usage:
+    benchmark-dns-stack.py                          # validate + benchmark both resolvers
+    benchmark-dns-stack.py --queries 5000 --concurrency 64 --protocol tcp
+    benchmark-dns-stack.py --domains domains.txt --adguard 127.0.0.1:5300 --no-unbound
+"""
+import argparse
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_UNBOUND = "10.10.20.1:5353"
+DEFAULT_ADGUARD = "10.10.20.10:53"
+DEFAULT_DOMAINS = [
+    "google.com", "youtube.com", "facebook.com", "wikipedia.org", "amazon.com",
+    "apple.com", "microsoft.com", "netflix.com", "github.com", "cloudflare.com",
+    "reddit.com", "debian.org", "proxmox.com", "opnsense.org", "mozilla.org",
+    "spotify.com", "twitch.tv", "bbc.co.uk", "nrk.no", "instagram.com",
+]
+DEFAULT_BLOCKED = ["doubleclick.net"]
+
+QTYPE_A = 1
+RCODE_NAMES = {0: "NOERROR", 1: "FORMERR", 2: "SERVFAIL", 3: "NXDOMAIN", 4: "NOTIMP", 5: "REFUSED"}
+
+
+# ============================================
+# DNS wire format
+# ============================================
+
+def build_query(query_id, domain, qtype=QTYPE_A):
+    """Build a recursive DNS query packet."""
+    header = struct.pack(">HHHHHH", query_id, 0x0100, 1, 0, 0, 0)
+    qname = b"".join(bytes([len(label)]) + label.encode("ascii")
+                     for label in domain.rstrip(".").split(".")) + b"\x00"
+    return header + qname + struct.pack(">HH", qtype, 1)
+
+
+def _skip_name(packet, offset):
+    """Return the offset just past an (optionally compressed) name."""
+    while True:
+        length = packet[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += length + 1
+
+
+def parse_response(packet, query_id):
+    """Parse a response into (rcode, [A record addresses]).
+
+    Raises ValueError for truncated or malformed packets and mismatched IDs.
+    """
+    try:
+        return _parse_response(packet, query_id)
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"malformed response: {e}")
+
+
+def _parse_response(packet, query_id):
+    if len(packet) < 12:
+        raise ValueError("short response")
+    resp_id, flags, qdcount, ancount, _, _ = struct.unpack(">HHHHHH", packet[:12])
+    if resp_id != query_id:
+        raise ValueError(f"ID mismatch ({resp_id} != {query_id})")
+    rcode = flags & 0x000F
+    offset = 12
+    for _ in range(qdcount):
+        offset = _skip_name(packet, offset) + 4
+    addresses = []
+    for _ in range(ancount):
+        offset = _skip_name(packet, offset)
+        rtype, _, _, rdlength = struct.unpack(">HHIH", packet[offset:offset + 10])
+        offset += 10
+        if offset + rdlength > len(packet):
+            raise ValueError("truncated answer")
+        if rtype == QTYPE_A and rdlength == 4:
+            addresses.append(socket.inet_ntoa(packet[offset:offset + 4]))
+        offset += rdlength
+    return rcode, addresses
+
+
+# ============================================
+# Transport
+# ============================================
+
+class Resolver:
+    """One resolver endpoint; keeps a socket per worker thread."""
+
+    def __init__(self, name, address, protocol="udp", timeout=2.0):
+        host, _, port = address.rpartition(":")
+        self.name = name
+        self.host = host
+        self.port = int(port)
+        self.protocol = protocol
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __str__(self):
+        return f"{self.name} ({self.host}:{self.port}/{self.protocol})"
+
+    def _socket(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            if self.protocol == "tcp":
+                sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            else:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sock.settimeout(self.timeout)
+                sock.connect((self.host, self.port))
+            self._local.sock = sock
+        return sock
+
+    def _reset(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def _recv_exact(self, sock, size):
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("connection closed by resolver")
+            data += chunk
+        return data
+
+    def query(self, domain):
+        """Send one A query; returns (latency_seconds, rcode, addresses)."""
+        query_id = random.getrandbits(16)
+        packet = build_query(query_id, domain)
+        start = time.perf_counter()
+        try:
+            sock = self._socket()
+            if self.protocol == "tcp":
+                # Persistent TCP connection with 2-byte length framing (RFC 7766)
+                sock.sendall(struct.pack(">H", len(packet)) + packet)
+                length = struct.unpack(">H", self._recv_exact(sock, 2))[0]
+                response = self._recv_exact(sock, length)
+            else:
+                sock.send(packet)
+                while True:
+                    response = sock.recv(4096)
+                    # Drop late answers to earlier timed-out queries
+                    if response[:2] == packet[:2]:
+                        break
+        except OSError:
+            self._reset()
+            raise
+        latency = time.perf_counter() - start
+        rcode, addresses = parse_response(response, query_id)
+        return latency, rcode, addresses
+
+
+# ============================================
+# Statistics
+# ============================================
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def fmt_ms(value):
+    return "   n/a" if value is None else f"{value * 1000:6.1f}"
+
+
+class RunStats:
+    """Collected results from one benchmark run."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cold = []
+        self.warm = []
+        self.errors = {}
+        self.rcodes = {}
+
+    def record(self, latency, rcode, cold):
+        with self.lock:
+            (self.cold if cold else self.warm).append(latency)
+            name = RCODE_NAMES.get(rcode, str(rcode))
+            self.rcodes[name] = self.rcodes.get(name, 0) + 1
+
+    def record_error(self, error):
+        key = type(error).__name__
+        with self.lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    @property
+    def completed(self):
+        return len(self.cold) + len(self.warm)
+
+    @property
+    def failed(self):
+        return sum(self.errors.values())
+
+
+# ============================================
+# Validation
+# ============================================
+
+def validate(resolver, test_domain, blocked_domains, check_blocking):
+    """Run the functional checks; returns the number of issues found."""
+    issues = 0
+    print(f"\n=== Validating {resolver} ===")
+    try:
+        latency, rcode, addresses = resolver.query(test_domain)
+        if rcode == 0 and addresses:
+            print(f"  ✓ {test_domain} resolved to {addresses[0]} in {latency * 1000:.1f} ms")
+        else:
+            print(f"  ⚠ {test_domain}: {RCODE_NAMES.get(rcode, rcode)}, no A records")
+            issues += 1
+    except (OSError, ValueError) as e:
+        print(f"  ✗ {test_domain}: {e}")
+        return issues + 1
+
+    if not check_blocking:
+        return issues
+
+    for domain in blocked_domains:
+        try:
+            _, rcode, addresses = resolver.query(domain)
+        except (OSError, ValueError) as e:
+            print(f"  ✗ Block check {domain}: {e}")
+            issues += 1
+            continue
+        # AdGuard answers blocked names with 0.0.0.0, NXDOMAIN or an empty answer
+        if rcode == 3 or not addresses or all(a == "0.0.0.0" for a in addresses):
+            print(f"  ✓ {domain} blocked")
+        else:
+            print(f"  ⚠ {domain} not blocked (resolved to: {', '.join(addresses)})")
+            issues += 1
+    return issues
+
+
+# ============================================
+# Benchmark
+# ============================================
+
+def benchmark(resolver, domains, total_queries, concurrency):
+    """Run a cold pass then a cached load pass with bounded concurrency.
+
+    The cold pass queries each domain once; flush the resolver caches
+    beforehand for true cold numbers. The load pass then fires
+    total_queries queries over the same list, which the resolver should
+    answer from cache. Throughput is measured on the load pass.
+    """
+    stats = RunStats()
+
+    def run(workload, cold):
+        def run_one(domain):
+            try:
+                latency, rcode, _ = resolver.query(domain)
+                stats.record(latency, rcode, cold)
+            except (OSError, ValueError) as e:
+                stats.record_error(e)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            # Drain the iterator so worker exceptions surface here
+            list(pool.map(run_one, workload))
+        return time.perf_counter() - start
+
+    run(list(dict.fromkeys(domains)), cold=True)
+    elapsed = run([domains[i % len(domains)] for i in range(total_queries)], cold=False)
+    return stats, elapsed
+
+
+def print_report(resolver, stats, elapsed):
+    combined = sorted(stats.cold + stats.warm)
+    cold = sorted(stats.cold)
+    warm = sorted(stats.warm)
+    qps = len(warm) / elapsed if elapsed > 0 else 0.0
+    attempted = stats.completed + stats.failed
+    error_rate = stats.failed / attempted * 100 if attempted else 0.0
+
+    print(f"\n--- {resolver} ---")
+    print(f"  Queries: {attempted}  completed: {stats.completed}  "
+          f"errors: {stats.failed} ({error_rate:.2f}%)")
+    print(f"  Throughput (cached load): {qps:.0f} qps over {elapsed:.2f} s")
+    print(f"  {'':8}{'p50':>8}{'p95':>8}{'p99':>8}  (ms)")
+    for label, values in (("all", combined), ("cold", cold), ("cached", warm)):
+        print(f"  {label:8}{fmt_ms(percentile(values, 50)):>8}"
+              f"{fmt_ms(percentile(values, 95)):>8}{fmt_ms(percentile(values, 99)):>8}"
+              f"  n={len(values)}")
+    if stats.rcodes:
+        print("  Response codes: " + ", ".join(f"{k}={v}" for k, v in sorted(stats.rcodes.items())))
+    if stats.errors:
+        print("  Errors: " + ", ".join(f"{k}={v}" for k, v in sorted(stats.errors.items())))
+    return error_rate
+
+
+def load_domains(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate and benchmark the PrivateBox DNS stack")
+    parser.add_argument("--unbound", default=DEFAULT_UNBOUND, help="Unbound HOST:PORT (default: %(default)s)")
+    parser.add_argument("--adguard", default=DEFAULT_ADGUARD, help="AdGuard HOST:PORT (default: %(default)s)")
+    parser.add_argument("--no-unbound", action="store_true", help="Skip the Unbound resolver")
+    parser.add_argument("--no-adguard", action="store_true", help="Skip the AdGuard resolver")
+    parser.add_argument("--domains", help="File with one domain per line (default: built-in list)")
+    parser.add_argument("--blocked", action="append", help="Domain AdGuard must block (repeatable)")
+    parser.add_argument("--protocol", choices=["udp", "tcp"], default="udp")
+    parser.add_argument("--queries", type=int, default=1000, help="Queries per resolver (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Parallel workers (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=2.0, help="Per-query timeout in seconds")
+    parser.add_argument("--max-error-rate", type=float, default=1.0,
+                        help="Fail when the error rate exceeds this percentage (default: %(default)s)")
+    parser.add_argument("--validate-only", action="store_true", help="Run functional checks only")
+    args = parser.parse_args()
+
+    try:
+        domains = load_domains(args.domains) if args.domains else DEFAULT_DOMAINS
+    except OSError as e:
+        parser.error(f"cannot read domains file: {e}")
+    if not domains:
+        parser.error(f"no domains in {args.domains}")
+    blocked = args.blocked or DEFAULT_BLOCKED
+
+    # (resolver, filters ads?) — Unbound is the upstream and never blocks
+    targets = []
+    if not args.no_unbound:
+        targets.append((Resolver("Unbound", args.unbound, args.protocol, args.timeout), False))
+    if not args.no_adguard:
+        targets.append((Resolver("AdGuard", args.adguard, args.protocol, args.timeout), True))
+    if not targets:
+        parser.error("nothing to test: both resolvers disabled")
+
+    print("=== DNS Stack Validation and Benchmark ===")
+    print(f"Time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Domains: {len(domains)}  protocol: {args.protocol}")
+
+    issues = 0
+    for resolver, filtering in targets:
+        issues += validate(resolver, domains[0], blocked, filtering)
+
+    if not args.validate_only:
+        print(f"\n=== Benchmark: {args.queries} queries, concurrency {args.concurrency} ===")
+        for resolver, _ in targets:
+            stats, elapsed = benchmark(resolver, domains, args.queries, args.concurrency)
+            error_rate = print_report(resolver, stats, elapsed)
+            if error_rate > args.max_error_rate:
+                print(f"  ✗ Error rate above {args.max_error_rate}%: resolver is saturated or unreachable")
+                issues += 1
+
+    print("\n=== Summary ===")
+    if issues:
+        print(f"✗ Found {issues} issue(s) that need attention.")
+        sys.exit(1)
+    print("✓ All checks passed!")
+
+
+if __name__ == "__main__":
+    main()
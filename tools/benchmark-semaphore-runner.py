@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Semaphore runner capacity benchmark.
+Submits the "Semaphore: Benchmark No-op Task" template at increasing rates
+through the same API calls the orchestrators use (POST /tasks, then task
+polling) and reports submit latency, queue wait, run time and throughput
+for every rate, ending with a saturation curve.
+
+Each task gets a noop_sleep extra var drawn from --mix, so short and long
+tasks can be combined (e.g. "0:3,10:1" = three instant tasks per 10 s task).
+
+Usage:
+    benchmark-semaphore-runner.py SEMAPHORE_API_TOKEN=... [--rates 0.1,0.2,0.5,1]
+    benchmark-semaphore-runner.py --stand-in 2          # local simulated server, 2 runner slots
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# Auto-install dependencies if not available
+try:
+    import requests
+    import urllib3
+except ImportError:
+    import subprocess
+    print("Installing requests package...")
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'requests'])
+    import requests
+    import urllib3
+
+# Disable SSL warnings for self-signed certificates (internal Services VLAN only)
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+DEFAULT_URL = "https://10.10.20.10:2443"
+DEFAULT_TEMPLATE = "Semaphore: Benchmark No-op Task"
+FINAL_STATUSES = ("success", "error", "failed", "stopped")
+
+
+# ============================================
+# Statistics
+# ============================================
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def fmt_s(value, width=7):
+    return f"{'n/a':>{width}}" if value is None else f"{value:{width}.2f}"
+
+
+def parse_time(value):
+    """Parse a Semaphore timestamp; None for empty or zero values."""
+    if not value or value.startswith("0001-"):
+        return None
+    # Semaphore returns nanoseconds; datetime accepts at most microseconds
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value.replace("Z", "+00:00"))
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def peak_overlap(intervals):
+    """Largest number of simultaneously running tasks."""
+    events = sorted([(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals])
+    running = peak = 0
+    for _, delta in events:
+        running += delta
+        peak = max(peak, running)
+    return peak
+
+
+class TaskRecord:
+    """Timings for one submitted task."""
+
+    def __init__(self, sleep):
+        self.sleep = sleep
+        self.task_id = None
+        self.submitted = None      # local time the POST returned
+        self.submit_latency = None
+        self.seen_running = None   # local time polling first saw it running
+        self.finished = None       # local time polling saw a final status
+        self.status = None
+        self.server = {}           # created/start/end from the API
+        self.error = None
+
+    @property
+    def queue_wait(self):
+        created, start = self.server.get("created"), self.server.get("start")
+        if created and start:
+            return max(0.0, start - created)
+        if self.seen_running and self.submitted:
+            return self.seen_running - self.submitted
+        return None
+
+    @property
+    def run_time(self):
+        start, end = self.server.get("start"), self.server.get("end")
+        if start and end:
+            return max(0.0, end - start)
+        if self.seen_running and self.finished:
+            return self.finished - self.seen_running
+        return None
+
+
+# ============================================
+# API client
+# ============================================
+
+class SemaphoreClient:
+    """The orchestrators' task calls, with timing."""
+
+    def __init__(self, base_url, api_token, project_id):
+        self.base_url = base_url.rstrip("/")
+        self.project_id = project_id
+        self.headers = {"Authorization": f"Bearer {api_token}"}
+
+    def find_template_id(self, name):
+        response = requests.get(f"{self.base_url}/api/project/{self.project_id}/templates",
+                                headers=self.headers, timeout=10, verify=False)
+        response.raise_for_status()
+        for template in response.json():
+            if template.get("name") == name:
+                return template.get("id")
+        return None
+
+    def submit(self, template_id, record):
+        payload = {
+            "template_id": template_id,
+            "debug": False,
+            "dry_run": False,
+            "environment": json.dumps({"noop_sleep": record.sleep}),
+        }
+        start = time.monotonic()
+        try:
+            response = requests.post(f"{self.base_url}/api/project/{self.project_id}/tasks",
+                                     headers=self.headers, json=payload, timeout=30, verify=False)
+        except requests.exceptions.RequestException as e:
+            record.error = type(e).__name__
+            return
+        record.submit_latency = time.monotonic() - start
+        record.submitted = time.monotonic()
+        if response.status_code == 201:
+            record.task_id = response.json().get("id")
+        else:
+            record.error = f"HTTP {response.status_code}"
+
+    def poll(self, record):
+        try:
+            response = requests.get(
+                f"{self.base_url}/api/project/{self.project_id}/tasks/{record.task_id}",
+                headers=self.headers, timeout=10, verify=False)
+        except requests.exceptions.RequestException:
+            return
+        if response.status_code != 200:
+            return
+        task = response.json()
+        status = task.get("status", "unknown")
+        now = time.monotonic()
+        if status == "running" and record.seen_running is None:
+            record.seen_running = now
+        if status in FINAL_STATUSES:
+            if record.seen_running is None:
+                record.seen_running = now
+            record.finished = now
+            record.status = status
+            record.server = {key: parse_time(task.get(key)) for key in ("created", "start", "end")}
+
+
+# ============================================
+# Load generation
+# ============================================
+
+def parse_mix(text):
+    """'0:3,10:1' → [(0, 3), (10, 1)] (sleep seconds, weight)."""
+    mix = []
+    for part in text.split(","):
+        sleep, _, weight = part.partition(":")
+        mix.append((int(sleep), int(weight or 1)))
+    if not mix or any(weight <= 0 or sleep < 0 for sleep, weight in mix):
+        raise argparse.ArgumentTypeError(f"invalid mix: {text}")
+    return mix
+
+
+def run_level(client, template_id, rate, duration, mix, poll_interval, timeout, rng):
+    """Submit at a fixed rate for duration seconds, then wait for every task."""
+    count = max(1, int(rate * duration))
+    sleeps = [s for s, _ in mix]
+    weights = [w for _, w in mix]
+    records = [TaskRecord(rng.choices(sleeps, weights)[0]) for _ in range(count)]
+
+    active = []
+    active_lock = threading.Lock()
+    submitting = threading.Event()
+    submitting.set()
+
+    def submitter():
+        start = time.monotonic()
+        # Submissions run on a small pool so a slow POST does not delay the schedule
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            def submit_one(record):
+                client.submit(template_id, record)
+                if record.task_id is not None:
+                    with active_lock:
+                        active.append(record)
+            for i, record in enumerate(records):
+                delay = start + i / rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(submit_one, record)
+        submitting.clear()
+
+    thread = threading.Thread(target=submitter, daemon=True)
+    level_start = time.monotonic()
+    thread.start()
+
+    with ThreadPoolExecutor(max_workers=8) as pollers:
+        deadline = level_start + duration + timeout
+        while time.monotonic() < deadline:
+            with active_lock:
+                pending = [r for r in active if r.finished is None]
+            if not pending and not submitting.is_set():
+                break
+            list(pollers.map(client.poll, pending))
+            time.sleep(poll_interval)
+    thread.join()
+    return records, time.monotonic() - level_start
+
+
+def summarize(rate, records, elapsed, max_queue_wait):
+    done = [r for r in records if r.finished is not None]
+    ok = [r for r in done if r.status == "success"]
+    submit = sorted(r.submit_latency for r in records if r.submit_latency is not None)
+    queue = sorted(r.queue_wait for r in done if r.queue_wait is not None)
+    run = sorted(r.run_time for r in done if r.run_time is not None)
+    intervals = [(r.server["start"], r.server["end"]) for r in done
+                 if r.server.get("start") and r.server.get("end")]
+    throughput = len(done) / elapsed if elapsed > 0 else 0.0
+    row = {
+        "rate": rate,
+        "submitted": sum(1 for r in records if r.task_id is not None),
+        "completed": len(ok),
+        "failed": len(records) - len(ok),
+        "throughput": throughput,
+        "submit_p50": percentile(submit, 50),
+        "submit_p95": percentile(submit, 95),
+        "queue_p50": percentile(queue, 50),
+        "queue_p95": percentile(queue, 95),
+        "queue_p99": percentile(queue, 99),
+        "run_p50": percentile(run, 50),
+        "peak_running": peak_overlap(intervals) if intervals else None,
+        "errors": sorted({r.error or r.status for r in records if r not in ok and (r.error or r.status)}),
+    }
+    # Saturated: tasks wait too long, or the runner cannot keep up with the offered rate
+    row["saturated"] = (
+        (row["queue_p95"] is not None and row["queue_p95"] > max_queue_wait)
+        or len(done) < len(records)
+    )
+    return row
+
+
+def print_level(row):
+    print(f"  Submitted: {row['submitted']}  completed: {row['completed']}  failed: {row['failed']}"
+          + (f"  ({', '.join(row['errors'])})" if row["errors"] else ""))
+    print(f"  Throughput: {row['throughput']:.2f} tasks/s  peak running: {row['peak_running'] or 'n/a'}")
+    print(f"  Submit latency p50/p95: {fmt_s(row['submit_p50'], 0)} / {fmt_s(row['submit_p95'], 0)} s")
+    print(f"  Queue wait p50/p95/p99: {fmt_s(row['queue_p50'], 0)} / {fmt_s(row['queue_p95'], 0)} / "
+          f"{fmt_s(row['queue_p99'], 0)} s")
+    print(f"  Run time p50: {fmt_s(row['run_p50'], 0)} s")
+    print(f"  {'⚠ Saturated' if row['saturated'] else '✓ Keeping up'}")
+
+
+def print_curve(rows, max_queue_wait):
+    print("\n=== Saturation Curve ===")
+    print(f"{'offered/s':>10}{'done/s':>8}{'submit p50':>11}{'queue p50':>10}{'queue p95':>10}"
+          f"{'run p50':>9}  queue p95")
+    scale = max([r["queue_p95"] or 0 for r in rows] + [max_queue_wait])
+    for row in rows:
+        bar = "█" * int(round((row["queue_p95"] or 0) / scale * 30)) if scale else ""
+        marker = " ⚠" if row["saturated"] else ""
+        print(f"{row['rate']:>10.2f}{row['throughput']:>8.2f}{fmt_s(row['submit_p50'], 11)}"
+              f"{fmt_s(row['queue_p50'], 10)}{fmt_s(row['queue_p95'], 10)}{fmt_s(row['run_p50'], 9)}"
+              f"  {bar}{marker}")
+    keeping_up = [r for r in rows if not r["saturated"]]
+    if keeping_up:
+        best = max(keeping_up, key=lambda r: r["rate"])
+        print(f"\n✓ Sustainable rate: {best['rate']:.2f} tasks/s "
+              f"(queue wait p95 {fmt_s(best['queue_p95'], 0)} s, limit {max_queue_wait:.0f} s)")
+    else:
+        print(f"\n✗ Saturated at every tested rate (queue wait limit {max_queue_wait:.0f} s)")
+
+
+# ============================================
+# Local stand-in server
+# ============================================
+
+def start_stand_in(slots, overhead, template_name):
+    """Minimal Semaphore API with a fixed number of runner slots; returns its URL."""
+    import http.server
+
+    lock = threading.Lock()
+    tasks = {}
+    queue = []
+    wakeup = threading.Condition(lock)
+
+    def iso(ts):
+        return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ") if ts else ""
+
+    def runner():
+        while True:
+            with wakeup:
+                while not queue:
+                    wakeup.wait()
+                task = queue.pop(0)
+                task["status"], task["start"] = "running", time.time()
+            time.sleep(overhead + task["sleep"])
+            with lock:
+                task["status"], task["end"] = "success", time.time()
+
+    for _ in range(slots):
+        threading.Thread(target=runner, daemon=True).start()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def reply(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.endswith("/templates"):
+                return self.reply(200, [{"id": 1, "name": template_name}])
+            match = re.search(r"/tasks/(\d+)$", self.path)
+            with lock:
+                task = tasks.get(int(match.group(1))) if match else None
+                if not task:
+                    return self.reply(404, {})
+                body = {"id": task["id"], "status": task["status"], "created": iso(task["created"]),
+                        "start": iso(task.get("start")), "end": iso(task.get("end"))}
+            self.reply(200, body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            extra = json.loads(payload.get("environment") or "{}")
+            with wakeup:
+                task = {"id": len(tasks) + 1, "status": "waiting", "created": time.time(),
+                        "sleep": float(extra.get("noop_sleep", 0))}
+                tasks[task["id"]] = task
+                queue.append(task)
+                wakeup.notify()
+            self.reply(201, {"id": task["id"]})
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    # Semaphore passes variables as KEY=VALUE arguments; everything else is a flag
+    variables = dict(arg.split("=", 1) for arg in sys.argv[1:] if "=" in arg and not arg.startswith("-"))
+    argv = [arg for arg in sys.argv[1:] if not ("=" in arg and not arg.startswith("-"))]
+
+    parser = argparse.ArgumentParser(description="Measure Semaphore runner capacity")
+    parser.add_argument("--url", default=variables.get("SEMAPHORE_URL", DEFAULT_URL))
+    parser.add_argument("--token", default=variables.get("SEMAPHORE_API_TOKEN") or os.environ.get("SEMAPHORE_API_TOKEN"))
+    parser.add_argument("--project", type=int, default=1)
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE, help="No-op template name (default: %(default)s)")
+    parser.add_argument("--rates", default="0.1,0.2,0.5,1",
+                        help="Comma-separated submit rates in tasks/s (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of submissions per rate (default: %(default)s)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("0:1"),
+                        help="noop_sleep seconds:weight pairs (default: 0:1)")
+    parser.add_argument("--max-queue-wait", type=float, default=10,
+                        help="Queue wait p95 in seconds that counts as saturated (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=600,
+                        help="Seconds to wait for tasks after submissions end (default: %(default)s)")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--keep-going", action="store_true", help="Continue to higher rates after saturation")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--stand-in", type=int, metavar="SLOTS",
+                        help="Run against a local simulated server with SLOTS runners")
+    parser.add_argument("--stand-in-overhead", type=float, default=1.0,
+                        help="Simulated per-task Ansible start-up time in seconds (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    rates = sorted(float(r) for r in args.rates.split(","))
+    if args.stand_in:
+        args.url = start_stand_in(args.stand_in, args.stand_in_overhead, args.template)
+        args.token = args.token or "stand-in"
+    if not args.token:
+        parser.error("SEMAPHORE_API_TOKEN not found in arguments or environment")
+
+    client = SemaphoreClient(args.url, args.token, args.project)
+
+    print("=== Semaphore Runner Capacity Benchmark ===")
+    print(f"Time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Server: {args.url}" + (f" (stand-in, {args.stand_in} runner slots)" if args.stand_in else ""))
+    print(f"Rates: {', '.join(f'{r:g}' for r in rates)} tasks/s, {args.duration:g} s each")
+    print(f"Mix: {', '.join(f'{s}s×{w}' for s, w in args.mix)}")
+
+    try:
+        template_id = client.find_template_id(args.template)
+    except requests.exceptions.RequestException as e:
+        print(f"✗ Cannot list templates: {e}")
+        sys.exit(1)
+    if not template_id:
+        print(f"✗ Template not found: {args.template}")
+        print("  Run 'Generate Templates' to create it from semaphore-benchmark-noop.yml")
+        sys.exit(1)
+    print(f"✓ Template '{args.template}' (ID: {template_id})")
+
+    rng = random.Random(args.seed)
+    rows = []
+    for rate in rates:
+        print(f"\n=== Rate {rate:g} tasks/s ===")
+        records, elapsed = run_level(client, template_id, rate, args.duration, args.mix,
+                                     args.poll_interval, args.timeout, rng)
+        row = summarize(rate, records, elapsed, args.max_queue_wait)
+        print_level(row)
+        rows.append(row)
+        if row["saturated"] and not args.keep_going:
+            print("  → Stopping: higher rates would only grow the queue (use --keep-going to continue)")
+            break
+
+    print_curve(rows, args.max_queue_wait)
+    sys.exit(0 if any(not r["saturated"] for r in rows) else 1)
+
+
+if __name__ == "__main__":
+    main()
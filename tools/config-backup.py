@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+PrivateBox configuration backup.
+Backs up the service configuration (OPNsense config.xml and its .bak
+copies, AdGuard, Caddy and Homer configs and data) into a local,
+deduplicated repository.
+
+Files are split with content-defined chunking, so an edit only changes the
+chunks around it and near-identical files (config.xml and its many
+timestamped .bak copies) share almost all of their chunks. Each unique
+chunk is stored once, compressed; each backup is a small JSON manifest
+listing the chunks of every file. Files whose size and mtime did not
+change since the last backup are not read again at all, so a daily backup
+costs only the changed bytes in space and time, and restore points are
+cheap to keep.
+
+Repository layout (--repo, default /opt/privatebox/backups/config):
+    chunks/<xx>/<sha256>     zlib-compressed chunk
+    snapshots/<id>.json      manifest of one backup
+    files-cache.json         size/mtime → chunks of the last backup
+
+Commands:
+    backup                   Back up the sources (--source, --opnsense, --exclude)
+    list                     List backups with their logical and new sizes
+    restore ID --target DIR  Restore a backup (or --path PREFIX) below DIR
+    prune --keep N           Keep the newest N backups and delete unused chunks
+    stats                    Repository size versus the data it holds
+
+Examples:
+    ./config-backup.py backup
+    ./config-backup.py restore 20261019-020000 --target /tmp/restore --path opnsense:
+    ./config-backup.py prune --keep 30
+"""
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import stat
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zlib
+from pathlib import Path
+
+DEFAULT_REPO = os.environ.get("CONFIG_BACKUP_REPO", "/opt/privatebox/backups/config")
+DEFAULT_SOURCES = [
+    "/opt/privatebox/config/adguard",
+    "/opt/privatebox/data/adguard",
+    "/opt/caddy",
+    "/opt/homer",
+]
+# Downloaded blocklists are fetched again by AdGuard on start
+DEFAULT_EXCLUDES = ["*/data/filters/*"]
+DEFAULT_OPNSENSE = "root@10.10.20.1"
+DEFAULT_OPNSENSE_KEY = "/root/.credentials/opnsense/id_ed25519"
+# config.xml, the .bak copies written by opnsense_config_patch and OPNsense's own history
+OPNSENSE_COMMAND = "cd / && tar cf - conf/config.xml conf/config.xml.*.bak conf/backup 2>/dev/null; true"
+OPNSENSE_PREFIX = "opnsense:"
+
+# Chunking: 2 KB minimum, ~8 KB average, 64 KB maximum
+MIN_CHUNK = 2 * 1024
+AVERAGE_BITS = 13
+MAX_CHUNK = 64 * 1024
+READ_SIZE = 4 * 1024 * 1024
+
+
+def _gear_table():
+    # Derived, not random: chunk boundaries must be the same in every run
+    return [int.from_bytes(hashlib.sha256(b"privatebox-gear-%d" % i).digest()[:4], "big") for i in range(256)]
+
+
+GEAR = _gear_table()
+BOUNDARY_MASK = ((1 << AVERAGE_BITS) - 1) << (32 - AVERAGE_BITS)
+
+
+# ============================================
+# Content-defined chunking
+# ============================================
+
+def find_cut(data, start, end):
+    """Offset just past the first content-defined boundary in data[start:end]."""
+    if end - start <= MIN_CHUNK:
+        return end
+    limit = min(end, start + MAX_CHUNK)
+    gear = GEAR
+    h = 0
+    # Gear hash: a boundary depends only on the last 32 bytes, so chunks
+    # resynchronise right after an insertion or deletion
+    for pos in range(start + MIN_CHUNK, limit):
+        h = ((h << 1) + gear[data[pos]]) & 0xFFFFFFFF
+        if not h & BOUNDARY_MASK:
+            return pos + 1
+    return limit
+
+
+def chunk_stream(stream):
+    """Yield chunks from a binary stream, holding at most READ_SIZE + MAX_CHUNK bytes."""
+    buffer = b""
+    eof = False
+    while True:
+        if not eof and len(buffer) < MAX_CHUNK:
+            block = stream.read(READ_SIZE)
+            eof = not block
+            buffer += block
+        if not buffer:
+            return
+        start = 0
+        # Only cut where a full MAX_CHUNK window is available, unless at the end
+        while len(buffer) - start >= MAX_CHUNK or (eof and start < len(buffer)):
+            cut = find_cut(buffer, start, len(buffer))
+            yield buffer[start:cut]
+            start = cut
+        buffer = buffer[start:]
+
+
+# ============================================
+# Repository
+# ============================================
+
+class Repository:
+    """Chunk store plus backup manifests."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.chunk_dir = self.root / "chunks"
+        self.snapshot_dir = self.root / "snapshots"
+        self.cache_path = self.root / "files-cache.json"
+        self._known = None
+
+    def init(self):
+        for directory in (self.root, self.chunk_dir, self.snapshot_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+        # Backups contain certificates and keys
+        os.chmod(self.root, 0o700)
+
+    def _chunk_path(self, digest):
+        return self.chunk_dir / digest[:2] / digest
+
+    @property
+    def known(self):
+        """Digests of all stored chunks, listed once per run."""
+        if self._known is None:
+            self._known = set()
+            if self.chunk_dir.exists():
+                for sub in os.scandir(self.chunk_dir):
+                    if sub.is_dir():
+                        self._known.update(entry.name for entry in os.scandir(sub.path))
+        return self._known
+
+    def put_chunk(self, data):
+        """Store a chunk unless present; returns (digest, bytes written)."""
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in self.known:
+            return digest, 0
+        compressed = zlib.compress(data, 6)
+        # Incompressible data (certificates, databases) is stored as is
+        payload = b"z" + compressed if len(compressed) < len(data) else b"r" + data
+        path = self._chunk_path(digest)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_name(f".{digest}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+        self.known.add(digest)
+        return digest, len(payload)
+
+    def read_chunk(self, digest):
+        with open(self._chunk_path(digest), "rb") as f:
+            payload = f.read()
+        data = zlib.decompress(payload[1:]) if payload[:1] == b"z" else payload[1:]
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"chunk {digest} is corrupt")
+        return data
+
+    def chunk_size(self, digest):
+        return self._chunk_path(digest).stat().st_size
+
+    def save_snapshot(self, manifest):
+        """Write the manifest last and atomically: an interrupted backup leaves no snapshot."""
+        path = self.snapshot_dir / f"{manifest['id']}.json"
+        fd, tmp = tempfile.mkstemp(dir=self.snapshot_dir, prefix=".snapshot-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def snapshots(self):
+        """Snapshot IDs, oldest first."""
+        if not self.snapshot_dir.exists():
+            return []
+        return sorted(p.stem for p in self.snapshot_dir.glob("*.json"))
+
+    def load_snapshot(self, snapshot_id):
+        path = self.snapshot_dir / f"{snapshot_id}.json"
+        if not path.exists():
+            raise SystemExit(f"✗ No backup {snapshot_id} in {self.root}")
+        with open(path) as f:
+            return json.load(f)
+
+    def delete_snapshot(self, snapshot_id):
+        (self.snapshot_dir / f"{snapshot_id}.json").unlink()
+
+    def load_files_cache(self):
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_files_cache(self, cache):
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".files-cache-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(cache, f, separators=(",", ":"))
+        os.replace(tmp, self.cache_path)
+
+    def collect_garbage(self):
+        """Delete chunks no snapshot references; returns (chunks, bytes) freed."""
+        referenced = set()
+        for snapshot_id in self.snapshots():
+            for entry in self.load_snapshot(snapshot_id)["files"]:
+                referenced.update(entry.get("chunks", ()))
+        freed = freed_bytes = 0
+        for digest in list(self.known - referenced):
+            path = self._chunk_path(digest)
+            freed_bytes += path.stat().st_size
+            path.unlink()
+            self.known.discard(digest)
+            freed += 1
+        return freed, freed_bytes
+
+
+# ============================================
+# Backup
+# ============================================
+
+class BackupRun:
+    """Counters and the manifest of one backup."""
+
+    def __init__(self, repo, previous_cache):
+        self.repo = repo
+        self.previous_cache = previous_cache
+        self.cache = {}
+        self.files = []
+        self.read_bytes = 0
+        self.logical_bytes = 0
+        self.new_bytes = 0
+        self.new_chunks = 0
+        self.unchanged = 0
+
+    def add_stream(self, path, stream, size, mtime, mode, uid=0, gid=0, inode=None):
+        key = [size, mtime, inode]
+        cached = self.previous_cache.get(path)
+        if cached and cached[:3] == key and all(d in self.repo.known for d in cached[3]):
+            chunks = cached[3]
+            self.unchanged += 1
+        else:
+            chunks = []
+            with stream() as f:
+                for chunk in chunk_stream(f):
+                    digest, written = self.repo.put_chunk(chunk)
+                    chunks.append(digest)
+                    self.read_bytes += len(chunk)
+                    if written:
+                        self.new_chunks += 1
+                        self.new_bytes += written
+        self.cache[path] = key + [chunks]
+        self.logical_bytes += size
+        self.files.append({"path": path, "type": "file", "size": size, "mtime": mtime,
+                           "mode": mode, "uid": uid, "gid": gid, "chunks": chunks})
+
+    def add_symlink(self, path, target, mtime):
+        self.files.append({"path": path, "type": "symlink", "target": target, "mtime": mtime})
+
+    def add_local(self, root, excludes):
+        root = os.path.abspath(root)
+        if not os.path.exists(root):
+            print(f"  ⚠ {root} does not exist, skipped")
+            return
+        for directory, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(directory, name)
+                if any(fnmatch.fnmatch(path, pattern) for pattern in excludes):
+                    continue
+                info = os.lstat(path)
+                if stat.S_ISLNK(info.st_mode):
+                    self.add_symlink(path, os.readlink(path), info.st_mtime_ns)
+                elif stat.S_ISREG(info.st_mode):
+                    self.add_stream(path, lambda p=path: open(p, "rb"), info.st_size, info.st_mtime_ns,
+                                    stat.S_IMODE(info.st_mode), info.st_uid, info.st_gid, info.st_ino)
+
+    def add_opnsense(self, target, key, timeout=120):
+        """Stream OPNsense's config files as a tar over SSH; nothing is staged on disk."""
+        command = ["ssh", "-o", "BatchMode=yes", "-o", "StrictHostKeyChecking=no", "-o", "UserKnownHostsFile=/dev/null",
+                   "-o", "LogLevel=ERROR", "-o", "ConnectTimeout=10"]
+        if key and os.path.exists(key):
+            command += ["-i", key]
+        process = subprocess.Popen(command + [target, OPNSENSE_COMMAND], stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        count = 0
+        try:
+            with tarfile.open(fileobj=process.stdout, mode="r|") as tar:
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    path = OPNSENSE_PREFIX + "/" + member.name
+                    # Remote files cannot be stat'ed cheaply, so the tar header stands in
+                    self.add_stream(path, lambda m=member: tar.extractfile(m), member.size,
+                                    int(member.mtime) * 1_000_000_000, member.mode, member.uid, member.gid)
+                    count += 1
+        except tarfile.ReadError:
+            pass
+        finally:
+            process.stdout.close()
+            stderr = process.stderr.read().decode(errors="replace").strip()
+            process.stderr.close()
+            code = process.wait(timeout=timeout)
+        if count == 0:
+            raise RuntimeError(stderr or f"ssh exited with code {code}")
+        return count
+
+
+def run_backup(repo, sources, excludes, opnsense, opnsense_key):
+    repo.init()
+    start = time.monotonic()
+    run = BackupRun(repo, repo.load_files_cache())
+    errors = []
+    for source in sources:
+        run.add_local(source, excludes)
+    if opnsense:
+        try:
+            count = run.add_opnsense(opnsense, opnsense_key)
+            print(f"  ✓ OPNsense: {count} file(s) from {opnsense}")
+        except (OSError, RuntimeError, subprocess.SubprocessError) as e:
+            errors.append(f"OPNsense: {e}")
+            print(f"  ✗ OPNsense: {e}")
+
+    snapshot_id = time.strftime("%Y%m%d-%H%M%S")
+    existing = set(repo.snapshots())
+    suffix = 1
+    while snapshot_id + (f"-{suffix}" if suffix > 1 else "") in existing:
+        suffix += 1
+    snapshot_id += f"-{suffix}" if suffix > 1 else ""
+    manifest = {
+        "id": snapshot_id,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "sources": list(sources) + ([f"{OPNSENSE_PREFIX}{opnsense}"] if opnsense else []),
+        "errors": errors,
+        "stats": {"files": len(run.files), "unchanged_files": run.unchanged, "logical_bytes": run.logical_bytes,
+                  "read_bytes": run.read_bytes, "new_chunks": run.new_chunks, "new_bytes": run.new_bytes,
+                  "elapsed_ms": round((time.monotonic() - start) * 1000)},
+        "files": run.files,
+    }
+    repo.save_snapshot(manifest)
+    repo.save_files_cache(run.cache)
+    return manifest
+
+
+# ============================================
+# Restore
+# ============================================
+
+def restore_path(target, path):
+    """Where a backed-up path lands below target ('opnsense:/conf/x' → target/opnsense/conf/x)."""
+    if path.startswith(OPNSENSE_PREFIX):
+        return os.path.join(target, "opnsense", path[len(OPNSENSE_PREFIX):].lstrip("/"))
+    return os.path.join(target, path.lstrip("/"))
+
+
+def run_restore(repo, snapshot_id, target, prefix=None):
+    manifest = repo.load_snapshot(snapshot_id)
+    restored = restored_bytes = 0
+    as_root = os.geteuid() == 0
+    for entry in manifest["files"]:
+        if prefix and not entry["path"].startswith(prefix):
+            continue
+        dest = restore_path(target, entry["path"])
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if entry["type"] == "symlink":
+            if os.path.lexists(dest):
+                os.unlink(dest)
+            os.symlink(entry["target"], dest)
+            restored += 1
+            continue
+        tmp = f"{dest}.restore-tmp"
+        # Chunks are written as they are read back; the file is never held in memory
+        with open(tmp, "wb") as f:
+            for digest in entry["chunks"]:
+                f.write(repo.read_chunk(digest))
+            written = f.tell()
+        if written != entry["size"]:
+            os.unlink(tmp)
+            raise ValueError(f"{entry['path']}: restored {written} bytes, expected {entry['size']}")
+        os.chmod(tmp, entry["mode"])
+        if as_root:
+            os.chown(tmp, entry["uid"], entry["gid"])
+        os.utime(tmp, ns=(entry["mtime"], entry["mtime"]))
+        os.replace(tmp, dest)
+        restored += 1
+        restored_bytes += written
+    return restored, restored_bytes
+
+
+# ============================================
+# Output
+# ============================================
+
+def human(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicated PrivateBox configuration backups")
+    parser.add_argument("--repo", default=DEFAULT_REPO, help="Repository directory (default: %(default)s)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_backup = sub.add_parser("backup", help="Create a backup")
+    p_backup.add_argument("--source", action="append", help="Directory to back up (repeatable; default: service dirs)")
+    p_backup.add_argument("--exclude", action="append", help="Glob of paths to skip (repeatable)")
+    p_backup.add_argument("--opnsense", default=DEFAULT_OPNSENSE, help="OPNsense SSH target (default: %(default)s)")
+    p_backup.add_argument("--opnsense-key", default=DEFAULT_OPNSENSE_KEY)
+    p_backup.add_argument("--no-opnsense", action="store_true", help="Skip the OPNsense configuration")
+    sub.add_parser("list", help="List backups")
+    p_restore = sub.add_parser("restore", help="Restore a backup below a directory")
+    p_restore.add_argument("snapshot", help="Backup ID or 'latest'")
+    p_restore.add_argument("--target", required=True, help="Directory to restore into ('/' for in place)")
+    p_restore.add_argument("--path", help="Only restore paths starting with this prefix")
+    p_prune = sub.add_parser("prune", help="Delete old backups and unused chunks")
+    p_prune.add_argument("--keep", type=int, default=30, help="Backups to keep (default: %(default)s)")
+    sub.add_parser("stats", help="Repository statistics")
+    args = parser.parse_args()
+
+    repo = Repository(args.repo)
+
+    if args.command == "backup":
+        print("=== Configuration Backup ===")
+        manifest = run_backup(repo, args.source or DEFAULT_SOURCES, args.exclude or DEFAULT_EXCLUDES,
+                              None if args.no_opnsense else args.opnsense, args.opnsense_key)
+        s = manifest["stats"]
+        print(f"✓ Backup {manifest['id']}: {s['files']} file(s), {human(s['logical_bytes'])}")
+        print(f"  {s['unchanged_files']} unchanged file(s) skipped, {human(s['read_bytes'])} chunked, "
+              f"{s['new_chunks']} new chunk(s) = {human(s['new_bytes'])} stored in {s['elapsed_ms']} ms")
+        if manifest["errors"]:
+            print(f"⚠ Backup is incomplete: {'; '.join(manifest['errors'])}")
+            sys.exit(1)
+        return
+
+    if args.command == "list":
+        snapshots = repo.snapshots()
+        if not snapshots:
+            print(f"No backups in {repo.root}")
+            return
+        print(f"{'ID':<17}{'files':>7}{'size':>11}{'new':>11}  errors")
+        for snapshot_id in snapshots:
+            manifest = repo.load_snapshot(snapshot_id)
+            s = manifest["stats"]
+            print(f"{snapshot_id:<17}{s['files']:>7}{human(s['logical_bytes']):>11}{human(s['new_bytes']):>11}  "
+                  f"{'; '.join(manifest['errors']) or '-'}")
+        return
+
+    if args.command == "restore":
+        snapshots = repo.snapshots()
+        snapshot_id = snapshots[-1] if args.snapshot == "latest" and snapshots else args.snapshot
+        start = time.monotonic()
+        try:
+            count, size = run_restore(repo, snapshot_id, args.target, args.path)
+        except (OSError, ValueError) as e:
+            print(f"✗ Restore failed: {e}")
+            sys.exit(1)
+        print(f"✓ Restored {count} file(s), {human(size)} from {snapshot_id} to {args.target} "
+              f"in {time.monotonic() - start:.2f} s")
+        return
+
+    if args.command == "prune":
+        snapshots = repo.snapshots()
+        expired = snapshots[:-args.keep] if args.keep > 0 else snapshots
+        for snapshot_id in expired:
+            repo.delete_snapshot(snapshot_id)
+        freed, freed_bytes = repo.collect_garbage()
+        print(f"✓ Deleted {len(expired)} backup(s) and {freed} unused chunk(s), {human(freed_bytes)} freed; "
+              f"{len(snapshots) - len(expired)} backup(s) kept")
+        return
+
+    if args.command == "stats":
+        snapshots = repo.snapshots()
+        logical = sum(repo.load_snapshot(s)["stats"]["logical_bytes"] for s in snapshots)
+        stored = sum(repo.chunk_size(d) for d in repo.known)
+        print(f"Backups: {len(snapshots)}")
+        print(f"Chunks: {len(repo.known)} ({human(stored)} on disk)")
+        print(f"Data in all backups: {human(logical)}")
+        if stored:
+            print(f"Deduplication and compression: {logical / stored:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,36 @@
 """
 Semaphore template generation script.
 This will eventually parse Ansible playbooks and create Semaphore templates.
+
+Templates go to project 1 unless SEMAPHORE_PROJECTS=name-or-id,... is given;
+a playbook can choose its own projects with template_config.semaphore_projects.
+
+OUTPUT_MODE=quiet prints one line per template plus the summary;
+OUTPUT_MODE=debug adds the raw arguments (secrets redacted).
+
+API calls share the adaptive concurrency limit in api_client.py
+(API_CONCURRENCY, API_MAX_CONCURRENCY, API_LATENCY_TARGET, API_RETRIES).
+
+Watch mode keeps running and syncs only the playbooks that change:
+    ./generate-templates.py SEMAPHORE_URL=... SEMAPHORE_API_TOKEN=... --watch [WATCH_STATUS_PORT=8765]
+WATCH_STATUS_PORT=0 turns the status endpoint off.
 """
+import io
 import os
 import sys
 import json
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import threading
+import http.server
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+from task_output import output, redact, redact_arg
+
 # Auto-install dependencies if not available
 try:
     import requests
@@ -22,6 +46,8 @@ except ImportError:
 # Disable SSL warnings for self-signed certificates (internal Services VLAN only)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+from api_client import api
+
 try:
     import yaml
 except ImportError:
@@ -31,14 +57,219 @@ except ImportError:
     import yaml
 
 
+# Performance profiles selectable per playbook with template_config.semaphore_perf_profile.
+# Each profile becomes Ansible environment variables on a Semaphore environment.
+PERF_PROFILES = {
+    'standard': {
+        'pipelining': True,
+        'control_persist': '60s',
+        'fact_cache_ttl': 600,
+        'forks': 5,
+    },
+    # Orchestration runs many templates back to back against the same hosts
+    'orchestration': {
+        'pipelining': True,
+        'control_persist': '300s',
+        'fact_cache_ttl': 1800,
+        'forks': 10,
+    },
+}
+
+# Fact cache shared by all templates running in the Semaphore container
+FACT_CACHE_DIR = '/tmp/privatebox-fact-cache'
+
+# Every variable a profile may set; stripped before a profile is (re)applied
+PERF_ENV_KEYS = [
+    'ANSIBLE_PIPELINING',
+    'ANSIBLE_SSH_ARGS',
+    'ANSIBLE_GATHERING',
+    'ANSIBLE_CACHE_PLUGIN',
+    'ANSIBLE_CACHE_PLUGIN_CONNECTION',
+    'ANSIBLE_CACHE_PLUGIN_TIMEOUT',
+    'ANSIBLE_FORKS',
+]
+
+
+def perf_profile_env(profile_name):
+    """Return the Ansible environment variables for a performance profile."""
+    profile = PERF_PROFILES[profile_name]
+    return {
+        'ANSIBLE_PIPELINING': str(profile['pipelining']),
+        'ANSIBLE_SSH_ARGS': f"-o ControlMaster=auto -o ControlPersist={profile['control_persist']}",
+        # smart: gather_facts is skipped while the cached facts are younger than the TTL
+        'ANSIBLE_GATHERING': 'smart',
+        'ANSIBLE_CACHE_PLUGIN': 'jsonfile',
+        'ANSIBLE_CACHE_PLUGIN_CONNECTION': FACT_CACHE_DIR,
+        'ANSIBLE_CACHE_PLUGIN_TIMEOUT': str(profile['fact_cache_ttl']),
+        'ANSIBLE_FORKS': str(profile['forks']),
+    }
+
+
+def perf_environment_name(config):
+    """Semaphore environment that carries the profile for a playbook.
+
+    Playbooks with their own environment get the profile merged into it,
+    provided no other template uses that environment; the others get a
+    dedicated privatebox-perf-<profile> environment.
+    """
+    environment_name = config.get('semaphore_environment')
+    if environment_name and environment_name != 'Empty':
+        return environment_name
+    return f"privatebox-perf-{config['semaphore_perf_profile']}"
+
+
+def validate_perf_profiles(playbooks_with_metadata):
+    """Check profile names and environment sharing before anything is changed.
+
+    A profile is only merged into a playbook's own environment when every
+    playbook using that environment requests the same profile; otherwise it
+    would silently change how the other templates run.
+
+    Returns (environments, invalid) where environments maps environment
+    name → profile name and invalid is a set of playbook paths to skip.
+    """
+    output.info("\n=== Validating Performance Profiles ===")
+    environments = {}
+    users = {}
+    invalid = set()
+
+    # Profile requested by every playbook of each named environment (None = no profile)
+    sharing = {}
+    for playbook_path, playbook_info in playbooks_with_metadata:
+        config = playbook_info.get('template_config', {})
+        environment_name = config.get('semaphore_environment')
+        if environment_name and environment_name != 'Empty':
+            sharing.setdefault(environment_name, []).append((playbook_path, config.get('semaphore_perf_profile')))
+
+    for playbook_path, playbook_info in playbooks_with_metadata:
+        config = playbook_info.get('template_config', {})
+        profile = config.get('semaphore_perf_profile')
+        if profile is None:
+            continue
+        if not isinstance(profile, str) or profile not in PERF_PROFILES:
+            print(f"✗ {playbook_path.name}: unknown semaphore_perf_profile '{profile}' "
+                  f"(available: {', '.join(sorted(PERF_PROFILES))})")
+            invalid.add(playbook_path)
+            continue
+        environment_name = perf_environment_name(config)
+        others = sorted(path.name for path, other in sharing.get(environment_name, []) if other != profile)
+        if others:
+            print(f"✗ {playbook_path.name}: environment '{environment_name}' is shared with "
+                  f"{', '.join(others)}, which would also get the {profile} profile")
+            print("    Give the playbook its own environment or drop semaphore_perf_profile")
+            invalid.add(playbook_path)
+            continue
+        users.setdefault(environment_name, []).append((playbook_path, profile))
+
+    for environment_name, entries in users.items():
+        environments[environment_name] = entries[0][1]
+        output.info(f"✓ {environment_name}: {environments[environment_name]} "
+              f"({len(entries)} playbook(s))")
+
+    if not users and not invalid:
+        output.info("  No playbooks request a performance profile")
+    return environments, invalid
+
+
+def perf_owners(playbooks_with_metadata, environment_name):
+    """Template names that requested a profile on environment_name."""
+    return {info.get('name', path.stem) for path, info in playbooks_with_metadata
+            if info.get('template_config', {}).get('semaphore_perf_profile')
+            and perf_environment_name(info['template_config']) == environment_name}
+
+
+def ensure_perf_environment(base_url, api_token, project_id, environment_name, profile_name, owners):
+    """Create the dedicated environment or merge the profile variables into it.
+
+    Only dedicated privatebox-perf-<profile> environments are created. A
+    playbook's own environment must already exist (it holds the secrets the
+    playbook needs) and must not be used by templates outside owners, the
+    template names that requested the profile. Only the env field is sent on
+    update, so secrets already stored in the environment are left untouched.
+    """
+    headers = {"Authorization": f"Bearer {api_token}"}
+    profile_env = perf_profile_env(profile_name)
+    dedicated = environment_name == f"privatebox-perf-{profile_name}"
+
+    try:
+        response = api.get(f"{base_url}/api/project/{project_id}/environment", headers=headers, timeout=5, verify=False)
+        if response.status_code != 200:
+            print(f"✗ Failed to list environments: {response.status_code}")
+            return False
+        existing = next((e for e in response.json() if e.get('name') == environment_name), None)
+
+        if not existing and not dedicated:
+            # Creating it here would leave it without the secrets set up by the bootstrap
+            print(f"✗ Environment '{environment_name}' not found; not creating it for the {profile_name} profile")
+            return False
+
+        if not dedicated:
+            templates = list_templates(base_url, api_token, project_id)
+            if templates is None:
+                return False
+            shared = sorted(name for name, template in templates.items()
+                            if template.get('environment_id') == existing['id'] and name not in owners)
+            if shared:
+                print(f"✗ Environment '{environment_name}' is also used by {', '.join(shared)}; "
+                      f"not applying the {profile_name} profile")
+                return False
+
+        if not existing:
+            payload = {
+                'name': environment_name,
+                'project_id': project_id,
+                'json': '{}',
+                'env': json.dumps(profile_env),
+                'secrets': [],
+            }
+            response = api.post(f"{base_url}/api/project/{project_id}/environment",
+                                     json=payload, headers=headers, timeout=10, verify=False)
+            if response.status_code in [200, 201, 204]:
+                print(f"✓ Created environment '{environment_name}' ({profile_name} profile)")
+                return True
+            print(f"✗ Failed to create environment '{environment_name}': {response.status_code}")
+            print(f"   Response: {response.text}")
+            return False
+
+        try:
+            current_env = json.loads(existing.get('env') or '{}')
+        except ValueError:
+            current_env = {}
+        merged = {k: v for k, v in current_env.items() if k not in PERF_ENV_KEYS}
+        merged.update(profile_env)
+        if merged == current_env:
+            output.info(f"✓ Environment '{environment_name}' already uses the {profile_name} profile")
+            return True
+
+        payload = {
+            'id': existing['id'],
+            'name': environment_name,
+            'project_id': project_id,
+            'json': existing.get('json') or '{}',
+            'env': json.dumps(merged),
+        }
+        response = api.put(f"{base_url}/api/project/{project_id}/environment/{existing['id']}",
+                                json=payload, headers=headers, timeout=10, verify=False)
+        if response.status_code in [200, 204]:
+            print(f"✓ Applied {profile_name} profile to environment '{environment_name}'")
+            return True
+        print(f"✗ Failed to update environment '{environment_name}': {response.status_code}")
+        print(f"   Response: {response.text}")
+        return False
+
+    except requests.exceptions.RequestException as e:
+        print(f"✗ Error configuring environment '{environment_name}': {e}")
+        return False
+
+
 def test_connectivity(base_url):
     """Test basic connectivity to Semaphore API."""
-    print("\n=== Stage 1: Testing Basic Connectivity ===")
+    output.info("\n=== Stage 1: Testing Basic Connectivity ===")
     try:
-        response = requests.get(f"{base_url}/api/ping", timeout=5, verify=False)
+        response = api.get(f"{base_url}/api/ping", timeout=5, verify=False)
         if response.status_code == 200:
-            print(f"✓ Successfully connected to Semaphore at {base_url}")
-            print(f"  Response: {response.text.strip()}")
+            output.info(f"✓ Successfully connected to Semaphore at {base_url}")
+            output.info(f"  Response: {response.text.strip()}")
             return True
         else:
             print(f"✗ Unexpected response from /api/ping: {response.status_code}")
@@ -51,17 +282,17 @@ def test_connectivity(base_url):
 
 def test_authentication(base_url, api_token):
     """Test API authentication using Bearer token."""
-    print("\n=== Stage 2: Testing Authentication ===")
+    output.info("\n=== Stage 2: Testing Authentication ===")
     headers = {"Authorization": f"Bearer {api_token}"}
 
     try:
-        response = requests.get(f"{base_url}/api/user", headers=headers, timeout=5, verify=False)
+        response = api.get(f"{base_url}/api/user", headers=headers, timeout=5, verify=False)
         if response.status_code == 200:
             user_data = response.json()
-            print("✓ Authentication successful!")
-            print(f"  Logged in as: {user_data.get('username', 'Unknown')}")
-            print(f"  User ID: {user_data.get('id', 'Unknown')}")
-            print(f"  Admin: {user_data.get('admin', False)}")
+            output.info("✓ Authentication successful!")
+            output.info(f"  Logged in as: {user_data.get('username', 'Unknown')}")
+            output.info(f"  User ID: {user_data.get('id', 'Unknown')}")
+            output.info(f"  Admin: {user_data.get('admin', False)}")
             return True
         elif response.status_code == 401:
             print("✗ Authentication failed: Invalid API token")
@@ -77,26 +308,26 @@ def test_authentication(base_url, api_token):
 
 
 def list_projects(base_url, api_token):
-    """List available projects to verify API access."""
-    print("\n=== Stage 3: Listing Projects ===")
+    """List available projects to verify API access; returns the list or None."""
+    output.info("\n=== Stage 3: Listing Projects ===")
     headers = {"Authorization": f"Bearer {api_token}"}
 
     try:
-        response = requests.get(f"{base_url}/api/projects", headers=headers, timeout=5, verify=False)
+        response = api.get(f"{base_url}/api/projects", headers=headers, timeout=5, verify=False)
         if response.status_code == 200:
             projects = response.json()
-            print(f"✓ Found {len(projects)} project(s):")
+            output.info(f"✓ Found {len(projects)} project(s):")
             for project in projects:
-                print(f"  - Project ID {project.get('id')}: {project.get('name', 'Unnamed')}")
-            return True
+                output.info(f"  - Project ID {project.get('id')}: {project.get('name', 'Unnamed')}")
+            return projects
         else:
             print(f"✗ Failed to list projects: {response.status_code}")
             print(f"  Response: {response.text}")
-            return False
+            return None
     except requests.exceptions.RequestException as e:
         print(f"✗ Failed to list projects")
         print(f"  Error: {e}")
-        return False
+        return None
 
 
 def get_inventory_id(base_url, api_token, project_id, inventory_name="Default Inventory"):
@@ -104,7 +335,7 @@ def get_inventory_id(base_url, api_token, project_id, inventory_name="Default In
     headers = {"Authorization": f"Bearer {api_token}"}
 
     try:
-        response = requests.get(f"{base_url}/api/project/{project_id}/inventory", headers=headers, timeout=5, verify=False)
+        response = api.get(f"{base_url}/api/project/{project_id}/inventory", headers=headers, timeout=5, verify=False)
         if response.status_code == 200:
             inventories = response.json()
             for inventory in inventories:
@@ -129,7 +360,7 @@ def get_repository_id(base_url, api_token, project_id, repository_name="PrivateB
     headers = {"Authorization": f"Bearer {api_token}"}
 
     try:
-        response = requests.get(f"{base_url}/api/project/{project_id}/repositories", headers=headers, timeout=5, verify=False)
+        response = api.get(f"{base_url}/api/project/{project_id}/repositories", headers=headers, timeout=5, verify=False)
         if response.status_code == 200:
             repositories = response.json()
             for repo in repositories:
@@ -157,7 +388,7 @@ def get_environment_id(base_url, api_token, project_id, environment_name=None):
     headers = {"Authorization": f"Bearer {api_token}"}
 
     try:
-        response = requests.get(f"{base_url}/api/project/{project_id}/environment", headers=headers, timeout=5, verify=False)
+        response = api.get(f"{base_url}/api/project/{project_id}/environment", headers=headers, timeout=5, verify=False)
         if response.status_code == 200:
             environments = response.json()
             for env in environments:
@@ -182,7 +413,7 @@ def get_view_id(base_url, api_token, project_id):
     headers = {"Authorization": f"Bearer {api_token}"}
 
     try:
-        response = requests.get(f"{base_url}/api/project/{project_id}/views", headers=headers, timeout=5, verify=False)
+        response = api.get(f"{base_url}/api/project/{project_id}/views", headers=headers, timeout=5, verify=False)
         if response.status_code == 200:
             views = response.json()
             if views:
@@ -351,9 +582,86 @@ def convert_to_survey_vars(vars_list):
     return survey_vars
 
 
-def create_or_update_template(base_url, api_token, project_id, playbook_path, playbook_info, resource_ids):
-    """Create or update a template based on playbook information."""
+def resolve_resource_ids(base_url, api_token, project_id, playbook_info, view_id, cache=None):
+    """Look up inventory, repository and environment IDs for a playbook.
+
+    Returns None when a required resource is missing. An optional cache
+    dict keyed by resource name avoids repeated lookups (watch mode).
+    """
+    config = playbook_info.get('template_config', {})
+
+    # Look up resource IDs - use exact inventory name matching
+    # Use hosts field directly as inventory name, or from template config
+    hosts = playbook_info.get('hosts', 'all')
+    inventory_name = config.get('semaphore_inventory', hosts)
+
+    repository_name = config.get('semaphore_repository', 'PrivateBox')
+    environment_name = config.get('semaphore_environment')
+    if config.get('semaphore_perf_profile'):
+        environment_name = perf_environment_name(config)
+        output.info(f"   Performance profile: {config['semaphore_perf_profile']} (environment '{environment_name}')")
+
+    def lookup(kind, name, getter):
+        if cache is not None and cache.get((kind, name)):
+            return cache[(kind, name)]
+        resource_id = getter(base_url, api_token, project_id, name)
+        if cache is not None and resource_id:
+            cache[(kind, name)] = resource_id
+        return resource_id
+
+    output.info(f"   Looking up resources...")
+    inventory_id = lookup('inventory', inventory_name, get_inventory_id)
+    if not inventory_id:
+        print(f"   ✗ Skipping: Inventory '{inventory_name}' not found")
+        return None
+
+    repository_id = lookup('repository', repository_name, get_repository_id)
+    if not repository_id:
+        print(f"   ✗ Skipping: Repository '{repository_name}' not found")
+        return None
+
+    # Always try to get environment ID - defaults to "Empty" if not specified
+    environment_id = lookup('environment', environment_name, get_environment_id)
+    if environment_name and not environment_id:
+        print(f"   ⚠️  Warning: Environment '{environment_name}' not found, continuing without it")
+    elif not environment_name and not environment_id:
+        print(f"   ⚠️  Warning: Default environment 'Empty' not found")
+
+    return {
+        'inventory_id': inventory_id,
+        'repository_id': repository_id,
+        'environment_id': environment_id,
+        'view_id': view_id
+    }
+
+
+def list_templates(base_url, api_token, project_id):
+    """Map template name → template for one project; None when listing fails."""
     headers = {"Authorization": f"Bearer {api_token}"}
+    try:
+        response = api.get(f"{base_url}/api/project/{project_id}/templates", headers=headers, timeout=5, verify=False)
+    except requests.exceptions.RequestException as e:
+        output.step(f"\n✗ Error listing templates: {e}")
+        return None
+    if response.status_code != 200:
+        output.step(f"\n✗ Failed to list templates: {response.status_code}")
+        return None
+    return {template['name']: template for template in response.json()}
+
+
+def create_or_update_template(base_url, api_token, project_id, playbook_path, playbook_info, resource_ids,
+                              templates=None):
+    """Create or update a template based on playbook information.
+
+    templates is the project's name → template index from list_templates();
+    it is kept up to date so one listing serves every playbook of a run.
+    Without it the templates are listed for this call only.
+    """
+    headers = {"Authorization": f"Bearer {api_token}"}
+    if templates is None:
+        templates = list_templates(base_url, api_token, project_id)
+        if templates is None:
+            return False
     
     # Use play name as template name
     template_name = playbook_info.get('name', playbook_path.stem)
@@ -385,101 +693,483 @@ def create_or_update_template(base_url, api_token, project_id, playbook_path, pl
         template_data['view_id'] = resource_ids['view_id']
     
     try:
-        # Check if template exists
-        response = requests.get(f"{base_url}/api/project/{project_id}/templates", headers=headers, timeout=5, verify=False)
-        if response.status_code == 200:
-            existing_templates = response.json()
-            existing_template = next((t for t in existing_templates if t['name'] == template_name), None)
-            
-            if existing_template:
-                # Update existing template
-                template_id = existing_template['id']
-                # Add the ID to the template data for update
-                template_data['id'] = template_id
-                response = requests.put(
-                    f"{base_url}/api/project/{project_id}/templates/{template_id}",
-                    json=template_data,
-                    headers=headers,
-                    timeout=10,
-                    verify=False
-                )
-                if response.status_code in [200, 204]:
-                    print(f"\n✓ Updated template: {template_name} (ID: {template_id})")
-                    return True
-                else:
-                    print(f"\n✗ Failed to update template: {response.status_code}")
-                    print(f"   Response: {response.text}")
-                    return False
+        existing_template = templates.get(template_name)
+        if existing_template:
+            # Update existing template
+            template_id = existing_template['id']
+            # Add the ID to the template data for update
+            template_data['id'] = template_id
+            response = api.put(
+                f"{base_url}/api/project/{project_id}/templates/{template_id}",
+                json=template_data,
+                headers=headers,
+                timeout=10,
+                verify=False
+            )
+            if response.status_code in [200, 204]:
+                templates[template_name] = {**existing_template, **template_data}
+                output.step(f"\n✓ Updated template: {template_name} (ID: {template_id})")
+                return True
             else:
-                # Create new template
-                response = requests.post(
-                    f"{base_url}/api/project/{project_id}/templates",
-                    json=template_data,
-                    headers=headers,
-                    timeout=10,
-                    verify=False
-                )
-                if response.status_code in [200, 201]:
-                    new_template = response.json()
-                    print(f"\n✓ Created template: {template_name} (ID: {new_template.get('id', 'unknown')})")
-                    return True
-                else:
-                    print(f"\n✗ Failed to create template: {response.status_code}")
-                    print(f"   Response: {response.text}")
-                    return False
+                output.step(f"\n✗ Failed to update template: {response.status_code}")
+                print(f"   Response: {response.text}")
+                return False
         else:
-            print(f"\n✗ Failed to list templates: {response.status_code}")
-            return False
-    
+            # Create new template
+            response = api.post(
+                f"{base_url}/api/project/{project_id}/templates",
+                json=template_data,
+                headers=headers,
+                timeout=10,
+                verify=False
+            )
+            if response.status_code in [200, 201]:
+                new_template = response.json()
+                templates[template_name] = {**template_data, **new_template}
+                output.step(f"\n✓ Created template: {template_name} (ID: {new_template.get('id', 'unknown')})")
+                return True
+            else:
+                output.step(f"\n✗ Failed to create template: {response.status_code}")
+                print(f"   Response: {response.text}")
+                return False
+
     except requests.exceptions.RequestException as e:
-        print(f"\n✗ Error creating/updating template: {e}")
+        output.step(f"\n✗ Error creating/updating template: {e}")
         return False
 
 
 def display_playbook_info(playbook_path, info):
     """Display parsed playbook information."""
-    print(f"\n📄 {playbook_path.name}")
-    print(f"   Name: {info['name']}")
+    output.info(f"\n📄 {playbook_path.name}")
+    output.info(f"   Name: {info['name']}")
 
     # Handle pre-formatted survey_vars (new format)
     if 'survey_vars' in info and info['survey_vars']:
-        print(f"   Survey variables (pre-formatted): {len(info['survey_vars'])} variable(s)")
+        output.info(f"   Survey variables (pre-formatted): {len(info['survey_vars'])} variable(s)")
     # Handle legacy vars_prompt conversion (old format)
     elif 'vars' in info and info['vars']:
-        print(f"   Variables with Semaphore metadata:")
+        output.info(f"   Variables with Semaphore metadata:")
         for var in info['vars']:
             var_name = var.get('name', 'unnamed')
             var_type = var.get('semaphore_type', 'text')
             description = var.get('semaphore_description', var.get('prompt', ''))
             required = var.get('semaphore_required', not var.get('private', True))
 
-            print(f"\n   - Variable: {var_name}")
-            print(f"     Type: {var_type}")
-            print(f"     Description: {description}")
-            print(f"     Required: {required}")
+            output.info(f"\n   - Variable: {var_name}")
+            output.info(f"     Type: {var_type}")
+            output.info(f"     Description: {description}")
+            output.info(f"     Required: {required}")
 
             # Show additional fields for specific types
             if var_type == 'integer':
                 if 'semaphore_min' in var:
-                    print(f"     Min: {var['semaphore_min']}")
+                    output.info(f"     Min: {var['semaphore_min']}")
                 if 'semaphore_max' in var:
-                    print(f"     Max: {var['semaphore_max']}")
+                    output.info(f"     Max: {var['semaphore_max']}")
     else:
-        print(f"   No variables to prompt (will use defaults from playbook)")
+        output.info(f"   No variables to prompt (will use defaults from playbook)")
+
+
+def find_project(projects, ref):
+    """Find a project by ID or name."""
+    ref = str(ref)
+    for project in projects:
+        if str(project.get('id')) == ref or project.get('name') == ref:
+            return project
+    return None
+
+
+def playbook_projects(playbook_info, projects, default_projects):
+    """Target projects of one playbook; returns (projects, refs that were not found)."""
+    refs = playbook_info.get('template_config', {}).get('semaphore_projects')
+    if refs is None:
+        return list(default_projects), []
+    found, missing = [], []
+    for ref in refs if isinstance(refs, list) else [refs]:
+        project = find_project(projects, ref)
+        if project:
+            found.append(project)
+        else:
+            missing.append(ref)
+    return found, missing
+
+
+class ThreadOutput:
+    """sys.stdout replacement that lets worker threads buffer their prints."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    @classmethod
+    def install(cls):
+        if not isinstance(sys.stdout, cls):
+            sys.stdout = cls(sys.stdout)
+        return sys.stdout
+
+    def write(self, text):
+        buffer = getattr(self.local, 'buffer', None)
+        return (self.stream if buffer is None else buffer).write(text)
+
+    def flush(self):
+        if getattr(self.local, 'buffer', None) is None:
+            self.stream.flush()
+
+    def capture(self, func, *args):
+        """Run func with this thread's prints buffered; returns (output, result)."""
+        self.local.buffer = io.StringIO()
+        try:
+            result = func(*args)
+            return self.local.buffer.getvalue(), result
+        finally:
+            self.local.buffer = None
+
+
+def sync_project(base_url, api_token, project, playbooks_with_metadata, perf_environments, invalid_profiles):
+    """Upsert templates for one project; returns (processed, failed)."""
+    project_id = project['id']
+    processed = failed = 0
+
+    # Each project has its own resources, so it gets its own lookup cache
+    resource_cache = {}
+
+    # Get view ID (might not be available in all versions)
+    view_id = get_view_id(base_url, api_token, project_id)
+
+    # One template listing per project instead of one per playbook
+    templates = list_templates(base_url, api_token, project_id)
+    if templates is None:
+        return 0, len(playbooks_with_metadata)
+
+    # Apply the performance profiles used by this project's playbooks
+    needed = {perf_environment_name(info['template_config'])
+              for path, info in playbooks_with_metadata
+              if info.get('template_config', {}).get('semaphore_perf_profile') and path not in invalid_profiles}
+    unavailable = set()
+    for environment_name in sorted(needed):
+        profile_name = perf_environments[environment_name]
+        if not ensure_perf_environment(base_url, api_token, project_id, environment_name, profile_name,
+                                       perf_owners(playbooks_with_metadata, environment_name)):
+            unavailable.add(environment_name)
+
+    for playbook_path, playbook_info in playbooks_with_metadata:
+        output.info(f"\n🔄 Processing: {playbook_path.name}")
+
+        if playbook_path in invalid_profiles:
+            print(f"   ✗ Skipping: invalid semaphore_perf_profile")
+            failed += 1
+            continue
+        config = playbook_info.get('template_config', {})
+        if config.get('semaphore_perf_profile') and perf_environment_name(config) in unavailable:
+            print(f"   ✗ Skipping: environment '{perf_environment_name(config)}' could not carry the "
+                  f"{config['semaphore_perf_profile']} profile")
+            failed += 1
+            continue
+
+        resource_ids = resolve_resource_ids(base_url, api_token, project_id, playbook_info, view_id,
+                                            cache=resource_cache)
+        if not resource_ids:
+            failed += 1
+            continue
+
+        # Create or update the template
+        if create_or_update_template(base_url, api_token, project_id, playbook_path, playbook_info,
+                                     resource_ids, templates):
+            processed += 1
+            # Note: The function prints whether it created or updated
+        else:
+            failed += 1
+
+    return processed, failed
+
+
+# ============================================
+# Watch mode
+# ============================================
+
+class InotifyWatcher:
+    """Report changed playbook files using Linux inotify (via libc, no extra packages)."""
+
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_DELETE = 0x200
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, directories):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_DELETE
+        self.directories = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, str(directory).encode(), mask)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {directory}')
+            self.directories[wd] = Path(directory)
+
+    def wait(self, timeout):
+        """Block up to timeout seconds (None = forever); return the set of changed paths."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, _mask, _cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+            offset += length
+            if name and wd in self.directories:
+                changed.add(self.directories[wd] / name)
+        return changed
+
+
+class PollingWatcher:
+    """Fallback watcher comparing mtime and size of *.yml files."""
+
+    def __init__(self, directories, interval=0.5):
+        self.directories = [Path(d) for d in directories]
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        state = {}
+        for directory in self.directories:
+            for path in directory.glob('*.yml'):
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                state[path] = (st.st_mtime_ns, st.st_size)
+        return state
+
+    def wait(self, timeout):
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        current = self._scan()
+        changed = {p for p in current.keys() | self.snapshot.keys() if current.get(p) != self.snapshot.get(p)}
+        self.snapshot = current
+        return changed
+
+
+class SyncStatus:
+    """Counters served by the status endpoint."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {
+            'watching': 0,
+            'syncs': 0,
+            'last_sync_at': None,
+            'last_sync_latency_ms': None,
+            'last_sync_files': [],
+            'last_errors': [],
+        }
+
+    def update(self, **fields):
+        with self.lock:
+            self.data.update(fields)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.data)
+
+
+def start_status_server(status, port):
+    """Serve GET /status as JSON on localhost in a background thread."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') not in ('', '/status'):
+                self.send_error(404)
+                return
+            body = json.dumps(status.snapshot(), indent=2).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class TemplateWatcher:
+    """Incrementally sync changed playbooks into Semaphore templates."""
+
+    def __init__(self, base_url, api_token, projects, default_projects, base_dir):
+        self.base_url = base_url
+        self.api_token = api_token
+        self.projects = projects
+        self.default_projects = default_projects
+        self.directories = [Path(base_dir) / 'ansible' / 'playbooks' / d for d in ('services', 'infrastructure')]
+        self.directories = [d for d in self.directories if d.exists()]
+        self.headers = {"Authorization": f"Bearer {api_token}"}
+        # Project ID → view ID, resource lookup cache and template index, filled on first use
+        self.project_state = {}
+        # Playbook path → parsed info, used to prune renamed or removed templates
+        self.playbooks = {}
+        for path in discover_playbooks(base_dir):
+            info = parse_playbook(path)
+            if info:
+                self.playbooks[path] = info
+
+    @staticmethod
+    def is_playbook(path):
+        return path.suffix == '.yml' and not path.name.startswith(('_', '.'))
+
+    def state(self, project):
+        state = self.project_state.get(project['id'])
+        if state is None:
+            state = self.project_state[project['id']] = {
+                'view_id': get_view_id(self.base_url, self.api_token, project['id']),
+                'resources': {},
+                'templates': None,
+            }
+        if state['templates'] is None:
+            state['templates'] = list_templates(self.base_url, self.api_token, project['id'])
+            if state['templates'] is None:
+                raise RuntimeError(f"cannot list templates of project '{project['name']}'")
+        return state
+
+    def targets(self, info):
+        return playbook_projects(info, self.projects, self.default_projects)
+
+    def delete_template(self, project, name, playbook_name):
+        """Delete a generated template by name; templates not made by this script are kept."""
+        templates = self.state(project)['templates']
+        template = templates.get(name)
+        if not template:
+            return
+        if template.get('description') != f"Generated from {playbook_name}":
+            print(f"   ⚠️  Not pruning '{name}' in {project['name']}: not generated from {playbook_name}")
+            return
+        response = api.delete(f"{self.base_url}/api/project/{project['id']}/templates/{template['id']}",
+                              headers=self.headers, timeout=10, verify=False)
+        if response.status_code in [200, 204]:
+            templates.pop(name, None)
+            print(f"✓ Pruned template: {name} (ID: {template['id']}) from {project['name']}")
+        else:
+            raise RuntimeError(f"failed to delete template '{name}' in {project['name']}: {response.status_code}")
+
+    def sync_into(self, project, path, info):
+        """Upsert one playbook's template in one project; returns an error string or None."""
+        state = self.state(project)
+        profile = info.get('template_config', {}).get('semaphore_perf_profile')
+        if profile:
+            environment_name = perf_environment_name(info['template_config'])
+            owners = perf_owners(list(self.playbooks.items()), environment_name)
+            if not ensure_perf_environment(self.base_url, self.api_token, project['id'], environment_name, profile,
+                                           owners):
+                return f"could not apply {profile} profile"
+
+        resource_ids = resolve_resource_ids(self.base_url, self.api_token, project['id'],
+                                            info, state['view_id'], cache=state['resources'])
+        if not resource_ids:
+            return "missing Semaphore resources"
+        if not create_or_update_template(self.base_url, self.api_token, project['id'],
+                                         path, info, resource_ids, state['templates']):
+            # The index may be stale (template edited in the UI); list again next time
+            state['templates'] = None
+            return "template upsert failed"
+        return None
+
+    def sync_path(self, path):
+        """Upsert or prune the templates for one playbook file; returns a list of errors."""
+        previous = self.playbooks.get(path)
+        info = parse_playbook(path) if path.exists() else None
+        targets, missing = self.targets(info) if info else ([], [])
+        errors = [f"{path.name}: project '{ref}' in semaphore_projects not found" for ref in missing]
+
+        if previous:
+            # Prune where the template was renamed, removed or is no longer targeted
+            target_ids = {project['id'] for project in targets}
+            for project in self.targets(previous)[0]:
+                if not info or info['name'] != previous['name'] or project['id'] not in target_ids:
+                    self.delete_template(project, previous['name'], path.name)
+        if not info:
+            self.playbooks.pop(path, None)
+            return errors
+        self.playbooks[path] = info
+
+        if info.get('template_config', {}).get('semaphore_perf_profile'):
+            _, invalid = validate_perf_profiles(list(self.playbooks.items()))
+            if path in invalid:
+                return errors + [f"{path.name}: invalid semaphore_perf_profile"]
+
+        for project in targets:
+            error = self.sync_into(project, path, info)
+            if error:
+                errors.append(f"{path.name} ({project['name']}): {error}")
+        return errors
+
+    def sync(self, paths, status):
+        start = time.monotonic()
+        errors = []
+        for path in sorted(paths):
+            output.info(f"\n🔄 Changed: {path.parent.name}/{path.name}")
+            try:
+                path_errors = self.sync_path(path)
+            except (requests.exceptions.RequestException, RuntimeError) as e:
+                path_errors = [f"{path.name}: {e}"]
+            for error in path_errors:
+                print(f"✗ {error}")
+            errors.extend(path_errors)
+        latency_ms = round((time.monotonic() - start) * 1000)
+        print(f"→ Synced {len(paths)} file(s) in {latency_ms} ms")
+        snapshot = status.snapshot()
+        status.update(watching=len(self.playbooks), syncs=snapshot['syncs'] + 1,
+                      last_sync_at=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                      last_sync_latency_ms=latency_ms,
+                      last_sync_files=[p.name for p in sorted(paths)], last_errors=errors,
+                      api=api.stats())
+
+    def run(self, debounce=0.3, status_port=8765):
+        try:
+            watcher = InotifyWatcher(self.directories)
+            mode = 'inotify'
+        except (OSError, AttributeError):
+            watcher = PollingWatcher(self.directories)
+            mode = f'polling every {watcher.interval}s'
+
+        status = SyncStatus()
+        status.update(watching=len(self.playbooks))
+        if status_port:
+            try:
+                start_status_server(status, status_port)
+                print(f"✓ Status endpoint: http://127.0.0.1:{status_port}/status")
+            except OSError as e:
+                # The endpoint is only a convenience; keep watching without it
+                print(f"⚠️  Status endpoint disabled: cannot listen on 127.0.0.1:{status_port} ({e.strerror})")
+                print("  Set WATCH_STATUS_PORT to a free port, or 0 to turn it off")
+        print(f"✓ Watching {len(self.playbooks)} playbook(s) in "
+              f"{', '.join(str(d) for d in self.directories)} ({mode})")
+        print(f"  Default projects: {', '.join(project['name'] for project in self.default_projects)}")
+        print("  Press Ctrl+C to stop")
+
+        pending = set()
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            changed = {p for p in watcher.wait(timeout) if self.is_playbook(p)}
+            if changed:
+                # Editors often write several times per save; wait for a quiet period
+                pending |= changed
+                deadline = time.monotonic() + debounce
+                continue
+            if pending and time.monotonic() >= deadline:
+                self.sync(pending, status)
+                pending = set()
+                deadline = None
 
 
 def main():
-    print("=== Semaphore Template Generator ===")
-    print(f"Python version: {sys.version.split()[0]}")
-    print(f"Current working directory: {os.getcwd()}")
-    
-    # Debug: Print all command line arguments
-    print("\n=== Raw Arguments Debug ===")
-    print(f"Number of arguments: {len(sys.argv)}")
-    print(f"Script name (argv[0]): {sys.argv[0]}")
-    for i, arg in enumerate(sys.argv[1:], 1):
-        print(f"Argument {i}: '{arg}'")
-    
     # Parse command line arguments for Semaphore variables
     # Semaphore passes variables as KEY=VALUE arguments
     variables = {}
@@ -487,29 +1177,42 @@ def main():
         if '=' in arg:
             key, value = arg.split('=', 1)
             variables[key] = value
+    output.configure(variables)
+    api.configure(variables)
+
+    print("=== Semaphore Template Generator ===")
+    output.info(f"Python version: {sys.version.split()[0]}")
+    output.info(f"Current working directory: {os.getcwd()}")
+
+    # Debug: Print all command line arguments (secret values redacted)
+    output.debug("\n=== Raw Arguments Debug ===")
+    output.debug(f"Number of arguments: {len(sys.argv)}")
+    output.debug(f"Script name (argv[0]): {sys.argv[0]}")
+    for i, arg in enumerate(sys.argv[1:], 1):
+        output.debug(f"Argument {i}: '{redact_arg(arg)}'")
     
-    print("\n=== Parsed Variables ===")
+    output.debug("\n=== Parsed Variables ===")
     for key, value in variables.items():
-        print(f"{key}: {value}")
+        output.debug(f"{key}: {redact(key, value)}")
     
     # Get required variables from parsed arguments
     semaphore_url = variables.get('SEMAPHORE_URL')
     api_token = variables.get('SEMAPHORE_API_TOKEN')
     
-    print("\n=== Environment Check ===")
+    output.info("\n=== Environment Check ===")
     if not semaphore_url:
         print("✗ Missing SEMAPHORE_URL environment variable")
         print("  This should be set in the Variable attached to this task")
         sys.exit(1)
     else:
-        print(f"✓ SEMAPHORE_URL: {semaphore_url}")
+        output.info(f"✓ SEMAPHORE_URL: {semaphore_url}")
     
     if not api_token:
         print("✗ Missing SEMAPHORE_API_TOKEN environment variable")
         print("  This should be set in the Secret attached to this task")
         sys.exit(1)
     else:
-        print(f"✓ SEMAPHORE_API_TOKEN: {'*' * 10}... (hidden)")
+        output.info(f"✓ SEMAPHORE_API_TOKEN: {'*' * 10}... (hidden)")
     
     # Run connectivity tests
     if not test_connectivity(semaphore_url):
@@ -520,24 +1223,46 @@ def main():
         print("\n❌ Authentication test failed. Exiting.")
         sys.exit(1)
     
-    if not list_projects(semaphore_url, api_token):
+    projects = list_projects(semaphore_url, api_token)
+    if projects is None:
         print("\n❌ Project listing failed. Exiting.")
         sys.exit(1)
     
-    print("\n✅ All API tests passed! Ready for template synchronization.")
+    output.step("\n✅ All API tests passed! Ready for template synchronization.")
+
+    # Default target projects: SEMAPHORE_PROJECTS=name-or-id,... (project 1 when unset)
+    default_refs = [r.strip() for r in variables.get('SEMAPHORE_PROJECTS', '1').split(',') if r.strip()]
+    default_projects = []
+    for ref in default_refs:
+        project = find_project(projects, ref)
+        if not project:
+            print(f"\n❌ Project '{ref}' from SEMAPHORE_PROJECTS not found. Exiting.")
+            sys.exit(1)
+        default_projects.append(project)
+
+    if '--watch' in sys.argv[1:]:
+        # Long-running mode for development: sync only the playbooks that change
+        output.info("\n=== Watch Mode ===")
+        watcher = TemplateWatcher(semaphore_url, api_token, projects, default_projects, os.getcwd())
+        try:
+            watcher.run(debounce=float(variables.get('WATCH_DEBOUNCE', '0.3')),
+                        status_port=int(variables.get('WATCH_STATUS_PORT', '8765')))
+        except KeyboardInterrupt:
+            print("\n✓ Watch mode stopped")
+        return
     
     # Phase 4: Discover and parse playbooks
-    print("\n=== Phase 4: Discovering Playbooks ===")
+    output.info("\n=== Phase 4: Discovering Playbooks ===")
     playbooks = discover_playbooks(os.getcwd())
     
     if not playbooks:
         print("✗ No playbooks found in ansible/playbooks/services/")
         return
     
-    print(f"✓ Found {len(playbooks)} playbook(s)")
+    output.info(f"✓ Found {len(playbooks)} playbook(s)")
     
     # Parse each playbook
-    print("\n=== Parsing Playbooks for Semaphore Metadata ===")
+    output.info("\n=== Parsing Playbooks for Semaphore Metadata ===")
     playbooks_with_metadata = []
     
     for playbook in playbooks:
@@ -550,78 +1275,59 @@ def main():
         print("\n⚠️  No playbooks found (all were excluded with semaphore_exclude: true).")
         return
     
-    print(f"\n✓ Found {len(playbooks_with_metadata)} playbook(s) to process as templates")
+    output.info(f"\n✓ Found {len(playbooks_with_metadata)} playbook(s) to process as templates")
     
     # Phase 5: Create/Update templates
-    print("\n=== Phase 5: Creating/Updating Templates ===")
-    
-    # Use project ID 1 (from our earlier check)
-    project_id = 1
-    
-    # Get view ID (might not be available in all versions)
-    view_id = get_view_id(semaphore_url, api_token, project_id)
-    
-    templates_processed = 0
-    templates_created = 0
-    templates_updated = 0
+    output.info("\n=== Phase 5: Creating/Updating Templates ===")
+
+    # Validate performance profiles once; environments are applied per project
+    perf_environments, invalid_profiles = validate_perf_profiles(playbooks_with_metadata)
+
+    # Group playbooks by target project (template_config.semaphore_projects)
+    targets = {project['id']: (project, []) for project in default_projects}
     templates_failed = 0
-    
     for playbook_path, playbook_info in playbooks_with_metadata:
-        print(f"\n🔄 Processing: {playbook_path.name}")
-        
-        # Get template configuration
-        config = playbook_info.get('template_config', {})
-        
-        # Look up resource IDs - use exact inventory name matching
-        # Use hosts field directly as inventory name, or from template config
-        hosts = playbook_info.get('hosts', 'all')
-        inventory_name = config.get('semaphore_inventory', hosts)
-        
-        repository_name = config.get('semaphore_repository', 'PrivateBox')
-        environment_name = config.get('semaphore_environment')
-        
-        print(f"   Looking up resources...")
-        inventory_id = get_inventory_id(semaphore_url, api_token, project_id, inventory_name)
-        if not inventory_id:
-            print(f"   ✗ Skipping: Inventory '{inventory_name}' not found")
-            templates_failed += 1
-            continue
-        
-        repository_id = get_repository_id(semaphore_url, api_token, project_id, repository_name)
-        if not repository_id:
-            print(f"   ✗ Skipping: Repository '{repository_name}' not found")
+        found, missing = playbook_projects(playbook_info, projects, default_projects)
+        for ref in missing:
+            print(f"✗ {playbook_path.name}: project '{ref}' in semaphore_projects not found")
             templates_failed += 1
-            continue
-        
-        # Always try to get environment ID - defaults to "Empty" if not specified
-        environment_id = get_environment_id(semaphore_url, api_token, project_id, environment_name)
-        if environment_name and not environment_id:
-            print(f"   ⚠️  Warning: Environment '{environment_name}' not found, continuing without it")
-        elif not environment_name and not environment_id:
-            print(f"   ⚠️  Warning: Default environment 'Empty' not found")
-        
-        # Prepare resource IDs
-        resource_ids = {
-            'inventory_id': inventory_id,
-            'repository_id': repository_id,
-            'environment_id': environment_id,
-            'view_id': view_id
+        for project in found:
+            targets.setdefault(project['id'], (project, []))[1].append((playbook_path, playbook_info))
+
+    print(f"Syncing {len(playbooks_with_metadata)} playbook(s) into {len(targets)} project(s): "
+          f"{', '.join(project['name'] for project, _ in targets.values())}")
+
+    # Projects are independent, so their upserts run concurrently. Each worker
+    # buffers its output so every project's log is printed in one piece.
+    thread_output = ThreadOutput.install()
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(len(targets), 8))) as pool:
+        futures = {
+            pool.submit(thread_output.capture, sync_project, semaphore_url, api_token, project,
+                        project_playbooks, perf_environments, invalid_profiles): project
+            for project, project_playbooks in targets.values()
         }
-        
-        # Create or update the template
-        if create_or_update_template(semaphore_url, api_token, project_id, playbook_path, playbook_info, resource_ids):
-            templates_processed += 1
-            # Note: The function prints whether it created or updated
-        else:
-            templates_failed += 1
-    
+        for future in as_completed(futures):
+            project = futures[future]
+            log, result = future.result()
+            output.step(f"\n=== Project: {project['name']} (ID: {project['id']}) ===")
+            print(log, end='')
+            results[project['id']] = result
+
     # Summary
-    print("\n=== Summary ===")
+    output.step("\n=== Summary ===")
+    templates_processed = 0
+    for project, _ in targets.values():
+        processed, failed = results[project['id']]
+        templates_processed += processed
+        templates_failed += failed
+        print(f"  {project['name']}: {processed} processed, {failed} failed")
     print(f"✓ Templates processed successfully: {templates_processed}")
     if templates_failed > 0:
         print(f"✗ Templates failed: {templates_failed}")
+    output.info(f"Semaphore API: {api.describe()}")
     
-    print("\n✅ Template synchronization complete!")
+    output.step("\n✅ Template synchronization complete!")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""
+PrivateBox health check.
+Checks the service chain
+
+    Proxmox → OPNsense → Unbound :5353 → AdGuard :53 → Caddy → Homer / Portainer / Semaphore
+
+and prints it as a diagnostic chain, so a failure shows exactly where the
+chain broke. Each check starts as soon as everything it depends on has
+passed and independent checks run concurrently; when a check fails, the
+checks below it are skipped instead of timing out one after another. The
+whole run is bounded by a global time budget.
+
+Results are cached for a few seconds (--ttl) so dashboard refreshes and
+repeated runs do not probe every service each time. --serve exposes the
+cached report as JSON over HTTP.
+
+Uses only the standard library so it runs on Proxmox, the management VM or
+a workstation without installing anything.
+
+Usage:
+    health-check.py                         # diagnostic chain, exit 0/1/2 = healthy/warning/critical
+    health-check.py --json --no-cache       # fresh report as JSON
+    health-check.py --serve 0.0.0.0:9100    # GET /health returns the cached JSON report
+    health-check.py --serve 9100            # same, on 127.0.0.1
+"""
+import argparse
+import hashlib
+import http.client
+import http.server
+import json
+import os
+import random
+import socket
+import ssl
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+DEFAULT_PROXMOX = "10.10.20.20:8006"
+DEFAULT_OPNSENSE = "10.10.20.1:443"
+DEFAULT_UNBOUND = "10.10.20.1:5353"
+DEFAULT_ADGUARD = "10.10.20.10:53"
+DEFAULT_CADDY = "10.10.20.10"
+DEFAULT_CACHE_FILE = "/tmp/privatebox-health-{key}.json"
+USER_AGENT = "privatebox-health-check"
+
+OK = "ok"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+HEALTHY = "healthy"
+WARNING = "warning"
+CRITICAL = "critical"
+EXIT_CODES = {HEALTHY: 0, WARNING: 1, CRITICAL: 2}
+
+
+class CheckError(Exception):
+    pass
+
+
+def split_address(address, default_port):
+    """Split HOST:PORT; a bare number is a port, anything else a host."""
+    if address.isdigit():
+        return "", int(address)
+    host, _, port = address.rpartition(":") if ":" in address else (address, "", "")
+    return host, int(port) if port else default_port
+
+
+# ============================================
+# Probes
+# ============================================
+
+def tcp_probe(host, port, timeout):
+    """Connect and close; returns a detail string."""
+    with socket.create_connection((host, port), timeout=timeout):
+        return f"{host}:{port} accepts connections"
+
+
+def http_probe(host, port, path, timeout, server_name=None, tls=False, expect=None):
+    """GET path from host:port, optionally over TLS with SNI server_name.
+
+    Connects to the address directly, so .lan names are checked through Caddy
+    without depending on the client's resolver. Certificates are not verified:
+    Caddy and the appliances use internal CAs.
+    """
+    name = server_name or host
+    sock = socket.create_connection((host, port), timeout=timeout)
+    try:
+        if tls:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            sock = context.wrap_socket(sock, server_hostname=name)
+        conn = http.client.HTTPConnection(name, port, timeout=timeout)
+        conn.sock = sock
+        conn.request("GET", path, headers={"Host": name, "User-Agent": USER_AGENT, "Connection": "close"})
+        response = conn.getresponse()
+        response.read()
+    finally:
+        sock.close()
+    accepted = expect if expect is not None else range(200, 500)
+    if response.status not in accepted:
+        raise CheckError(f"{name}{path} returned HTTP {response.status}")
+    return f"{name}{path} → HTTP {response.status}"
+
+
+def build_query(query_id, domain):
+    """Recursive A query packet."""
+    header = struct.pack(">HHHHHH", query_id, 0x0100, 1, 0, 0, 0)
+    qname = b"".join(bytes([len(label)]) + label.encode("ascii")
+                     for label in domain.rstrip(".").split(".")) + b"\x00"
+    return header + qname + struct.pack(">HH", 1, 1)
+
+
+def parse_answers(packet, query_id):
+    """Return (rcode, [A addresses]) from a response packet."""
+    if len(packet) < 12:
+        raise CheckError("short DNS response")
+    resp_id, flags, qdcount, ancount, _, _ = struct.unpack(">HHHHHH", packet[:12])
+    if resp_id != query_id:
+        raise CheckError("DNS response ID mismatch")
+
+    def skip_name(offset):
+        while True:
+            length = packet[offset]
+            if length == 0:
+                return offset + 1
+            if length & 0xC0 == 0xC0:
+                return offset + 2
+            offset += length + 1
+
+    offset = 12
+    for _ in range(qdcount):
+        offset = skip_name(offset) + 4
+    addresses = []
+    for _ in range(ancount):
+        offset = skip_name(offset)
+        rtype, _, _, rdlength = struct.unpack(">HHIH", packet[offset:offset + 10])
+        offset += 10
+        if rtype == 1 and rdlength == 4:
+            addresses.append(socket.inet_ntoa(packet[offset:offset + 4]))
+        offset += rdlength
+    return flags & 0x000F, addresses
+
+
+def dns_query(host, port, domain, timeout):
+    query_id = random.getrandbits(16)
+    packet = build_query(query_id, domain)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect((host, port))
+        sock.send(packet)
+        return parse_answers(sock.recv(4096), query_id)
+
+
+def dns_resolves(host, port, domain, timeout):
+    rcode, addresses = dns_query(host, port, domain, timeout)
+    if rcode != 0 or not addresses:
+        raise CheckError(f"{domain} did not resolve (rcode {rcode})")
+    return f"{domain} → {addresses[0]}"
+
+
+def dns_blocks(host, port, domain, timeout):
+    rcode, addresses = dns_query(host, port, domain, timeout)
+    # AdGuard answers blocked names with 0.0.0.0, NXDOMAIN or an empty answer
+    if rcode == 3 or not addresses or all(a == "0.0.0.0" for a in addresses):
+        return f"{domain} blocked"
+    raise CheckError(f"{domain} not blocked (resolved to {', '.join(addresses)})")
+
+
+def port_closed(host, port, timeout):
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            pass
+    except OSError:
+        return f"{host}:{port} not in use"
+    raise CheckError(f"{host}:{port} is still listening (should be free)")
+
+
+# ============================================
+# Check graph
+# ============================================
+
+class Check:
+    """One probe in the chain. A failed critical check makes the system critical,
+    any other failure only a warning."""
+
+    def __init__(self, name, title, probe, depends=(), critical=True):
+        self.name = name
+        self.title = title
+        self.probe = probe
+        self.depends = tuple(depends)
+        self.critical = critical
+
+
+def build_checks(args):
+    proxmox_host, proxmox_port = split_address(args.proxmox, 8006)
+    opnsense_host, opnsense_port = split_address(args.opnsense, 443)
+    unbound_host, unbound_port = split_address(args.unbound, 5353)
+    adguard_host, adguard_port = split_address(args.adguard, 53)
+    caddy = args.caddy
+
+    checks = [
+        Check("proxmox", "Proxmox web interface",
+              lambda t: http_probe(proxmox_host, proxmox_port, "/", t, tls=True)),
+        Check("opnsense", "OPNsense reachable",
+              lambda t: tcp_probe(opnsense_host, opnsense_port, t), ["proxmox"]),
+        Check("opnsense-port-53", "OPNsense port 53 free for AdGuard",
+              lambda t: port_closed(opnsense_host, 53, t), ["opnsense"], critical=False),
+        Check("unbound", f"Unbound resolving on :{unbound_port}",
+              lambda t: dns_resolves(unbound_host, unbound_port, args.test_domain, t), ["opnsense"]),
+        Check("adguard", f"AdGuard resolving on :{adguard_port}",
+              lambda t: dns_resolves(adguard_host, adguard_port, args.test_domain, t), ["unbound"]),
+        Check("adguard-blocking", "AdGuard ad blocking",
+              lambda t: dns_blocks(adguard_host, adguard_port, args.blocked_domain, t), ["adguard"],
+              critical=False),
+        Check("caddy", "Caddy reverse proxy",
+              lambda t: http_probe(caddy, 80, "/health", t, expect=(200,)), ["adguard"]),
+        Check("homer", "Homer dashboard (privatebox.lan)",
+              lambda t: http_probe(caddy, 443, "/", t, "privatebox.lan", tls=True, expect=(200,)), ["caddy"]),
+        Check("portainer", "Portainer (portainer.lan)",
+              lambda t: http_probe(caddy, 443, "/api/status", t, "portainer.lan", tls=True, expect=(200,)),
+              ["caddy"]),
+        Check("semaphore", "Semaphore (semaphore.lan)",
+              lambda t: http_probe(caddy, 443, "/api/ping", t, "semaphore.lan", tls=True, expect=(200,)),
+              ["caddy"]),
+    ]
+    return checks
+
+
+def run_checks(checks, budget, timeout):
+    """Run the check graph; returns {name: result dict} in check order.
+
+    A check is started once all its dependencies passed and skipped as soon
+    as one of them did not. Every probe gets min(timeout, remaining budget),
+    and whatever is still running when the budget runs out is reported as
+    timed out.
+    """
+    by_name = {check.name: check for check in checks}
+    for check in checks:
+        unknown = set(check.depends) - set(by_name)
+        if unknown:
+            raise ValueError(f"check {check.name} depends on unknown check(s) {', '.join(sorted(unknown))}")
+    start = time.monotonic()
+    deadline = start + budget
+    results = {}
+    pending = list(checks)
+    running = {}
+
+    def finish(check, status, detail, started):
+        results[check.name] = {
+            "name": check.name, "title": check.title, "status": status, "detail": detail,
+            "critical": check.critical, "depends": list(check.depends),
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 1) if started else None,
+        }
+
+    def run_one(check, probe_timeout):
+        started = time.monotonic()
+        try:
+            detail = check.probe(probe_timeout)
+            return check, OK, detail, started
+        except socket.timeout:
+            return check, FAILED, f"no answer within {probe_timeout:.1f} s", started
+        except (OSError, CheckError, http.client.HTTPException, ValueError, IndexError, struct.error) as e:
+            return check, FAILED, str(e) or type(e).__name__, started
+
+    pool = ThreadPoolExecutor(max_workers=max(1, len(checks)))
+    try:
+        while pending or running:
+            for check in list(pending):
+                blocked = [d for d in check.depends if d in results and results[d]["status"] != OK]
+                if blocked:
+                    finish(check, SKIPPED, f"{by_name[blocked[0]].title} did not pass", None)
+                    pending.remove(check)
+                elif all(d in results for d in check.depends):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        finish(check, FAILED, f"not started within the {budget:.1f} s budget", None)
+                    else:
+                        future = pool.submit(run_one, check, min(timeout, remaining))
+                        running[future] = (check, time.monotonic())
+                    pending.remove(check)
+            if not running:
+                continue
+
+            done, _ = wait(running, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                for future, (check, submitted) in running.items():
+                    future.cancel()
+                    finish(check, FAILED, f"no answer within the {budget:.1f} s budget", submitted)
+                running.clear()
+                continue
+            for future in done:
+                del running[future]
+                finish(*future.result())
+    finally:
+        # Probes are bounded by the budget anyway; do not wait for stragglers
+        pool.shutdown(wait=False, cancel_futures=True)
+    return {check.name: results[check.name] for check in checks}
+
+
+def build_report(checks, budget, timeout):
+    start = time.monotonic()
+    results = run_checks(checks, budget, timeout)
+    failed = [r for r in results.values() if r["status"] == FAILED]
+    if any(r["critical"] for r in failed):
+        status = CRITICAL
+    elif failed:
+        status = WARNING
+    else:
+        status = HEALTHY
+    return {
+        "status": status,
+        "checked_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "created": time.time(),
+        "elapsed_ms": round((time.monotonic() - start) * 1000),
+        "passed": sum(1 for r in results.values() if r["status"] == OK),
+        "failed": len(failed),
+        "skipped": sum(1 for r in results.values() if r["status"] == SKIPPED),
+        "checks": list(results.values()),
+    }
+
+
+# ============================================
+# Result cache
+# ============================================
+
+def default_cache_file(args):
+    """Cache file for this set of targets, so runs against different hosts
+    never reuse each other's report."""
+    targets = [args.proxmox, args.opnsense, args.unbound, args.adguard, args.caddy,
+               args.test_domain, args.blocked_domain]
+    key = hashlib.sha256("\0".join(targets).encode()).hexdigest()[:12]
+    return DEFAULT_CACHE_FILE.format(key=key)
+
+
+class ReportCache:
+    """Reuse a report younger than ttl seconds, in memory and in cache_file.
+
+    Concurrent callers share one run: the first one checks, the others wait
+    for its report instead of probing the services again.
+    """
+
+    def __init__(self, produce, ttl, cache_file=None):
+        self.produce = produce
+        self.ttl = ttl
+        self.cache_file = cache_file
+        self.lock = threading.Lock()
+        self.report = None
+
+    def _load(self):
+        if self.report is None and self.cache_file:
+            try:
+                with open(self.cache_file) as f:
+                    self.report = json.load(f)
+            except (OSError, ValueError):
+                return None
+        return self.report
+
+    def _store(self, report):
+        self.report = report
+        if not self.cache_file:
+            return
+        tmp = f"{self.cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(report, f)
+            os.replace(tmp, self.cache_file)
+        except OSError:
+            # A cache that cannot be written only costs the next caller a fresh run
+            pass
+
+    def get(self, refresh=False):
+        with self.lock:
+            report = None if refresh else self._load()
+            age = time.time() - report["created"] if report else None
+            if report is None or not 0 <= age < self.ttl:
+                report = self.produce()
+                self._store(report)
+                age = 0.0
+            return dict(report, cached=age > 0, age_s=round(age, 1))
+
+
+# ============================================
+# Output
+# ============================================
+
+SYMBOLS = {OK: "✓", SKIPPED: "→"}
+STATUS_LINES = {
+    HEALTHY: "✓ Healthy: all systems are operating correctly",
+    WARNING: "⚠ Warning: the system is functional but some checks failed",
+    CRITICAL: "✗ Critical: a core component has failed",
+}
+
+
+def print_report(report):
+    checks = {r["name"]: r for r in report["checks"]}
+    children = {}
+    for result in report["checks"]:
+        parent = result["depends"][0] if result["depends"] else None
+        children.setdefault(parent, []).append(result)
+
+    def show(result, depth):
+        if result["status"] == FAILED:
+            symbol = "✗" if result["critical"] else "⚠"
+        else:
+            symbol = SYMBOLS[result["status"]]
+        timing = f" ({result['elapsed_ms']:.0f} ms)" if result["elapsed_ms"] is not None else ""
+        print(f"{'  ' * depth}{symbol} {result['title']}: {result['detail']}{timing}")
+        for child in children.get(result["name"], []):
+            show(child, depth + 1)
+
+    print("=== PrivateBox Health Check ===")
+    cached = f" (cached, {report['age_s']:.0f} s old)" if report.get("cached") else ""
+    print(f"Time: {report['checked_at']}{cached}")
+    print()
+    for root in children.get(None, []):
+        show(root, 0)
+    print()
+    print(f"{report['passed']}/{len(checks)} checks passed, {report['failed']} failed, "
+          f"{report['skipped']} skipped in {report['elapsed_ms']} ms")
+    print(STATUS_LINES[report["status"]])
+
+
+def serve(cache, address):
+    host, port = split_address(address, 9100)
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/health"):
+                self.send_error(404)
+                return
+            report = cache.get()
+            body = json.dumps(report).encode()
+            # Healthy and warning both mean the system works; monitors alert on 503
+            self.send_response(503 if report["status"] == CRITICAL else 200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", f"max-age={int(cache.ttl)}")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host or "127.0.0.1", port), Handler)
+    print(f"Serving health report on http://{host or '127.0.0.1'}:{port}/health (ttl {cache.ttl:g} s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the health of the PrivateBox service chain")
+    parser.add_argument("--proxmox", default=DEFAULT_PROXMOX, help="Proxmox HOST:PORT (default: %(default)s)")
+    parser.add_argument("--opnsense", default=DEFAULT_OPNSENSE, help="OPNsense HOST:PORT (default: %(default)s)")
+    parser.add_argument("--unbound", default=DEFAULT_UNBOUND, help="Unbound HOST:PORT (default: %(default)s)")
+    parser.add_argument("--adguard", default=DEFAULT_ADGUARD, help="AdGuard HOST:PORT (default: %(default)s)")
+    parser.add_argument("--caddy", default=DEFAULT_CADDY, help="Caddy host (default: %(default)s)")
+    parser.add_argument("--test-domain", default="google.com", help="Domain that must resolve")
+    parser.add_argument("--blocked-domain", default="doubleclick.net", help="Domain AdGuard must block")
+    parser.add_argument("--budget", type=float, default=3.0,
+                        help="Time budget for the whole run in seconds (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=1.0,
+                        help="Timeout for a single probe in seconds (default: %(default)s)")
+    parser.add_argument("--ttl", type=float, default=15.0,
+                        help="Reuse results younger than this many seconds (default: %(default)s)")
+    parser.add_argument("--cache-file",
+                        help="Result cache (default: /tmp/privatebox-health-<targets hash>.json)")
+    parser.add_argument("--no-cache", action="store_true", help="Run the checks even if a cached report is fresh")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--serve", metavar="[HOST:]PORT", help="Serve the report as JSON over HTTP")
+    args = parser.parse_args()
+
+    checks = build_checks(args)
+    cache_file = args.cache_file or default_cache_file(args)
+    cache = ReportCache(lambda: build_report(checks, args.budget, args.timeout), args.ttl, cache_file)
+    if args.serve:
+        return serve(cache, args.serve)
+
+    report = cache.get(refresh=args.no_cache)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return EXIT_CODES[report["status"]]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
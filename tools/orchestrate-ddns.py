@@ -2,6 +2,9 @@
 """
 Semaphore DynDNS orchestration script.
 Runs DynDNS configuration templates in the correct sequence.
+OUTPUT_MODE=quiet|normal|debug selects the verbosity (see task_output.py).
+Finished task output is added to the task log archive after each run
+(archive-task-logs.py; ARCHIVE_TASK_LOGS=false skips it).
 
 Prerequisites:
 - DynDNS 1: Setup Environment must be run first (creates privatebox-env-dns)
@@ -11,6 +14,7 @@ import os
 import sys
 import json
 import time
+import subprocess
 from pathlib import Path
 
 # Auto-install dependencies if not available
@@ -18,7 +22,6 @@ try:
     import requests
     import urllib3
 except ImportError:
-    import subprocess
     print("Installing requests package...")
     subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'requests'])
     import requests
@@ -27,6 +30,9 @@ except ImportError:
 # Disable SSL warnings for self-signed certificates (internal Services VLAN only)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+from api_client import api
+from task_output import output, redact, redact_arg
+
 
 class DynDNSOrchestrator:
     """Orchestrates DynDNS configuration template execution."""
@@ -40,6 +46,8 @@ class DynDNSOrchestrator:
             if '=' in arg:
                 key, value = arg.split('=', 1)
                 variables[key] = value
+        output.configure(variables)
+        api.configure(variables)
 
         # Get API token from parsed arguments (how Semaphore provides it)
         self.api_token = variables.get('SEMAPHORE_API_TOKEN')
@@ -52,6 +60,9 @@ class DynDNSOrchestrator:
         # When running inside Semaphore container, need to use host IP not localhost
         self.base_url = variables.get('SEMAPHORE_URL', 'https://10.10.20.10:2443')
         self.project_id = 1
+
+        # Archive task output after each run (ARCHIVE_TASK_LOGS=false to skip)
+        self.archive_logs = variables.get('ARCHIVE_TASK_LOGS', 'true').lower() != 'false'
         self.headers = {"Authorization": f"Bearer {self.api_token}"}
 
         # Define the template sequence
@@ -69,17 +80,17 @@ class DynDNSOrchestrator:
 
         if not self.api_token:
             print("✗ SEMAPHORE_API_TOKEN not found in arguments or environment")
-            print("  Debug: Command line arguments:", sys.argv)
-            print("  Debug: Parsed variables:", variables)
+            print("  Debug: Command line arguments:", [redact_arg(arg) for arg in sys.argv])
+            print("  Debug: Parsed variables:", {k: redact(k, v) for k, v in variables.items()})
             sys.exit(1)
 
     def test_connectivity(self):
         """Test connection to Semaphore API."""
-        print("\n=== Testing Semaphore API Connection ===")
+        output.info("\n=== Testing Semaphore API Connection ===")
         try:
-            response = requests.get(f"{self.base_url}/api/ping", timeout=5, verify=False)
+            response = api.get(f"{self.base_url}/api/ping", timeout=5, verify=False)
             if response.status_code == 200:
-                print(f"✓ Connected to Semaphore at {self.base_url}")
+                output.info(f"✓ Connected to Semaphore at {self.base_url}")
                 return True
             else:
                 print(f"✗ Unexpected response: {response.status_code}")
@@ -90,9 +101,9 @@ class DynDNSOrchestrator:
 
     def test_authentication(self):
         """Test API authentication."""
-        print("\n=== Testing Authentication ===")
+        output.info("\n=== Testing Authentication ===")
         try:
-            response = requests.get(
+            response = api.get(
                 f"{self.base_url}/api/user",
                 headers=self.headers,
                 timeout=5,
@@ -100,8 +111,8 @@ class DynDNSOrchestrator:
             )
             if response.status_code == 200:
                 user_data = response.json()
-                print(f"✓ Authenticated as: {user_data.get('username', 'unknown')}")
-                print(f"  Admin: {user_data.get('admin', False)}")
+                output.info(f"✓ Authenticated as: {user_data.get('username', 'unknown')}")
+                output.info(f"  Admin: {user_data.get('admin', False)}")
                 return True
             else:
                 print(f"✗ Authentication failed: {response.status_code}")
@@ -114,7 +125,7 @@ class DynDNSOrchestrator:
         """Check that privatebox-env-dns environment exists."""
         print("\n=== Checking Prerequisites ===")
         try:
-            response = requests.get(
+            response = api.get(
                 f"{self.base_url}/api/project/{self.project_id}/environment",
                 headers=self.headers,
                 timeout=10,
@@ -141,7 +152,7 @@ class DynDNSOrchestrator:
     def get_templates(self):
         """Get all templates from Semaphore."""
         try:
-            response = requests.get(
+            response = api.get(
                 f"{self.base_url}/api/project/{self.project_id}/templates",
                 headers=self.headers,
                 timeout=10,
@@ -159,7 +170,7 @@ class DynDNSOrchestrator:
     def find_template_by_name(self, name):
         """Find a template by its name with a fresh API call."""
         try:
-            response = requests.get(
+            response = api.get(
                 f"{self.base_url}/api/project/{self.project_id}/templates",
                 headers=self.headers,
                 timeout=10,
@@ -187,7 +198,7 @@ class DynDNSOrchestrator:
                 "debug": False,
                 "dry_run": False
             }
-            response = requests.post(
+            response = api.post(
                 f"{self.base_url}/api/project/{self.project_id}/tasks",
                 headers=self.headers,
                 json=payload,
@@ -197,7 +208,7 @@ class DynDNSOrchestrator:
             if response.status_code == 201:
                 task_data = response.json()
                 task_id = task_data.get('id')
-                print(f"  Started task ID: {task_id}")
+                output.info(f"  Started task ID: {task_id}")
                 return task_id
             else:
                 print(f"  ✗ Failed to start template: {response.status_code}")
@@ -210,13 +221,13 @@ class DynDNSOrchestrator:
 
     def wait_for_task(self, task_id, template_name, timeout=600):
         """Wait for a task to complete."""
-        print(f"  Waiting for completion", end="")
+        output.info(f"  Waiting for completion", end="")
         start_time = time.time()
         last_status = None
 
         while time.time() - start_time < timeout:
             try:
-                response = requests.get(
+                response = api.get(
                     f"{self.base_url}/api/project/{self.project_id}/tasks/{task_id}",
                     headers=self.headers,
                     timeout=5,
@@ -228,14 +239,14 @@ class DynDNSOrchestrator:
 
                     if status != last_status:
                         if last_status is not None:
-                            print()
-                        print(f"  Status: {status}", end="")
+                            output.info()
+                        output.info(f"  Status: {status}", end="")
                         last_status = status
                     else:
-                        print(".", end="", flush=True)
+                        output.progress()
 
                     if status in ['success', 'error', 'failed']:
-                        print()
+                        output.info()
                         return status
 
                     time.sleep(5)
@@ -253,7 +264,7 @@ class DynDNSOrchestrator:
     def get_task_output(self, task_id):
         """Get the last lines of task output for error reporting."""
         try:
-            response = requests.get(
+            response = api.get(
                 f"{self.base_url}/api/project/{self.project_id}/tasks/{task_id}/output",
                 headers=self.headers,
                 timeout=10,
@@ -278,6 +289,31 @@ class DynDNSOrchestrator:
         except:
             return []
 
+    def archive_task_logs(self):
+        """Add this run's finished tasks to the task log archive (tools/archive-task-logs.py).
+
+        Runs after the summary and never changes the orchestration result.
+        """
+        if not self.archive_logs:
+            return
+        script = Path(__file__).resolve().parent / 'archive-task-logs.py'
+        # Token via the environment so it does not show up in the process list
+        env = dict(os.environ, SEMAPHORE_API_TOKEN=self.api_token)
+        try:
+            result = subprocess.run(
+                [sys.executable, str(script), 'sync', '--url', self.base_url, '--project', str(self.project_id)],
+                env=env, capture_output=True, text=True, timeout=300
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"\n⚠ Task log archive skipped: {e}")
+            return
+        lines = result.stdout.strip().splitlines()
+        if result.returncode == 0:
+            summary = next((line for line in lines if line.startswith('✓ Archived')), 'archive updated')
+            output.info(f"\n{summary}")
+        else:
+            print(f"\n⚠ Task log archive failed: {lines[-1] if lines else result.stderr.strip()}")
+
     def run_orchestration(self):
         """Run the complete orchestration sequence."""
         print("\n" + "=" * 60)
@@ -341,7 +377,7 @@ class DynDNSOrchestrator:
 
             # Short pause between templates
             if template_name != self.template_sequence[-1]:
-                print("  Waiting 5 seconds before next template...")
+                output.info("  Waiting 5 seconds before next template...")
                 time.sleep(5)
 
         # Summary
@@ -354,6 +390,9 @@ class DynDNSOrchestrator:
             for name in successful_templates:
                 print(f"  - {name}")
 
+        output.info(f"\nSemaphore API: {api.describe()}")
+        self.archive_task_logs()
+
         if failed_template:
             print(f"\n✗ Failed at: {failed_template}")
             print(f"  Templates not run: {len(self.template_sequence) - len(successful_templates) - 1}")
@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+PrivateBox support bundle collector.
+Gathers logs and state from Proxmox, the management VM (journald for the
+quadlet units), OPNsense and the Semaphore task history into a single
+archive for troubleshooting.
+
+All sources are collected in parallel. Each host gets one persistent SSH
+connection (OpenSSH ControlMaster) that every command on it reuses, and
+Semaphore is read through the shared API client. Output is redacted line
+by line while it streams in and is gzipped straight into a spooled buffer
+per source, so nothing is staged uncompressed and memory stays bounded by
+--jobs, however large the journals are. Each source is capped at --cap MB;
+manifest.json lists every source with its timings, size and exit status.
+
+Run on the Proxmox host (it has the SSH keys for the management VM and
+OPNsense, and the bootstrap configuration with the secrets to redact).
+
+Usage:
+    support-bundle.py                              # writes /tmp/privatebox-support-SR-....tar
+    support-bundle.py --since 2h --cap 20 --output /root
+    support-bundle.py SEMAPHORE_API_TOKEN=... --tasks 50
+
+The archive holds a <bundle id>/<host>/<source>.gz member per source plus
+manifest.json; extract with tar xf and read with zless. The archive is
+written even when sources fail, but the exit status is then 1.
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import re
+import secrets
+import shutil
+import signal
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Auto-install dependencies if not available
+try:
+    import requests
+    import urllib3
+except ImportError:
+    print("Installing requests package...")
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'requests'])
+    import requests
+    import urllib3
+
+# Disable SSL warnings for self-signed certificates (internal Services VLAN only)
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+from api_client import api
+from task_output import SECRET_NAME_RE, is_secret
+
+DEFAULT_URL = "https://10.10.20.10:2443"
+DEFAULT_CONFIG = "/tmp/privatebox-config.conf"
+DEFAULT_SSH_KEY = "/root/.ssh/id_ed25519"
+DEFAULT_OPNSENSE_KEY = "/root/.credentials/opnsense/id_ed25519"
+SPOOL_MEMORY = 4 * 1024 * 1024  # per source, compressed; larger sources spill to a temp file
+MAX_LINE = 64 * 1024
+BATCH_SIZE = 256 * 1024
+SSH_OPTIONS = ["-o", "BatchMode=yes", "-o", "StrictHostKeyChecking=no", "-o", "UserKnownHostsFile=/dev/null",
+               "-o", "LogLevel=ERROR", "-o", "ConnectTimeout=10"]
+
+ANSI_RE = re.compile(r'\x1b\[[0-9;]*m')
+
+# (member name, host, command); {since} is the journal window
+SOURCES = [
+    ("proxmox/pveversion.txt", "proxmox", "pveversion -v"),
+    ("proxmox/qm-list.txt", "proxmox", "qm list"),
+    ("proxmox/bootstrap.log", "proxmox", "cat /tmp/privatebox-bootstrap.log"),
+    ("proxmox/journal.log", "proxmox", "journalctl --no-pager -o short-iso --since=-{since}"),
+    ("management/install-progress.log", "management", "cat /etc/privatebox-install-complete"),
+    ("management/failed-units.txt", "management", "systemctl --failed --no-pager"),
+    ("management/podman-ps.txt", "management", "sudo -n podman ps -a"),
+    ("management/services-journal.log", "management",
+     "sudo -n journalctl --no-pager -o short-iso --since=-{since}"
+     " -u semaphore -u adguard -u caddy -u homer -u portainer"),
+    ("opnsense/version.txt", "opnsense", "opnsense-version"),
+    ("opnsense/unbound-status.txt", "opnsense", "configctl unbound status"),
+    ("opnsense/system.log", "opnsense", "tail -n 50000 /var/log/system/latest.log"),
+    ("opnsense/resolver.log", "opnsense", "tail -n 50000 /var/log/resolver/latest.log"),
+]
+
+
+# ============================================
+# Redaction
+# ============================================
+
+class Redactor:
+    """Line-by-line secret redaction for one stream.
+
+    Replaces the known secret values (passwords and tokens from the bootstrap
+    configuration and the arguments), values of secret-looking keys
+    (password: ..., "api_token": "...", SERVICES_PASSWORD=...), bearer
+    tokens, credentials in URLs and whole private key blocks.
+    """
+
+    KEY_VALUE_RE = re.compile(
+        r'((?:' + SECRET_NAME_RE.pattern + r')[\w.-]*["\']?\s*[:=]\s*)("[^"]*"|\'[^\']*\'|[^\s"\',;}]+)', re.IGNORECASE)
+    PATTERNS = [
+        (re.compile(r'(\b(?:Bearer|Token|Basic)\s+)[A-Za-z0-9._~+/=-]{8,}', re.IGNORECASE), r'\1***'),
+        (re.compile(r'((?:Authorization|Cookie|Set-Cookie)["\']?\s*[:=]\s*).+', re.IGNORECASE), r'\1***'),
+        (re.compile(r'(://[^/\s:@]+:)[^@\s/]+@'), r'\1***@'),
+        # Quoted values keep their quotes so JSON and shell syntax stay readable
+        (KEY_VALUE_RE, lambda m: m.group(1) + (m.group(2)[0] + '***' + m.group(2)[0]
+                                               if m.group(2)[0] in '"\'' else '***')),
+    ]
+    # Cheap pre-filter: most journal lines contain none of these and skip the patterns
+    TRIGGER_RE = re.compile(r'token|secret|pass|key|credential|bearer|basic|authorization|cookie|://')
+    KEY_BEGIN_RE = re.compile(r'-----BEGIN [A-Z ]*PRIVATE KEY-----')
+    KEY_END_RE = re.compile(r'-----END [A-Z ]*PRIVATE KEY-----')
+
+    def __init__(self, values):
+        # Longest first so a secret containing another one is replaced whole
+        self.values = sorted({v for v in values if v and len(v) >= 4}, key=len, reverse=True)
+        self.in_key = False
+        self.count = 0
+
+    def __call__(self, line):
+        if self.in_key:
+            if self.KEY_END_RE.search(line):
+                self.in_key = False
+            return None
+        for value in self.values:
+            if value in line:
+                self.count += line.count(value)
+                line = line.replace(value, "***")
+        if not self.TRIGGER_RE.search(line.lower()):
+            return line
+        if self.KEY_BEGIN_RE.search(line):
+            self.count += 1
+            self.in_key = not self.KEY_END_RE.search(line)
+            return "[private key redacted]"
+        for pattern, replacement in self.PATTERNS:
+            line, hits = pattern.subn(replacement, line)
+            self.count += hits
+        return line
+
+
+def read_config(path):
+    """KEY=VALUE pairs of the bootstrap configuration; empty when it is missing."""
+    config = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                key, sep, value = line.strip().partition("=")
+                if sep and not key.startswith("#"):
+                    config[key] = value.strip().strip('"\'')
+    except OSError:
+        pass
+    return config
+
+
+def load_secret_values(config, variables):
+    """Secret values from the bootstrap configuration, arguments and environment."""
+    values = [value for key, value in variables.items() if is_secret(key)]
+    values += [value for key, value in os.environ.items() if key.startswith("SEMAPHORE_") and is_secret(key)]
+    values += [value for key, value in config.items() if is_secret(key)]
+    return values
+
+
+# ============================================
+# Source streams
+# ============================================
+
+class SourceStream:
+    """Redacted, gzip-compressed output of one source, capped at cap bytes of input."""
+
+    def __init__(self, name, redactor, cap):
+        self.name = name
+        self.redactor = redactor
+        self.cap = cap
+        self.spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY)
+        self.gz = gzip.GzipFile(filename=os.path.basename(name), fileobj=self.spool, mode="wb",
+                                compresslevel=6, mtime=0)
+        self.pending = []
+        self.pending_bytes = 0
+        self.bytes_in = 0
+        self.lines = 0
+        self.truncated = False
+
+    def _flush(self):
+        # One compressor call per batch instead of one per line
+        self.gz.write(b"".join(self.pending))
+        self.pending = []
+        self.pending_bytes = 0
+
+    def write_text(self, text):
+        """Add one line; returns False once the cap is reached."""
+        if self.truncated:
+            return False
+        self.bytes_in += len(text) + 1
+        if self.bytes_in > self.cap:
+            self.truncated = True
+            self.pending.append(f"[truncated: source exceeded {self.cap // (1024 * 1024)} MB]\n".encode())
+            return False
+        line = self.redactor(text)
+        if line is not None:
+            data = line.encode("utf-8", errors="replace") + b"\n"
+            self.pending.append(data)
+            self.pending_bytes += len(data)
+            self.lines += 1
+            if self.pending_bytes >= BATCH_SIZE:
+                self._flush()
+        return True
+
+    def write(self, raw):
+        return self.write_text(raw.decode("utf-8", errors="replace").rstrip("\r\n"))
+
+    def finish(self):
+        """Close the gzip stream; returns (file object at offset 0, compressed size)."""
+        self._flush()
+        self.gz.close()
+        size = self.spool.tell()
+        self.spool.seek(0)
+        return self.spool, size
+
+
+# ============================================
+# Hosts
+# ============================================
+
+class LocalHost:
+    def __init__(self, name):
+        self.name = name
+        self.target = "local"
+        self.error = None
+
+    def open(self):
+        return True
+
+    def command(self, command):
+        return ["sh", "-c", command]
+
+    def close(self):
+        pass
+
+
+class SshHost:
+    """One persistent SSH connection that every command on the host reuses."""
+
+    def __init__(self, name, target, key, control_dir):
+        self.name = name
+        self.target = target
+        self.options = list(SSH_OPTIONS) + (["-i", key] if key and os.path.exists(key) else [])
+        self.control = ["-o", f"ControlPath={os.path.join(control_dir, name)}"]
+        self.error = None
+
+    def open(self):
+        result = subprocess.run(
+            ["ssh", *self.options, *self.control, "-o", "ControlMaster=yes", "-o", "ControlPersist=300",
+             "-N", "-f", self.target],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=30)
+        if result.returncode != 0:
+            self.error = result.stderr.decode(errors="replace").strip() or f"ssh exited {result.returncode}"
+            return False
+        return True
+
+    def command(self, command):
+        return ["ssh", *self.options, *self.control, "-o", "ControlMaster=no", self.target, command]
+
+    def close(self):
+        subprocess.run(["ssh", *self.control, "-O", "exit", self.target],
+                       stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10)
+
+
+def make_host(name, target, key, control_dir):
+    if target == "local":
+        return LocalHost(name)
+    return SshHost(name, target, key, control_dir)
+
+
+# ============================================
+# Collectors
+# ============================================
+
+def collect_command(stream, host, command, timeout):
+    """Stream a command's output into stream; returns (exit code, error)."""
+    if host.error:
+        stream.write_text(f"[not collected: cannot connect to {host.target}: {host.error}]")
+        return None, f"cannot connect to {host.target}"
+    # Own process group, so a timeout or the cap also stops the command's children
+    process = subprocess.Popen(host.command(command), stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)
+    timed_out = threading.Event()
+
+    def stop():
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def kill():
+        timed_out.set()
+        stop()
+
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    try:
+        for raw in iter(lambda: process.stdout.readline(MAX_LINE), b""):
+            if not stream.write(raw):
+                # Over the cap: stop the transfer instead of reading the rest
+                stop()
+                break
+    finally:
+        timer.cancel()
+        process.stdout.close()
+        code = process.wait()
+    if timed_out.is_set():
+        stream.write_text(f"[timed out after {timeout} s]")
+        return code, f"timed out after {timeout} s"
+    if code != 0 and not stream.truncated:
+        return code, f"exit code {code}"
+    return code, None
+
+
+def collect_semaphore(stream, base_url, headers, project_id, count, jobs):
+    """Write the newest tasks and their output; returns (None, error)."""
+    def get(path):
+        response = api.get(f"{base_url}{path}", headers=headers, timeout=30, verify=False)
+        response.raise_for_status()
+        return response.json()
+
+    try:
+        templates = {t["id"]: t.get("name") for t in get(f"/api/project/{project_id}/templates")}
+        tasks = sorted(get(f"/api/project/{project_id}/tasks"), key=lambda t: t["id"], reverse=True)[:count]
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            outputs = pool.map(lambda t: get(f"/api/project/{project_id}/tasks/{t['id']}/output"), tasks)
+            for task, output in zip(tasks, outputs):
+                stream.write_text(f"=== task {task['id']} [{task.get('status')}] "
+                                  f"{templates.get(task.get('template_id'), task.get('template_id'))} "
+                                  f"created {task.get('created')} ===")
+                for line in output:
+                    if not stream.write_text(ANSI_RE.sub('', line.get("output", "")).rstrip()):
+                        return None, None
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        stream.write_text(f"[Semaphore API error: {e}]")
+        return None, str(e)
+    return None, None
+
+
+def semaphore_headers(base_url, token, password):
+    """Bearer token if given, else a login session cookie on the shared API session."""
+    if token:
+        return {"Authorization": f"Bearer {token}"}
+    response = api.post(f"{base_url}/api/auth/login", json={"auth": "admin", "password": password},
+                        timeout=30, verify=False)
+    response.raise_for_status()
+    return {}
+
+
+# ============================================
+# Bundle
+# ============================================
+
+def add_member(tar, name, fileobj, size):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(time.time())
+    info.mode = 0o600
+    tar.addfile(info, fileobj)
+
+
+def build_bundle(args, variables):
+    bundle_id = f"SR-{time.strftime('%Y-%m%d')}-{secrets.token_hex(2).upper()}"
+    path = os.path.join(args.output, f"privatebox-support-{bundle_id}.tar")
+    config = read_config(args.config)
+    secret_values = load_secret_values(config, variables)
+    cap = args.cap * 1024 * 1024
+    start = time.monotonic()
+
+    control_dir = tempfile.mkdtemp(prefix="privatebox-bundle-ssh-")
+    hosts = {
+        "proxmox": make_host("proxmox", args.proxmox, args.ssh_key, control_dir),
+        "management": make_host("management", args.management, args.ssh_key, control_dir),
+        "opnsense": make_host("opnsense", args.opnsense, args.opnsense_key, control_dir),
+    }
+    # (member, host, collect(stream) -> (exit code, error))
+    jobs = [(name, hosts[host], lambda s, h=hosts[host], c=command.replace("{since}", args.since):
+             collect_command(s, h, c, args.timeout))
+            for name, host, command in SOURCES]
+
+    semaphore_error = None
+    password = variables.get("SERVICES_PASSWORD") or config.get("SERVICES_PASSWORD")
+    if args.tasks and not (args.token or password):
+        semaphore_error = f"no SEMAPHORE_API_TOKEN and no SERVICES_PASSWORD in {args.config}"
+    elif args.tasks:
+        try:
+            headers = semaphore_headers(args.url, args.token, password)
+            jobs.append(("semaphore/task-history.log", None,
+                         lambda s: collect_semaphore(s, args.url, headers, args.project, args.tasks, args.jobs)))
+        except requests.exceptions.RequestException as e:
+            semaphore_error = f"login failed: {e}"
+
+    manifest = {"bundle_id": bundle_id, "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "since": args.since, "cap_mb": args.cap, "hosts": {}, "sources": []}
+    try:
+        # Connections are opened in parallel before any command runs on them
+        with ThreadPoolExecutor(max_workers=len(hosts)) as pool:
+            for host, opened in zip(hosts.values(), pool.map(lambda h: h.open(), hosts.values())):
+                manifest["hosts"][host.name] = {"target": host.target, "connected": opened, "error": host.error}
+                if not opened:
+                    print(f"⚠ Cannot connect to {host.name} ({host.target}): {host.error}")
+
+        def run(name, host, collect):
+            started = time.monotonic()
+            stream = SourceStream(name, Redactor(secret_values), cap)
+            try:
+                code, error = collect(stream)
+            except (OSError, subprocess.SubprocessError) as e:
+                code, error = None, str(e)
+                stream.write_text(f"[collection failed: {e}]")
+            fileobj, size = stream.finish()
+            entry = {
+                "name": f"{name}.gz", "host": host.target if host else args.url,
+                "status": "failed" if error else ("truncated" if stream.truncated else "ok"),
+                "error": error, "exit_code": code, "lines": stream.lines, "bytes": stream.bytes_in,
+                "compressed_bytes": size, "redactions": stream.redactor.count,
+                "started_ms": round((started - start) * 1000), "elapsed_ms": round((time.monotonic() - started) * 1000),
+            }
+            return entry, fileobj
+
+        os.makedirs(args.output, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=args.output, prefix=".privatebox-support-")
+        with os.fdopen(fd, "wb") as raw, tarfile.open(fileobj=raw, mode="w") as tar:
+            with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+                futures = [pool.submit(run, *job) for job in jobs]
+                # Members are appended in completion order by this thread only
+                for future in as_completed(futures):
+                    entry, fileobj = future.result()
+                    add_member(tar, f"{bundle_id}/{entry['name']}", fileobj, entry["compressed_bytes"])
+                    fileobj.close()
+                    manifest["sources"].append(entry)
+                    symbol = {"ok": "✓", "truncated": "⚠"}.get(entry["status"], "✗")
+                    detail = f" - {entry['error']}" if entry["error"] else ""
+                    print(f"  {symbol} {entry['name']}: {entry['lines']} lines, "
+                          f"{entry['compressed_bytes'] / 1024:.0f} KB in {entry['elapsed_ms']} ms{detail}")
+            if semaphore_error:
+                manifest["sources"].append({"name": "semaphore/task-history.log.gz", "host": args.url,
+                                            "status": "failed", "error": semaphore_error})
+                print(f"  ✗ semaphore/task-history.log.gz: {semaphore_error}")
+            manifest["sources"].sort(key=lambda e: e["name"])
+            manifest["elapsed_ms"] = round((time.monotonic() - start) * 1000)
+            data = json.dumps(manifest, indent=2).encode()
+            add_member(tar, f"{bundle_id}/manifest.json", io.BytesIO(data), len(data))
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, path)
+    finally:
+        for host in hosts.values():
+            if host.error is None:
+                try:
+                    host.close()
+                except (OSError, subprocess.SubprocessError):
+                    pass
+        shutil.rmtree(control_dir, ignore_errors=True)
+    return path, manifest
+
+
+def main():
+    # Semaphore passes variables as KEY=VALUE arguments; everything else is a normal CLI
+    variables = dict(arg.split("=", 1) for arg in sys.argv[1:] if re.match(r'^[A-Z_]+=', arg))
+    argv = [arg for arg in sys.argv[1:] if not re.match(r'^[A-Z_]+=', arg)]
+
+    parser = argparse.ArgumentParser(description="Collect a redacted PrivateBox support bundle")
+    parser.add_argument("--output", default="/tmp", help="Directory for the archive (default: %(default)s)")
+    parser.add_argument("--since", default="24h", help="Journal window, e.g. 2h or 7d (default: %(default)s)")
+    parser.add_argument("--cap", type=int, default=50, help="Per-source size cap in MB (default: %(default)s)")
+    parser.add_argument("--timeout", type=int, default=120, help="Per-source timeout in seconds")
+    parser.add_argument("--jobs", type=int, default=8, help="Sources collected at once (default: %(default)s)")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="Bootstrap configuration with the secrets to redact")
+    parser.add_argument("--proxmox", default="local", help="Proxmox SSH target or 'local' (default: %(default)s)")
+    parser.add_argument("--management", default="debian@10.10.20.10", help="Management VM SSH target")
+    parser.add_argument("--opnsense", default="root@10.10.20.1", help="OPNsense SSH target")
+    parser.add_argument("--ssh-key", default=DEFAULT_SSH_KEY, help="Key for Proxmox and the management VM")
+    parser.add_argument("--opnsense-key", default=DEFAULT_OPNSENSE_KEY, help="Key for OPNsense")
+    parser.add_argument("--url", default=variables.get("SEMAPHORE_URL", DEFAULT_URL), help="Semaphore URL")
+    parser.add_argument("--token", default=variables.get("SEMAPHORE_API_TOKEN") or os.environ.get("SEMAPHORE_API_TOKEN"),
+                        help="Semaphore API token (default: log in with SERVICES_PASSWORD from --config)")
+    parser.add_argument("--project", type=int, default=1)
+    parser.add_argument("--tasks", type=int, default=25, help="Newest Semaphore tasks to include (0 to skip)")
+    args = parser.parse_args(argv)
+
+    print("=== Collecting PrivateBox Support Bundle ===")
+    api.configure(variables)
+    start = time.monotonic()
+    path, manifest = build_bundle(args, variables)
+
+    failed = [s for s in manifest["sources"] if s["status"] == "failed"]
+    size = os.path.getsize(path)
+    print(f"\n✓ Bundle written to {path} ({size / (1024 * 1024):.1f} MB) in {time.monotonic() - start:.1f} s")
+    print(f"  Report ID: {manifest['bundle_id']}")
+    print(f"  {len(manifest['sources']) - len(failed)}/{len(manifest['sources'])} sources collected, "
+          f"{sum(s.get('redactions', 0) for s in manifest['sources'])} secret(s) redacted")
+    if failed:
+        print(f"⚠ {len(failed)} source(s) failed; see manifest.json in the bundle")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
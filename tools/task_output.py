@@ -0,0 +1,85 @@
+"""
+Output verbosity shared by the tools/ scripts.
+
+Semaphore stores every printed line in its database and bootstrap's
+progress follower re-reads them, so long-running tools can be told to
+print less. Select the mode per run with an OUTPUT_MODE=... argument
+(how Semaphore passes variables) or the PRIVATEBOX_OUTPUT_MODE
+environment variable:
+
+    quiet   one line per step, errors and the final summary
+    normal  the detailed output (default)
+    debug   normal plus raw arguments and API details
+
+Values of arguments whose names look like secrets are always redacted.
+"""
+import os
+import re
+
+MODES = ("quiet", "normal", "debug")
+SECRET_NAME_RE = re.compile(r"TOKEN|SECRET|PASSWORD|PASSWD|PASS\b|KEY|CREDENTIAL", re.IGNORECASE)
+
+
+def is_secret(name):
+    return bool(SECRET_NAME_RE.search(name))
+
+
+def redact(name, value):
+    """Hide the value of secret-looking variables."""
+    if value and is_secret(name):
+        return "***"
+    return value
+
+
+def redact_arg(arg):
+    """Redact a KEY=VALUE command line argument."""
+    if "=" not in arg:
+        return arg
+    key, value = arg.split("=", 1)
+    return f"{key}={redact(key, value)}"
+
+
+class Output:
+    """print() wrappers that honour the selected mode."""
+
+    def __init__(self):
+        self.mode = "normal"
+
+    def configure(self, variables=None):
+        mode = ((variables or {}).get("OUTPUT_MODE")
+                or os.environ.get("PRIVATEBOX_OUTPUT_MODE") or "normal").lower()
+        if mode not in MODES:
+            print(f"⚠ Unknown OUTPUT_MODE '{mode}', using normal (choices: {', '.join(MODES)})")
+            mode = "normal"
+        self.mode = mode
+        return self
+
+    @property
+    def quiet(self):
+        return self.mode == "quiet"
+
+    @property
+    def debugging(self):
+        return self.mode == "debug"
+
+    def step(self, text):
+        """Always printed; leading blank lines are dropped in quiet mode."""
+        print(text.lstrip("\n") if self.mode == "quiet" else text)
+
+    def info(self, *args, **kwargs):
+        """Detail printed in normal and debug mode."""
+        if self.mode != "quiet":
+            print(*args, **kwargs)
+
+    def debug(self, *args, **kwargs):
+        """Detail printed in debug mode only."""
+        if self.mode == "debug":
+            print(*args, **kwargs)
+
+    def progress(self, text="."):
+        """Poll progress indicator; suppressed in quiet mode."""
+        if self.mode != "quiet":
+            print(text, end="", flush=True)
+
+
+output = Output()
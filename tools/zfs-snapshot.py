@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+PrivateBox ZFS snapshot manager.
+Runs on the Proxmox host and implements the snapshot part of the update
+system (docs/architecture/update-system/overview.md): consistent snapshots
+of the OPNsense VM, the management VM and the host root, the naming and
+retention policy, and timed VM rollbacks.
+
+Snapshot names follow the documented convention:
+    <dataset>@<type>-<YYYYMMDD-HHMM>[-<description>]
+    rpool/data/vm-100-disk-0@pre-update-20251023-1430-opnsense
+    rpool/data/vm-9000-disk-0@daily-20251023-0300
+
+All datasets of one pool are snapshotted by a single `zfs snapshot -r`
+call, which ZFS commits atomically: every VM disk and the host root show
+the same moment in time. Expired snapshots are destroyed with one
+`zfs destroy ds@a,b,c` call per dataset instead of one call per snapshot.
+
+Commands:
+    create TYPE [DESCRIPTION]      Snapshot all datasets (pre-update, daily, weekly,
+                                   manual, pre-host-update)
+    list                           Snapshot sets with type, age and space used
+    prune [--dry-run]              Destroy snapshots past their retention
+    rollback VM SNAPSHOT|latest    Stop VM, roll back its disks, start it and wait
+                                   until it answers; reports the downtime per phase.
+                                   A VM whose disks were only partly rolled back
+                                   is left stopped.
+
+Examples:
+    ./zfs-snapshot.py create pre-update opnsense-24.7.6
+    ./zfs-snapshot.py create daily && ./zfs-snapshot.py prune
+    ./zfs-snapshot.py rollback opnsense latest --type pre-update
+    ./zfs-snapshot.py --data tank/data --host tank/ROOT list    # file-backed test pool
+
+`zfs` and `qm` are taken from PATH, so a test pool or stand-in scripts
+can replace them.
+"""
+import argparse
+import datetime
+import json
+import re
+import socket
+import subprocess
+import sys
+import time
+
+DEFAULT_DATA = "rpool/data"
+DEFAULT_HOST = "rpool/ROOT"
+# name → (VMID, address and TCP port that answer once the VM is up)
+VMS = {
+    "opnsense": (100, "10.10.20.1", 443),
+    "management": (9000, "10.10.20.10", 53),
+}
+# Days to keep each type; None keeps the snapshot until deleted by hand
+RETENTION_DAYS = {
+    "pre-update": 14,
+    "daily": 7,
+    "weekly": 28,
+    "manual": None,
+    "pre-host-update": 30,
+}
+NAME_RE = re.compile(r"^(?P<type>pre-host-update|pre-update|daily|weekly|manual)-"
+                     r"(?P<date>\d{8})(?:-(?P<time>\d{4}))?(?:-(?P<description>.+))?$")
+DESCRIPTION_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+# Snapshot names per `zfs destroy` call, well below the argument length limit
+DESTROY_BATCH = 100
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def run(command, check=True):
+    """Run a command, return its stdout; raise SnapshotError on failure."""
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+    except OSError as e:
+        raise SnapshotError(f"{command[0]}: {e}")
+    if check and result.returncode != 0:
+        raise SnapshotError(f"{' '.join(command)}: {result.stderr.strip() or f'exit code {result.returncode}'}")
+    return result.stdout
+
+
+def elapsed_ms(start):
+    return round((time.monotonic() - start) * 1000)
+
+
+# ============================================
+# Naming and retention
+# ============================================
+
+def snapshot_name(kind, when, description=None):
+    if kind not in RETENTION_DAYS:
+        raise SnapshotError(f"Unknown snapshot type '{kind}' (use {', '.join(RETENTION_DAYS)})")
+    name = f"{kind}-{when:%Y%m%d-%H%M}"
+    if description:
+        if not DESCRIPTION_RE.match(description):
+            raise SnapshotError(f"Invalid description '{description}' (letters, digits, . _ - only)")
+        name += f"-{description}"
+    return name
+
+
+def parse_name(name):
+    """Return (type, timestamp from the name) or None for snapshots not made by this policy."""
+    match = NAME_RE.match(name)
+    if not match:
+        return None
+    try:
+        when = datetime.datetime.strptime(match["date"] + (match["time"] or "0000"), "%Y%m%d%H%M")
+    except ValueError:
+        return None
+    return match["type"], when
+
+
+def is_expired(snapshot_set, retention, now):
+    days = retention.get(snapshot_set["type"])
+    return days is not None and now - snapshot_set["created"] > days * 86400
+
+
+# ============================================
+# ZFS
+# ============================================
+
+class Pool:
+    """The datasets under management and the zfs calls on them."""
+
+    def __init__(self, data_root, host_root, vms):
+        self.data_root = data_root
+        self.host_root = host_root
+        self.vms = vms
+
+    def zfs(self, *args, check=True):
+        return run(["zfs", *args], check=check)
+
+    def vm_disks(self):
+        """VMID → its disk datasets, e.g. rpool/data/vm-100-disk-0."""
+        disk_re = re.compile(rf"^{re.escape(self.data_root)}/vm-(\d+)-disk-\d+$")
+        disks = {vmid: [] for vmid, _, _ in self.vms.values()}
+        for name in self.zfs("list", "-H", "-o", "name", "-r", self.data_root).split():
+            match = disk_re.match(name)
+            if match and int(match[1]) in disks:
+                disks[int(match[1])].append(name)
+        return disks
+
+    def datasets(self, include_host=True):
+        """All managed datasets, VM disks first; missing ones are reported, not fatal."""
+        datasets, missing = [], []
+        for vmid, disks in self.vm_disks().items():
+            datasets += sorted(disks)
+            if not disks:
+                missing.append(f"VM {vmid}")
+        if include_host:
+            if self.zfs("list", "-H", "-o", "name", self.host_root, check=False).strip():
+                datasets.append(self.host_root)
+            else:
+                missing.append(self.host_root)
+        return datasets, missing
+
+    def create(self, datasets, name):
+        """Snapshot the datasets (recursively) with one zfs call per pool; returns the pools used."""
+        by_pool = {}
+        for dataset in datasets:
+            by_pool.setdefault(dataset.split("/")[0], []).append(f"{dataset}@{name}")
+        # A single call is atomic; ZFS cannot snapshot several pools in one transaction
+        for snapshots in by_pool.values():
+            self.zfs("snapshot", "-r", *snapshots)
+        return list(by_pool)
+
+    def snapshot_sets(self, datasets):
+        """Snapshots of the datasets grouped by name, oldest first."""
+        if not datasets:
+            return []
+        output = self.zfs("list", "-H", "-p", "-t", "snapshot", "-d", "1",
+                          "-o", "name,creation,used", *datasets)
+        sets = {}
+        for line in output.splitlines():
+            full_name, creation, used = line.split("\t")
+            dataset, _, name = full_name.partition("@")
+            entry = sets.setdefault(name, {"name": name, "datasets": [], "created": int(creation), "used": 0})
+            entry["datasets"].append(dataset)
+            entry["created"] = min(entry["created"], int(creation))
+            entry["used"] += int(used) if used.isdigit() else 0
+        for entry in sets.values():
+            parsed = parse_name(entry["name"])
+            entry["type"] = parsed[0] if parsed else None
+        return sorted(sets.values(), key=lambda s: (s["created"], s["name"]))
+
+    def destroy(self, snapshot_sets, recursive):
+        """Destroy the sets with one call per dataset and batch; returns the number of calls."""
+        by_dataset = {}
+        for entry in snapshot_sets:
+            for dataset in entry["datasets"]:
+                by_dataset.setdefault(dataset, []).append(entry["name"])
+        calls = 0
+        for dataset, names in by_dataset.items():
+            # The host root is snapshotted with -r, so its descendants go with it
+            flags = ["-r"] if dataset in recursive else []
+            for i in range(0, len(names), DESTROY_BATCH):
+                self.zfs("destroy", *flags, f"{dataset}@{','.join(names[i:i + DESTROY_BATCH])}")
+                calls += 1
+        return calls
+
+
+# ============================================
+# Rollback
+# ============================================
+
+def qm(*args, check=True):
+    return run(["qm", *args], check=check)
+
+
+def vm_running(vmid):
+    return "running" in qm("status", str(vmid))
+
+
+def wait_for_port(address, port, timeout):
+    """Return True once a TCP connection to address:port succeeds within timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((address, port), timeout=min(2, max(0.1, deadline - time.monotonic()))):
+                return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+def resolve_vm(pool, value):
+    """Accept a VM name from VMS or a VMID; returns (vmid, address, port)."""
+    if value in pool.vms:
+        return pool.vms[value]
+    for vmid, address, port in pool.vms.values():
+        if value == str(vmid):
+            return vmid, address, port
+    raise SnapshotError(f"Unknown VM '{value}' (use {', '.join(pool.vms)} or their VMID)")
+
+
+def run_rollback(pool, vm, snapshot, kind=None, graceful=False, destroy_newer=False, wait=300):
+    """Roll one VM back to a snapshot; returns the report with per-phase timings in ms."""
+    vmid, address, port = resolve_vm(pool, vm)
+    disks = sorted(pool.vm_disks()[vmid])
+    if not disks:
+        raise SnapshotError(f"No disks found for VM {vmid} under {pool.data_root}")
+
+    sets = pool.snapshot_sets(disks)
+    complete = [s for s in sets if len(s["datasets"]) == len(disks)]
+    if snapshot == "latest":
+        candidates = [s for s in complete if kind is None or s["type"] == kind]
+        if not candidates:
+            raise SnapshotError(f"No {kind + ' ' if kind else ''}snapshot covers all disks of VM {vmid}")
+        snapshot = candidates[-1]["name"]
+    elif snapshot not in {s["name"] for s in complete}:
+        raise SnapshotError(f"Snapshot '{snapshot}' does not exist on all disks of VM {vmid}")
+    # zfs only rolls back to a disk's newest snapshot; check every disk before the VM goes down
+    newer = []
+    for disk in disks:
+        names = [s["name"] for s in sets if disk in s["datasets"]]
+        newer += [name for name in names[names.index(snapshot) + 1:] if name not in newer]
+    if newer and not destroy_newer:
+        raise SnapshotError(f"{len(newer)} newer snapshot(s) exist on VM {vmid} ({newer[-1]} is the latest); "
+                            f"use --destroy-newer to discard them")
+
+    report = {"vm": vm, "vmid": vmid, "snapshot": snapshot, "disks": disks, "destroyed": newer, "ok": False,
+              "error": None, "rolled_back": [], "started": False, "phases_ms": {}}
+    phases = report["phases_ms"]
+    downtime_start = time.monotonic()
+
+    start = time.monotonic()
+    if vm_running(vmid):
+        if graceful:
+            # Falls back to a hard stop when the guest does not shut down in time
+            qm("shutdown", str(vmid), "--timeout", "60", "--forceStop", "1")
+        else:
+            qm("stop", str(vmid))
+    phases["stop"] = elapsed_ms(start)
+
+    start = time.monotonic()
+    try:
+        for disk in disks:
+            pool.zfs("rollback", *(["-r"] if destroy_newer else []), f"{disk}@{snapshot}")
+            report["rolled_back"].append(disk)
+    except SnapshotError as e:
+        report["error"] = str(e)
+    phases["rollback"] = elapsed_ms(start)
+
+    if report["error"] and report["rolled_back"]:
+        # Some disks are at the snapshot and the others are not; booting that mix would corrupt the guest
+        report["error"] += (f"; {len(report['rolled_back'])} of {len(disks)} disk(s) were rolled back, "
+                            f"so VM {vmid} was left stopped")
+        report["downtime_ms"] = elapsed_ms(downtime_start)
+        return report
+
+    # When the first disk fails nothing was changed, so the VM comes back as it was
+    start = time.monotonic()
+    qm("start", str(vmid))
+    report["started"] = True
+    phases["start"] = elapsed_ms(start)
+
+    if wait:
+        start = time.monotonic()
+        ready = wait_for_port(address, port, wait)
+        phases["ready"] = elapsed_ms(start)
+        if not ready and not report["error"]:
+            report["error"] = f"VM {vmid} started but {address}:{port} did not answer within {wait}s"
+    report["downtime_ms"] = elapsed_ms(downtime_start)
+    report["ok"] = report["error"] is None
+    return report
+
+
+# ============================================
+# Main
+# ============================================
+
+def human(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def age(seconds):
+    if seconds < 3600:
+        return f"{seconds // 60}m"
+    if seconds < 86400:
+        return f"{seconds // 3600}h"
+    return f"{seconds // 86400}d"
+
+
+def parse_retention(overrides):
+    retention = dict(RETENTION_DAYS)
+    for spec in overrides or []:
+        kind, _, days = spec.partition("=")
+        if kind not in retention or not (days.isdigit() or days == "forever"):
+            raise SnapshotError(f"--keep entries must be TYPE=DAYS or TYPE=forever: {spec}")
+        retention[kind] = None if days == "forever" else int(days)
+    return retention
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PrivateBox ZFS snapshot manager")
+    parser.add_argument("--data", default=DEFAULT_DATA, help=f"Dataset holding the VM disks (default {DEFAULT_DATA})")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"Host root dataset (default {DEFAULT_HOST})")
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("--json", action="store_true", help="Print the result as JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create = commands.add_parser("create", parents=[output], help="Snapshot all managed datasets")
+    create.add_argument("type", choices=list(RETENTION_DAYS))
+    create.add_argument("description", nargs="?")
+    create.add_argument("--no-host", action="store_true", help="Only snapshot the VM disks")
+
+    commands.add_parser("list", parents=[output], help="List snapshot sets")
+
+    prune = commands.add_parser("prune", parents=[output], help="Destroy expired snapshots")
+    prune.add_argument("--keep", action="append", metavar="TYPE=DAYS",
+                       help="Override a retention period, e.g. daily=14 or manual=forever")
+    prune.add_argument("--dry-run", action="store_true", help="Only show what would be destroyed")
+
+    rollback = commands.add_parser("rollback", parents=[output], help="Roll a VM back to a snapshot")
+    rollback.add_argument("vm", help=f"{' or '.join(VMS)} or a VMID")
+    rollback.add_argument("snapshot", help="Snapshot name (without dataset) or 'latest'")
+    rollback.add_argument("--type", choices=list(RETENTION_DAYS), help="Restrict 'latest' to one type")
+    rollback.add_argument("--graceful", action="store_true", help="Shut the guest down instead of stopping it")
+    rollback.add_argument("--destroy-newer", action="store_true",
+                          help="Destroy snapshots newer than the target (zfs rollback -r)")
+    rollback.add_argument("--wait", type=int, default=300, help="Seconds to wait for the VM to answer (0 = no wait)")
+    args = parser.parse_args()
+
+    pool = Pool(args.data, args.host, VMS)
+    try:
+        if args.command == "create":
+            name = snapshot_name(args.type, datetime.datetime.now(), args.description)
+            datasets, missing = pool.datasets(include_host=not args.no_host)
+            if not datasets:
+                raise SnapshotError(f"No datasets found under {args.data} or {args.host}")
+            start = time.monotonic()
+            pools = pool.create(datasets, name)
+            result = {"name": name, "datasets": datasets, "missing": missing, "pools": pools,
+                      "elapsed_ms": elapsed_ms(start)}
+            if args.json:
+                print(json.dumps(result, indent=2))
+                return
+            print(f"✓ Snapshot {name} of {len(datasets)} dataset(s) in {result['elapsed_ms']} ms")
+            for dataset in datasets:
+                print(f"  → {dataset}@{name}")
+            if len(pools) > 1:
+                print(f"⚠ Datasets span {len(pools)} pools; each pool was snapshotted atomically on its own")
+            for item in missing:
+                print(f"⚠ {item} not found, not included")
+            return
+
+        now = int(time.time())
+
+        if args.command == "list":
+            sets = pool.snapshot_sets(pool.datasets()[0])
+            if args.json:
+                print(json.dumps(sets, indent=2))
+                return
+            if not sets:
+                print("No snapshots")
+                return
+            print(f"{'NAME':<48}{'TYPE':<17}{'AGE':>6}{'USED':>11}  DATASETS")
+            for entry in sets:
+                print(f"{entry['name']:<48}{entry['type'] or '-':<17}{age(now - entry['created']):>6}"
+                      f"{human(entry['used']):>11}  {len(entry['datasets'])}")
+            return
+
+        if args.command == "prune":
+            retention = parse_retention(args.keep)
+            sets = pool.snapshot_sets(pool.datasets()[0])
+            expired = [s for s in sets if s["type"] and is_expired(s, retention, now)]
+            start = time.monotonic()
+            calls = 0 if args.dry_run else pool.destroy(expired, recursive={args.host})
+            result = {"expired": [s["name"] for s in expired], "kept": len(sets) - len(expired),
+                      "freed_bytes": sum(s["used"] for s in expired), "destroy_calls": calls,
+                      "dry_run": args.dry_run, "elapsed_ms": elapsed_ms(start)}
+            if args.json:
+                print(json.dumps(result, indent=2))
+                return
+            for entry in expired:
+                print(f"{'→ Would destroy' if args.dry_run else '✓ Destroyed'} {entry['name']} "
+                      f"({len(entry['datasets'])} dataset(s), {age(now - entry['created'])} old)")
+            verb = "would be destroyed" if args.dry_run else f"destroyed with {calls} zfs call(s)"
+            print(f"{len(expired)} snapshot set(s) {verb}, about {human(result['freed_bytes'])}; "
+                  f"{result['kept']} kept in {result['elapsed_ms']} ms")
+            return
+
+        if args.command == "rollback":
+            report = run_rollback(pool, args.vm, args.snapshot, args.type, args.graceful,
+                                  args.destroy_newer, args.wait)
+            if args.json:
+                print(json.dumps(report, indent=2))
+            else:
+                phases = ", ".join(f"{phase} {ms / 1000:.1f} s" for phase, ms in report["phases_ms"].items())
+                symbol = "✓" if report["ok"] else "✗"
+                print(f"{symbol} VM {report['vmid']} rolled back to {report['snapshot']}" if report["ok"]
+                      else f"{symbol} Rollback of VM {report['vmid']} to {report['snapshot']} failed: {report['error']}")
+                print(f"  Downtime {report['downtime_ms'] / 1000:.1f} s ({phases})")
+            sys.exit(0 if report["ok"] else 1)
+    except SnapshotError as e:
+        print(f"✗ {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()